@@ -0,0 +1,180 @@
+import os
+import json
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from bitacora import obtener_logger
+
+log = obtener_logger("almacen_velas")
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+VELAS_DIR = os.environ.get("VELAS_DIR", os.path.join(SCRIPT_DIR, "velas"))
+
+CAPACIDAD_POR_ACTIVO = 2000
+CAMPOS_VELA = ("from", "to", "open", "close", "min", "max", "volume")
+
+
+def _leer_ultimas_lineas(ruta: str, n: int, bloque: int = 1 << 16) -> List[str]:
+    """Lee las últimas `n` líneas de un archivo sin cargarlo completo."""
+    with open(ruta, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        posicion = f.tell()
+        datos = b''
+        while posicion > 0 and datos.count(b'\n') <= n:
+            leer = min(bloque, posicion)
+            posicion -= leer
+            f.seek(posicion)
+            datos = f.read(leer) + datos
+    lineas = datos.decode('utf-8', errors='ignore').splitlines()
+    return [l for l in lineas[-n:] if l.strip()]
+
+
+class _SerieVelas:
+    """Buffer circular de velas cerradas de un activo, respaldado en un archivo JSONL."""
+
+    def __init__(self, ruta: str, capacidad: int):
+        self.lock = threading.Lock()
+        self.ruta = ruta
+        self.capacidad = capacidad
+        self.velas: deque = deque(maxlen=capacidad)
+        self.en_curso: Optional[Dict[str, Any]] = None
+        self.lineas_en_disco = 0
+        self._cargar()
+
+    def _cargar(self):
+        if not os.path.exists(self.ruta):
+            return
+        try:
+            for linea in _leer_ultimas_lineas(self.ruta, self.capacidad):
+                vela = json.loads(linea)
+                if not self.velas or vela['from'] > self.velas[-1]['from']:
+                    self.velas.append(vela)
+            with open(self.ruta, 'rb') as f:
+                self.lineas_en_disco = sum(1 for _ in f)
+        except Exception as e:
+            log.warning("No se pudo leer el almacén de velas %s: %s", self.ruta, e)
+            self.velas.clear()
+
+    @property
+    def ultimo_ts(self) -> Optional[int]:
+        return self.velas[-1]['from'] if self.velas else None
+
+    def agregar_cerradas(self, velas: List[Dict[str, Any]]):
+        """Agrega velas cerradas nuevas a memoria y al archivo (append-only)."""
+        nuevas = [v for v in velas if self.ultimo_ts is None or v['from'] > self.ultimo_ts]
+        if not nuevas:
+            return
+
+        self.velas.extend(nuevas)
+        try:
+            os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+            with open(self.ruta, 'a', encoding='utf-8') as f:
+                for vela in nuevas:
+                    f.write(json.dumps(vela, separators=(',', ':')) + '\n')
+            self.lineas_en_disco += len(nuevas)
+            if self.lineas_en_disco > 4 * self.capacidad:
+                self._compactar()
+        except Exception as e:
+            log.warning("No se pudo escribir el almacén de velas %s: %s", self.ruta, e)
+
+    def _compactar(self):
+        """Reescribe el archivo solo con las velas en memoria (temp + rename)."""
+        temporal = self.ruta + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            for vela in self.velas:
+                f.write(json.dumps(vela, separators=(',', ':')) + '\n')
+        os.replace(temporal, self.ruta)
+        self.lineas_en_disco = len(self.velas)
+
+
+class AlmacenVelas:
+    """
+    Cache local de velas por (activo, timeframe) con descarga incremental.
+
+    Solo se piden al broker las velas posteriores a la última vela cerrada
+    guardada (más la vela en curso); el resto se sirve desde memoria. Las
+    velas cerradas se persisten en `VELAS_DIR/<activo>_<timeframe>.jsonl`,
+    así un reinicio del servidor no obliga a descargar la ventana completa.
+    """
+
+    def __init__(self, directorio: str = VELAS_DIR, capacidad: int = CAPACIDAD_POR_ACTIVO):
+        self.directorio = directorio
+        self.capacidad = capacidad
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, int], _SerieVelas] = {}
+        self.velas_descargadas = 0
+        self.velas_servidas = 0
+
+    def _serie(self, activo: str, timeframe: int) -> _SerieVelas:
+        clave = (activo, int(timeframe))
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                ruta = os.path.join(self.directorio, f"{activo}_{int(timeframe)}.jsonl")
+                serie = _SerieVelas(ruta, max(self.capacidad, 1))
+                self._series[clave] = serie
+            return serie
+
+    def obtener(self, activo: str, timeframe: int, num_velas: int, ahora: float,
+                descargar: Callable[[int], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        Retorna las últimas `num_velas` velas (la última es la vela en curso).
+
+        `descargar(n)` debe pedir al broker las últimas `n` velas hasta ahora.
+        """
+        serie = self._serie(activo, timeframe)
+
+        with serie.lock:
+            ultimo = serie.ultimo_ts
+            inicio_actual = int(ahora // timeframe) * timeframe
+            if ultimo is None or len(serie.velas) < num_velas - 1:
+                faltantes = num_velas
+            else:
+                # Velas cerradas que faltan + la vela en curso + la última
+                # guardada como solapamiento para validar la continuidad
+                faltantes = max(int((inicio_actual - ultimo) // timeframe), 0) + 1
+                if faltantes > num_velas:
+                    faltantes = num_velas
+
+            descargadas = sorted(
+                ({k: v[k] for k in CAMPOS_VELA if k in v} for v in descargar(faltantes) or []),
+                key=lambda v: v['from']
+            )
+            if not descargadas:
+                return []
+
+            self.velas_descargadas += len(descargadas)
+
+            if ultimo is not None and descargadas[0]['from'] > ultimo + timeframe:
+                # Hueco respecto al almacén: reiniciar la serie en memoria
+                serie.velas.clear()
+
+            serie.agregar_cerradas(descargadas[:-1])
+            serie.en_curso = descargadas[-1]
+
+            cerradas = [v for v in serie.velas if v['from'] < serie.en_curso['from']]
+            resultado = cerradas[-(num_velas - 1):] if num_velas > 1 else []
+            resultado.append(serie.en_curso)
+            self.velas_servidas += len(resultado)
+            return resultado
+
+    def agregar_cerradas(self, activo: str, timeframe: int, velas: List[Dict[str, Any]]):
+        """Incorpora velas cerradas recibidas por otra vía (p. ej. streaming)."""
+        serie = self._serie(activo, timeframe)
+        velas = sorted(velas, key=lambda v: v['from'])
+        with serie.lock:
+            ultimo = serie.ultimo_ts
+            if velas and ultimo is not None and velas[0]['from'] > ultimo + timeframe:
+                serie.velas.clear()
+            serie.agregar_cerradas(velas)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'series': len(self._series),
+                'velas_descargadas': self.velas_descargadas,
+                'velas_servidas': self.velas_servidas
+            }
+
+
+almacen_velas = AlmacenVelas()
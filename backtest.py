@@ -0,0 +1,303 @@
+"""
+Backtest offline con la misma lógica de decisión que ejecutar_operacion.
+
+Uso:
+    python backtest.py velas.csv [--payout 0.8] [--balance 1000] [--salida reporte.json]
+
+Las velas (CSV o Parquet) necesitan open, high/max, low/min y close, y un
+timestamp en `from`, `timestamp`, `time` o `date`. Los features se calculan
+una sola vez para toda la serie con calcular_features, el modelo puntúa
+todas las velas en un solo `predict` y las señales salen de los mismos
+umbrales que en vivo (umbrales_vigentes). Cada operación binaria se abre al
+cierre de la vela de la señal y se liquida al cierre de la vela en que
+expira; el monto lo calcula GestorRiesgoInteligente con el balance simulado.
+"""
+import os
+import json
+import time
+import logging
+import argparse
+import contextlib
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from operar import (
+    FEATURES, REGIME_FEATURE, EXPIRATION_TIME, TIMEFRAME,
+    GestorRiesgoInteligente, calcular_features, calidad_senal, obtener_modelo, umbrales_vigentes
+)
+
+# Pago de una operación ganada sobre el monto (80%)
+PAYOUT = 0.8
+BALANCE_INICIAL = 1000.0
+# Monto mínimo que acepta el broker por operación
+MONTO_MINIMO = 1.0
+
+COLUMNAS_TIEMPO = ('from', 'timestamp', 'time', 'date')
+
+
+def cargar_velas(ruta: str) -> pd.DataFrame:
+    """Velas OHLC indexadas por epoch en segundos (mismas columnas que get_latest_market_data)."""
+    if ruta.lower().endswith(('.parquet', '.pq')):
+        df = pd.read_parquet(ruta)
+    else:
+        df = pd.read_csv(ruta)
+
+    df = df.rename(columns={'max': 'high', 'min': 'low'})
+    faltantes = [c for c in ('open', 'high', 'low', 'close') if c not in df.columns]
+    if faltantes:
+        raise ValueError(f"Faltan columnas en {ruta}: {faltantes}")
+
+    columna_ts = next((c for c in COLUMNAS_TIEMPO if c in df.columns), None)
+    if columna_ts is None:
+        raise ValueError(f"{ruta} no tiene columna de tiempo ({', '.join(COLUMNAS_TIEMPO)})")
+    ts = df[columna_ts]
+    if pd.api.types.is_numeric_dtype(ts):
+        # Epoch en milisegundos si es demasiado grande para segundos
+        ts = ts // 1000 if ts.max() > 1e11 else ts
+    else:
+        # Sin asumir la unidad interna (ns, us, s...) del datetime64
+        ts = (pd.to_datetime(ts, utc=True) - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)
+    df.index = ts.astype('int64').to_numpy()
+
+    if 'volume' not in df.columns:
+        df['volume'] = 0
+    df = df[['open', 'high', 'low', 'close', 'volume']].astype(np.float64)
+    return df[~df.index.duplicated(keep='last')].sort_index()
+
+
+class Serie:
+    """Una serie de velas ya puntuada: lo que se reutiliza entre simulaciones."""
+
+    __slots__ = ("ts", "close", "regimen", "proba", "movimiento")
+
+    def __init__(self, ts: np.ndarray, close: np.ndarray, regimen: np.ndarray, proba: np.ndarray,
+                 movimiento: np.ndarray):
+        self.ts = ts
+        self.close = close
+        self.regimen = regimen
+        self.proba = proba
+        # Signo del precio al expirar contra el de entrada (0 = empate, sin dato al final)
+        self.movimiento = movimiento
+
+    def __len__(self):
+        return len(self.ts)
+
+    def __getitem__(self, rebanada: slice) -> 'Serie':
+        """Tramo contiguo de la serie (p. ej. la parte de entrenamiento y la de validación)."""
+        return Serie(self.ts[rebanada], self.close[rebanada], self.regimen[rebanada], self.proba[rebanada],
+                     self.movimiento[rebanada])
+
+
+def velas_expiracion(timeframe: int = TIMEFRAME, expiracion_min: int = EXPIRATION_TIME) -> int:
+    """
+    Velas que dura una operación.
+
+    La liquidación se simula con el cierre de una vela, así que la
+    expiración tiene que ser un múltiplo positivo del timeframe (con
+    TIMEFRAME=300 una opción de 1 minuto necesita velas de 1 minuto).
+    """
+    segundos = expiracion_min * 60
+    if timeframe <= 0 or segundos <= 0 or segundos % timeframe:
+        raise ValueError(f"Expiración de {expiracion_min} min no es un múltiplo de velas de {timeframe}s: "
+                         f"usa velas más cortas o --expiracion múltiplo de {timeframe // 60 or timeframe / 60} min")
+    return int(segundos // timeframe)
+
+
+def inferir_timeframe(df: pd.DataFrame) -> int:
+    """Segundos por vela según la separación más común entre timestamps."""
+    if len(df) < 2:
+        return TIMEFRAME
+    return int(np.median(np.diff(df.index.to_numpy()[:10000])))
+
+
+def preparar(df: pd.DataFrame, modelo=None, timeframe: Optional[int] = None,
+             expiracion_min: int = EXPIRATION_TIME) -> Serie:
+    """Features de toda la serie y probabilidades en un solo predict."""
+    modelo = modelo if modelo is not None else obtener_modelo()
+    timeframe = timeframe or inferir_timeframe(df)
+    with _silencio():
+        df_feat = calcular_features(df)
+
+    close = df_feat['close'].to_numpy(dtype=np.float64)
+    proba = np.asarray(modelo.predict(df_feat[FEATURES].to_numpy(dtype=np.float64)), dtype=np.float64)
+
+    # El cierre al expirar se busca en la serie completa (los features descartan las primeras velas)
+    k = velas_expiracion(timeframe, expiracion_min)
+    cierres = df['close'].to_numpy(dtype=np.float64)
+    posiciones = df.index.get_indexer(df_feat.index)
+    salida = posiciones + k
+    movimiento = np.full(len(close), np.nan)
+    validas = salida < len(cierres)
+    movimiento[validas] = np.sign(cierres[salida[validas]] - close[validas])
+
+    return Serie(df_feat.index.to_numpy(dtype=np.int64), close,
+                 df_feat[REGIME_FEATURE].to_numpy(dtype=np.float64), proba, movimiento)
+
+
+def senales(serie: Serie, lower: float = None, upper: float = None, cutoff: float = None) -> np.ndarray:
+    """+1 CALL, -1 PUT, 0 sin operación (vectorizado; predecir_decision vela por vela)."""
+    vigentes = umbrales_vigentes()
+    lower = vigentes['lower_threshold'] if lower is None else lower
+    upper = vigentes['upper_threshold'] if upper is None else upper
+    cutoff = vigentes['regime_cutoff'] if cutoff is None else cutoff
+
+    tipo = np.where(serie.proba <= lower, -1, np.where(serie.proba >= upper, 1, 0)).astype(np.int8)
+    tipo[serie.regimen < cutoff] = 0
+    tipo[np.isnan(serie.movimiento)] = 0
+    return tipo
+
+
+def simular(serie: Serie, tipo: np.ndarray, payout: float = PAYOUT, balance_inicial: float = BALANCE_INICIAL,
+            config_riesgo: Optional[Dict[str, Any]] = None, monto_fijo: Optional[float] = None,
+            velas_operacion: int = 1) -> Dict[str, Any]:
+    """
+    Recorre las señales en orden con el gestor de riesgo y el balance simulado.
+
+    Solo hay una operación abierta a la vez (como el bot, que espera la
+    liquidación). El stop loss diario del gestor se reinicia cada día UTC.
+    """
+    gestor = GestorRiesgoInteligente(config_riesgo)
+    balance = balance_inicial
+    dia_actual = None
+    libre_desde = 0
+
+    indices = np.flatnonzero(tipo)
+    filas = []
+    with _silencio():
+        for i in indices:
+            if i < libre_desde:
+                continue
+            dia = int(serie.ts[i]) // 86400
+            if dia != dia_actual:
+                dia_actual = dia
+                gestor.profit_diario = 0
+                gestor.operaciones_hoy = 0
+
+            if balance < MONTO_MINIMO:
+                break
+            monto = monto_fijo if monto_fijo is not None else \
+                gestor.calcular_monto_operacion(balance, calidad_senal(serie.proba[i]))
+            if monto == 0:
+                # Stop loss diario: sin más operaciones hasta mañana
+                continue
+            monto = min(monto, balance)
+
+            acierto = serie.movimiento[i] * tipo[i]
+            ganancia = monto * payout if acierto > 0 else (0.0 if acierto == 0 else -monto)
+            balance += ganancia
+            gestor.actualizar_resultado(ganancia)
+            filas.append((int(serie.ts[i]), int(tipo[i]), float(serie.proba[i]), monto, ganancia, balance))
+            libre_desde = i + velas_operacion
+
+    operaciones = pd.DataFrame(filas, columns=['ts', 'tipo', 'probabilidad', 'monto', 'ganancia', 'balance'])
+    return reporte(operaciones, balance_inicial, len(serie), int(np.count_nonzero(tipo)))
+
+
+def reporte(operaciones: pd.DataFrame, balance_inicial: float, velas: int, senales_totales: int) -> Dict[str, Any]:
+    """P&L, win rate y drawdown de una simulación."""
+    ganancias = operaciones['ganancia'].to_numpy()
+    curva = balance_inicial + np.cumsum(ganancias)
+    picos = np.maximum.accumulate(np.r_[balance_inicial, curva])[1:]
+    caidas = picos - curva
+    ganadas = int((ganancias > 0).sum())
+    perdidas = int((ganancias < 0).sum())
+
+    def por_tipo(valor):
+        sub = ganancias[operaciones['tipo'].to_numpy() == valor]
+        return {'operaciones': int(len(sub)), 'ganancia': float(sub.sum()),
+                'win_rate': float((sub > 0).mean()) if len(sub) else None}
+
+    return {
+        'velas': velas,
+        'senales': senales_totales,
+        'operaciones': int(len(ganancias)),
+        'ganadas': ganadas,
+        'perdidas': perdidas,
+        'empates': int(len(ganancias) - ganadas - perdidas),
+        'win_rate': ganadas / (ganadas + perdidas) if ganadas + perdidas else None,
+        'pnl': float(ganancias.sum()),
+        'balance_inicial': balance_inicial,
+        'balance_final': float(curva[-1]) if len(curva) else balance_inicial,
+        'max_drawdown': float(caidas.max()) if len(caidas) else 0.0,
+        'max_drawdown_pct': float((caidas / picos).max() * 100) if len(caidas) else 0.0,
+        'call': por_tipo(1),
+        'put': por_tipo(-1),
+        'detalle': operaciones
+    }
+
+
+@contextlib.contextmanager
+def _silencio():
+    """Calla los logs de diagnóstico de operar (salvo errores) durante el cálculo masivo."""
+    logging.disable(logging.WARNING)
+    try:
+        with open(os.devnull, 'w') as nulo, contextlib.redirect_stderr(nulo):
+            yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("velas", help="Archivo CSV o Parquet con las velas")
+    parser.add_argument("--timeframe", type=int, default=None, help="Segundos por vela (por defecto, según los datos)")
+    parser.add_argument("--expiracion", type=int, default=EXPIRATION_TIME, help="Minutos de cada operación")
+    parser.add_argument("--payout", type=float, default=PAYOUT)
+    parser.add_argument("--balance", type=float, default=BALANCE_INICIAL)
+    parser.add_argument("--monto", type=float, default=None, help="Monto fijo (sin gestor de riesgo)")
+    parser.add_argument("--riesgo", type=float, default=2.0, help="riesgo_porcentaje del gestor")
+    parser.add_argument("--monto-maximo", type=float, default=10)
+    parser.add_argument("--stop-loss", type=float, default=15, help="stop_loss_diario (% del balance)")
+    parser.add_argument("--salida", help="Guardar el reporte en JSON")
+    parser.add_argument("--operaciones", help="Guardar cada operación simulada en CSV")
+    args = parser.parse_args()
+
+    tiempos = {}
+    inicio = time.perf_counter()
+    df = cargar_velas(args.velas)
+    tiempos['carga'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    timeframe = args.timeframe or inferir_timeframe(df)
+    try:
+        velas_expiracion(timeframe, args.expiracion)
+    except ValueError as e:
+        parser.error(str(e))
+    serie = preparar(df, timeframe=timeframe, expiracion_min=args.expiracion)
+    tiempos['features_y_prediccion'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    config_riesgo = {
+        'riesgo_porcentaje': args.riesgo,
+        'max_perdidas_consecutivas': 3,
+        'stop_loss_diario': args.stop_loss,
+        'monto_maximo': args.monto_maximo
+    }
+    resultado = simular(serie, senales(serie), payout=args.payout, balance_inicial=args.balance,
+                        config_riesgo=config_riesgo, monto_fijo=args.monto,
+                        velas_operacion=velas_expiracion(timeframe, args.expiracion))
+    tiempos['simulacion'] = time.perf_counter() - inicio
+
+    detalle = resultado.pop('detalle')
+    resultado['umbrales'] = umbrales_vigentes()
+    resultado['tiempos'] = tiempos
+
+    win_rate = f"{resultado['win_rate'] * 100:.1f}%" if resultado['win_rate'] is not None else "N/A"
+    print(f"📊 {resultado['velas']} velas, {resultado['senales']} señales, {resultado['operaciones']} operaciones")
+    print(f"🎯 Win rate: {win_rate} ({resultado['ganadas']}W / {resultado['perdidas']}L / {resultado['empates']} empates)")
+    print(f"💰 P&L: ${resultado['pnl']:.2f} (balance final ${resultado['balance_final']:.2f})")
+    print(f"📉 Max drawdown: ${resultado['max_drawdown']:.2f} ({resultado['max_drawdown_pct']:.1f}%)")
+    print(f"⏱️  Carga {tiempos['carga']:.2f}s | features+predict {tiempos['features_y_prediccion']:.2f}s | "
+          f"simulación {tiempos['simulacion']:.2f}s")
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, indent=2)
+    if args.operaciones:
+        detalle.to_csv(args.operaciones, index=False)
+
+
+if __name__ == "__main__":
+    main()
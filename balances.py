@@ -0,0 +1,155 @@
+import os
+import time
+import threading
+import weakref
+from typing import Any, Optional, Tuple
+from conexion import balance_activo, cambiar_balance, lock_operaciones
+from seguimiento_operaciones import seguimiento_operaciones
+from bitacora import obtener_logger
+
+log = obtener_logger("balances")
+
+# Segundos que un balance cacheado se considera vigente si no hubo operaciones
+TTL_BALANCES = int(os.environ.get("TTL_BALANCES", 60))
+
+
+def obtener_balances_reales(iq):
+    """Obtiene balances REALES de las cuentas demo y real"""
+    real_balance = 0.0
+    demo_balance = 0.0
+    real_id = None
+    demo_id = None
+    
+    try:
+        log.debug("Obteniendo balances reales")
+        
+        # Método 1: Intentar con get_balances()
+        try:
+            balances_data = iq.get_balances()
+            
+            if balances_data and isinstance(balances_data, dict):
+                balances_list = balances_data.get('msg', [])
+                
+                for bal in balances_list:
+                    if isinstance(bal, dict):
+                        bal_type = bal.get('type')
+                        amount = bal.get('amount', 0)
+                        bal_id = bal.get('id')
+                        
+                        # Tipo 1 = REAL, Tipo 4 = PRACTICE
+                        if bal_type == 1:
+                            real_balance = float(amount)
+                            real_id = bal_id
+                            log.debug("Balance REAL: $%s", real_balance)
+                        elif bal_type == 4:
+                            demo_balance = float(amount)
+                            demo_id = bal_id
+                            log.debug("Balance DEMO: $%s", demo_balance)
+            
+        except Exception as e:
+            log.warning("Error con get_balances(): %s", e)
+
+        # Método 2: Método alternativo si no se encontraron balances
+        if real_balance == 0 and demo_balance == 0:
+            log.debug("Usando método alternativo para balances")
+            try:
+                # Los cambios de balance no deben cruzarse con una compra en curso
+                with lock_operaciones(iq):
+                    anterior = balance_activo(iq)
+
+                    # Cambiar a REAL y obtener balance
+                    if cambiar_balance(iq, 'REAL'):
+                        real_balance_raw = iq.get_balance()
+                        if real_balance_raw:
+                            real_balance = float(real_balance_raw)
+                            log.debug("Balance REAL (alternativo): $%s", real_balance)
+                
+                    # Cambiar a PRACTICE y obtener balance
+                    if cambiar_balance(iq, 'PRACTICE'):
+                        demo_balance_raw = iq.get_balance()
+                        if demo_balance_raw:
+                            demo_balance = float(demo_balance_raw)
+                            log.debug("Balance DEMO (alternativo): $%s", demo_balance)
+                
+                    # Volver al balance que estaba activo (REAL por defecto)
+                    cambiar_balance(iq, anterior or 'REAL')
+                
+            except Exception as e2:
+                log.warning("Error en método alternativo de balances: %s", e2)
+
+        # Si aún no hay balances, usar valores por defecto
+        if real_balance == 0 and demo_balance == 0:
+            log.warning("Sin balances del broker: se usan valores por defecto")
+            real_balance = 0.0
+            demo_balance = 10000.0
+
+        log.debug("Balances: REAL $%s, DEMO $%s", real_balance, demo_balance)
+        
+    except Exception as e:
+        log.error("Error general obteniendo balances: %s", e)
+        real_balance = 0.0
+        demo_balance = 10000.0
+    
+    return real_balance, demo_balance, real_id, demo_id
+
+
+class _Entrada:
+    __slots__ = ("valores", "cargado", "generacion", "generacion_cargada", "lock")
+
+    def __init__(self):
+        self.valores: Optional[Tuple[float, float, Any, Any]] = None
+        self.cargado = 0.0
+        self.generacion = 0
+        self.generacion_cargada = -1
+        self.lock = threading.Lock()
+
+
+class CacheBalances:
+    """
+    Balances por conexión de IQ Option, sin ir al broker en cada petición.
+
+    Un balance se vuelve a consultar solo si pasaron TTL_BALANCES segundos o
+    si se liquidó una operación de esa conexión (el seguimiento de
+    operaciones lo invalida). Peticiones simultáneas sobre una entrada
+    vencida hacen una sola consulta.
+    """
+
+    def __init__(self, ttl: float = TTL_BALANCES):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entradas = weakref.WeakKeyDictionary()
+
+    def _entrada(self, iq) -> _Entrada:
+        with self._lock:
+            entrada = self._entradas.get(iq)
+            if entrada is None:
+                entrada = _Entrada()
+                self._entradas[iq] = entrada
+            return entrada
+
+    def obtener(self, iq) -> Tuple[float, float, Any, Any]:
+        """(real, demo, real_id, demo_id), igual que obtener_balances_reales."""
+        entrada = self._entrada(iq)
+        with entrada.lock:
+            with self._lock:
+                generacion = entrada.generacion
+            if (entrada.valores is not None and entrada.generacion_cargada == generacion
+                    and time.time() - entrada.cargado < self.ttl):
+                return entrada.valores
+
+            valores = obtener_balances_reales(iq)
+            entrada.valores = valores
+            entrada.cargado = time.time()
+            # Si se invalidó durante la consulta, la próxima lectura vuelve a consultar
+            entrada.generacion_cargada = generacion
+            return valores
+
+    def invalidar(self, iq):
+        entrada = self._entrada(iq)
+        with self._lock:
+            entrada.generacion += 1
+
+
+# Instancia única compartida por el proceso
+cache_balances = CacheBalances()
+seguimiento_operaciones.al_liquidar(lambda iq, resultado: cache_balances.invalidar(iq))
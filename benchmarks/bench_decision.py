@@ -0,0 +1,300 @@
+"""
+Benchmark del camino de decisión: velas → features → predict → monto.
+
+Uso:
+    python benchmarks/bench_decision.py [--activos 1 10 100] [--ciclos 50]
+                                        [--velas grabacion.json] [--salida resultado.json]
+                                        [--comparar base.json]
+
+Un IQ_Option de prueba devuelve velas grabadas (el formato de get_candles:
+una lista de velas, o {activo: lista}); sin --velas se generan velas
+sintéticas deterministas y --grabar las guarda para reutilizarlas. Se mide
+cada etapa (get_latest_market_data, features, predecir_decision y
+GestorRiesgoInteligente.calcular_monto_operacion) con percentiles de
+latencia, una pasada aparte con tracemalloc para las asignaciones, y el
+throughput por ciclo para 1, 10 y 100 activos, tanto activo por activo
+(como ejecutar_operacion) como con escanear_activos. El resultado es JSON;
+con --comparar se marca toda etapa cuyo p50 empeoró más que --tolerancia.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# El almacén de velas persiste en disco: que el benchmark no toque el del servidor
+os.environ.setdefault("VELAS_DIR", tempfile.mkdtemp(prefix="bench_velas_"))
+# Los logs de cada ciclo caerían dentro del tiempo medido (bitacora ya tomó su stderr al importarse)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import operar
+from operar import (
+    TIMEFRAME, NUM_VELAS, GestorRiesgoInteligente, get_latest_market_data, calcular_features,
+    calcular_features_incremental, predecir_decision, calidad_senal, obtener_modelo
+)
+from escaner import escanear_activos
+
+ETAPAS = ("velas", "features", "predict", "monto")
+
+
+class IQOptionGrabado:
+    """
+    Sustituto de IQ_Option que sirve velas grabadas.
+
+    Las velas se re-fechan para que la última sea la vela en curso según el
+    reloj real, así el almacén y los features incrementales se comportan como
+    en producción entre dos cierres de vela.
+    """
+
+    def __init__(self, velas_por_activo: Dict[str, List[Dict[str, Any]]], latencia: float = 0.0):
+        self.velas_por_activo = velas_por_activo
+        self.latencia = latencia
+        self.peticiones = 0
+
+    def get_candles(self, activo, timeframe, cantidad, hasta):
+        self.peticiones += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        grabadas = self.velas_por_activo[activo][-cantidad:]
+        inicio = int(hasta // timeframe) * timeframe - (len(grabadas) - 1) * timeframe
+        return [dict(vela, **{'from': inicio + i * timeframe, 'to': inicio + (i + 1) * timeframe})
+                for i, vela in enumerate(grabadas)]
+
+
+def generar_payload(n: int, semilla: int) -> List[Dict[str, Any]]:
+    """Velas sintéticas con los campos de get_candles."""
+    rng = np.random.default_rng(semilla)
+    close = 1.10 * np.exp(np.cumsum(rng.normal(0, 4e-4, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) * (1 + rng.random(n) * 2e-4)
+    low = np.minimum(open_, close) * (1 - rng.random(n) * 2e-4)
+    return [{'id': i, 'open': float(o), 'close': float(c), 'min': float(l), 'max': float(h),
+             'volume': int(v)}
+            for i, (o, c, l, h, v) in enumerate(zip(open_, close, low, high, rng.integers(1, 500, n)))]
+
+
+def cargar_grabacion(ruta: str, activos: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    with open(ruta, 'r', encoding='utf-8') as f:
+        datos = json.load(f)
+    if isinstance(datos, list):
+        return {activo: datos for activo in activos}
+    faltantes = [a for a in activos if a not in datos]
+    if faltantes:
+        # Menos series grabadas que activos: se reparten las que hay
+        series = list(datos.values())
+        datos.update({a: series[i % len(series)] for i, a in enumerate(faltantes)})
+    return datos
+
+
+def percentiles(muestras: List[float]) -> Dict[str, float]:
+    ms = np.asarray(muestras) * 1000
+    return {
+        'n': int(len(ms)),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p90_ms': float(np.percentile(ms, 90)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'max_ms': float(ms.max()),
+        'media_ms': float(ms.mean())
+    }
+
+
+def decidir(iq, activo: str, modelo, gestor: GestorRiesgoInteligente, incremental: bool,
+            tiempos: Dict[str, List[float]]):
+    """Un ciclo de decisión de ejecutar_operacion, cronometrado por etapa."""
+    t0 = time.perf_counter()
+    df = get_latest_market_data(iq, activo, TIMEFRAME)
+    t1 = time.perf_counter()
+    df_feat = calcular_features_incremental(df, activo, TIMEFRAME) if incremental else calcular_features(df)
+    t2 = time.perf_counter()
+    decision = predecir_decision(modelo, df_feat, forzar=True)
+    t3 = time.perf_counter()
+    gestor.calcular_monto_operacion(10000, calidad_senal(float(decision['probabilidad'])))
+    t4 = time.perf_counter()
+    for etapa, duracion in zip(ETAPAS, (t1 - t0, t2 - t1, t3 - t2, t4 - t3)):
+        tiempos[etapa].append(duracion)
+    tiempos['total'].append(t4 - t0)
+
+
+def medir_latencias(iq, activos: List[str], modelo, ciclos: int, incremental: bool) -> Dict[str, Any]:
+    """Percentiles por etapa; el primer ciclo (descarga completa, estado vacío) se reporta aparte."""
+    gestor = GestorRiesgoInteligente()
+    frio = {etapa: [] for etapa in ETAPAS + ('total',)}
+    for activo in activos:
+        decidir(iq, activo, modelo, gestor, incremental, frio)
+    caliente = {etapa: [] for etapa in ETAPAS + ('total',)}
+    for _ in range(ciclos):
+        for activo in activos:
+            decidir(iq, activo, modelo, gestor, incremental, caliente)
+    return {
+        'frio': {etapa: percentiles(m) for etapa, m in frio.items()},
+        'caliente': {etapa: percentiles(m) for etapa, m in caliente.items()}
+    }
+
+
+def medir_asignaciones(iq, activo: str, modelo, ciclos: int, incremental: bool) -> Dict[str, Any]:
+    """Pico de memoria asignada por etapa (mediana entre ciclos) con tracemalloc."""
+    gestor = GestorRiesgoInteligente()
+    pasos = {
+        'velas': lambda ctx: ctx.update(df=get_latest_market_data(iq, activo, TIMEFRAME)),
+        'features': lambda ctx: ctx.update(df_feat=calcular_features_incremental(ctx['df'], activo, TIMEFRAME)
+                                           if incremental else calcular_features(ctx['df'])),
+        'predict': lambda ctx: ctx.update(decision=predecir_decision(modelo, ctx['df_feat'], forzar=True)),
+        'monto': lambda ctx: gestor.calcular_monto_operacion(
+            10000, calidad_senal(float(ctx['decision']['probabilidad'])))
+    }
+    picos = {etapa: [] for etapa in ETAPAS}
+    tracemalloc.start()
+    try:
+        for _ in range(ciclos):
+            ctx: Dict[str, Any] = {}
+            for etapa, paso in pasos.items():
+                tracemalloc.reset_peak()
+                base, _ = tracemalloc.get_traced_memory()
+                paso(ctx)
+                _, pico = tracemalloc.get_traced_memory()
+                picos[etapa].append(pico - base)
+    finally:
+        tracemalloc.stop()
+    return {etapa: {'pico_kib_p50': float(np.median(v)) / 1024, 'pico_kib_max': float(max(v)) / 1024}
+            for etapa, v in picos.items()}
+
+
+def medir_throughput(iq, activos: List[str], modelo, ciclos: int, incremental: bool) -> Dict[str, Any]:
+    """
+    Decisiones por segundo: activo por activo y con el escáner (un predict por
+    ciclo). El escáner calcula features según FEATURES_INCREMENTALES de operar.
+    """
+    gestor = GestorRiesgoInteligente()
+    descartar = {etapa: [] for etapa in ETAPAS + ('total',)}
+    for activo in activos:
+        decidir(iq, activo, modelo, gestor, incremental, descartar)
+
+    inicio = time.perf_counter()
+    for _ in range(ciclos):
+        for activo in activos:
+            decidir(iq, activo, modelo, gestor, incremental, descartar)
+    secuencial = time.perf_counter() - inicio
+
+    duraciones = []
+    for _ in range(ciclos):
+        t0 = time.perf_counter()
+        escanear_activos(iq, activos, TIMEFRAME, forzar=True, modelo=modelo)
+        duraciones.append(time.perf_counter() - t0)
+
+    return {
+        'activos': len(activos),
+        'secuencial': {'ciclo_ms': secuencial / ciclos * 1000,
+                       'decisiones_por_segundo': len(activos) * ciclos / secuencial},
+        'escaner': {'ciclo': percentiles(duraciones),
+                    'decisiones_por_segundo': len(activos) * ciclos / sum(duraciones)}
+    }
+
+
+def comparar(actual: Dict[str, Any], base: Dict[str, Any], tolerancia: float) -> List[str]:
+    """Etapas y escenarios cuyo p50 (o throughput) empeoró más que la tolerancia."""
+    regresiones = []
+    for etapa, m in actual['latencias']['caliente'].items():
+        anterior = base.get('latencias', {}).get('caliente', {}).get(etapa)
+        if anterior and m['p50_ms'] > anterior['p50_ms'] * (1 + tolerancia):
+            regresiones.append(f"{etapa}: p50 {anterior['p50_ms']:.3f} → {m['p50_ms']:.3f} ms")
+    previos = {t['activos']: t for t in base.get('throughput', [])}
+    for t in actual['throughput']:
+        anterior = previos.get(t['activos'])
+        if not anterior:
+            continue
+        for modo in ('secuencial', 'escaner'):
+            antes, ahora = anterior[modo]['decisiones_por_segundo'], t[modo]['decisiones_por_segundo']
+            if ahora < antes / (1 + tolerancia):
+                regresiones.append(f"{modo} x{t['activos']}: {antes:.1f} → {ahora:.1f} decisiones/s")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--activos", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--ciclos", type=int, default=50, help="Ciclos medidos por escenario")
+    parser.add_argument("--velas", help="Grabación de velas (JSON de get_candles)")
+    parser.add_argument("--grabar", help="Guardar las velas sintéticas usadas")
+    parser.add_argument("--latencia-ms", type=float, default=0.0, help="Latencia simulada por get_candles")
+    parser.add_argument("--features", choices=("incremental", "batch"),
+                        default="incremental" if operar.FEATURES_INCREMENTALES else "batch")
+    parser.add_argument("--salida", help="Guardar el resultado en JSON")
+    parser.add_argument("--comparar", help="Resultado JSON anterior contra el cual comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Empeoramiento permitido (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    nombres = [f"BENCH{i:03d}-OTC" for i in range(max(args.activos))]
+    if args.velas:
+        velas = cargar_grabacion(args.velas, nombres)
+    else:
+        velas = {activo: generar_payload(NUM_VELAS + 1, semilla=i) for i, activo in enumerate(nombres)}
+    if args.grabar:
+        with open(args.grabar, 'w', encoding='utf-8') as f:
+            json.dump(velas, f)
+
+    iq = IQOptionGrabado(velas, latencia=args.latencia_ms / 1000)
+    incremental = args.features == "incremental"
+    modelo = obtener_modelo()
+
+    latencias = medir_latencias(iq, nombres[:1], modelo, args.ciclos, incremental)
+    asignaciones = medir_asignaciones(iq, nombres[0], modelo, min(args.ciclos, 20), incremental)
+    throughput = [medir_throughput(iq, nombres[:n], modelo, max(1, args.ciclos // max(1, n // 10)), incremental)
+                  for n in args.activos]
+
+    resultado = {
+        'fecha': datetime.now().isoformat(),
+        'entorno': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'plataforma': platform.platform(),
+            'model_backend': operar.MODEL_BACKEND,
+            'features': args.features,
+            'almacen_velas': operar.ALMACEN_VELAS,
+            'latencia_ms': args.latencia_ms,
+            'ciclos': args.ciclos
+        },
+        'latencias': latencias,
+        'asignaciones': asignaciones,
+        'throughput': throughput
+    }
+
+    print(f"{'etapa':>10} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'frío ms':>10} {'pico KiB':>10}")
+    for etapa in ETAPAS + ('total',):
+        m, f = latencias['caliente'][etapa], latencias['frio'][etapa]
+        pico = asignaciones.get(etapa, {}).get('pico_kib_p50')
+        print(f"{etapa:>10} {m['p50_ms']:>10.3f} {m['p90_ms']:>10.3f} {m['p99_ms']:>10.3f} {f['p50_ms']:>10.3f} "
+              f"{pico if pico is not None else float('nan'):>10.1f}")
+    print(f"\n{'activos':>8} {'secuencial/s':>14} {'escáner/s':>12} {'ciclo escáner p50 ms':>22}")
+    for t in throughput:
+        print(f"{t['activos']:>8} {t['secuencial']['decisiones_por_segundo']:>14.1f} "
+              f"{t['escaner']['decisiones_por_segundo']:>12.1f} {t['escaner']['ciclo']['p50_ms']:>22.2f}")
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, indent=2)
+
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            base = json.load(f)
+        regresiones = comparar(resultado, base, args.tolerancia)
+        if regresiones:
+            print(f"\n❌ Regresiones respecto a {args.comparar}:")
+            for linea in regresiones:
+                print(f"   {linea}")
+            sys.exit(1)
+        print(f"\n✅ Sin regresiones respecto a {args.comparar}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark de detección de Harami: bucle con iloc (referencia) vs vectorizado.
+
+Uso:
+    python benchmarks/bench_harami.py [--tamanos 120 10000 1000000]
+
+Antes de medir se verifica que ambas implementaciones den exactamente el
+mismo resultado, usando detect_harami como referencia.
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from operar import detect_harami, detect_harami_vectorizado
+
+
+def generar_velas(n: int, semilla: int = 0) -> pd.DataFrame:
+    """Velas sintéticas tipo EURUSD con cuerpos pequeños (muchos haramis)."""
+    rng = np.random.default_rng(semilla)
+    close = 1.10 + np.cumsum(rng.normal(0, 2e-4, n))
+    open_ = np.r_[close[0], close[:-1]] + rng.normal(0, 5e-5, n)
+    # Algunas velas repetidas para cubrir los casos de igualdad
+    iguales = rng.random(n) < 0.02
+    open_[iguales] = close[iguales]
+    return pd.DataFrame({"open": open_, "close": close})
+
+
+def harami_bucle(df: pd.DataFrame) -> np.ndarray:
+    """Implementación original de calcular_features (dos iloc por vela)."""
+    harami = [0]
+    for i in range(1, len(df)):
+        harami.append(detect_harami(df.iloc[i - 1], df.iloc[i]))
+    return np.array(harami, dtype=np.int64)
+
+
+def medir(funcion, repeticiones: int) -> float:
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[120, 10_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'velas':>10} {'bucle (s)':>12} {'vectorizado (s)':>16} {'speedup':>10}")
+    for n in args.tamanos:
+        df = generar_velas(n)
+
+        esperado = harami_bucle(df)
+        obtenido = detect_harami_vectorizado(df["open"], df["close"])
+        if not np.array_equal(esperado, obtenido):
+            distintos = np.flatnonzero(esperado != obtenido)
+            print(f"❌ Resultados distintos en {len(distintos)} velas (primera: {distintos[0]})")
+            sys.exit(1)
+
+        # El bucle es lento: una sola repetición en tamaños grandes
+        t_bucle = medir(lambda: harami_bucle(df), 3 if n <= 10_000 else 1)
+        t_vect = medir(lambda: detect_harami_vectorizado(df["open"], df["close"]), 5)
+        print(f"{n:>10} {t_bucle:>12.4f} {t_vect:>16.6f} {t_bucle / t_vect:>9.0f}x")
+
+    print("✅ Ambas implementaciones coinciden")
+
+
+if __name__ == "__main__":
+    main()
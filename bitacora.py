@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from typing import Dict, Optional, Tuple
+
+# DEBUG | INFO | WARNING | ERROR
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# "texto": una línea legible | "json": un objeto por línea (para el envío de logs de Fly)
+LOG_FORMATO = os.environ.get("LOG_FORMATO", "texto")
+# Un mismo mensaje (por plantilla) se emite como mucho LOG_MUESTREO_MAX veces por ventana
+LOG_MUESTREO_VENTANA = float(os.environ.get("LOG_MUESTREO_VENTANA", 60))
+LOG_MUESTREO_MAX = int(os.environ.get("LOG_MUESTREO_MAX", 10))
+# Registros en espera de escritura; si la cola se llena se descartan (nunca se bloquea)
+MAX_COLA_LOGS = 10000
+
+RAIZ = "synapse"
+
+# Atributos propios de LogRecord; el resto viene de `extra` y va como campo
+_ATRIBUTOS_RECORD = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'suprimidos'}
+
+
+def _campos_extra(record: logging.LogRecord) -> Dict:
+    return {k: v for k, v in vars(record).items() if k not in _ATRIBUTOS_RECORD}
+
+
+class FormatoJSON(logging.Formatter):
+    """Un objeto JSON por línea con nivel, logger, thread y los campos de `extra`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        datos = {
+            'ts': round(record.created, 3),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensaje': record.getMessage(),
+            'thread': record.threadName
+        }
+        datos.update(_campos_extra(record))
+        if getattr(record, 'suprimidos', 0):
+            datos['suprimidos'] = record.suprimidos
+        if record.exc_text:
+            datos['excepcion'] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class FormatoTexto(logging.Formatter):
+    """`HH:MM:SS NIVEL logger: mensaje clave=valor`"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        linea = (f"{time.strftime('%H:%M:%S', time.localtime(record.created))} {record.levelname:<7} "
+                 f"{record.name}: {record.getMessage()}")
+        extra = _campos_extra(record)
+        if extra:
+            linea += ' ' + ' '.join(f"{k}={v}" for k, v in extra.items())
+        if getattr(record, 'suprimidos', 0):
+            linea += f" (+{record.suprimidos} iguales omitidos)"
+        if record.exc_text:
+            linea += '\n' + record.exc_text
+        return linea
+
+
+class FiltroMuestreo(logging.Filter):
+    """
+    Limita los mensajes repetidos.
+
+    La clave es (logger, nivel, plantilla sin argumentos): "Obteniendo velas
+    de %s" cuenta como un solo mensaje para todos los activos. Pasado el
+    máximo de la ventana se descartan hasta que empiece la siguiente, y el
+    primer registro de esa ventana informa cuántos se omitieron. Los errores
+    nunca se muestrean.
+    """
+
+    def __init__(self, ventana: float = LOG_MUESTREO_VENTANA, maximo: int = LOG_MUESTREO_MAX):
+        super().__init__()
+        self.ventana = ventana
+        self.maximo = maximo
+        self._lock = threading.Lock()
+        self._conteos: Dict[Tuple, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.maximo <= 0 or record.levelno >= logging.ERROR:
+            return True
+        clave = (record.name, record.levelno, record.msg)
+        ahora = record.created
+        with self._lock:
+            estado = self._conteos.get(clave)
+            if estado is None or ahora - estado[0] >= self.ventana:
+                if len(self._conteos) > 4096:
+                    self._conteos.clear()
+                # [inicio de ventana, emitidos, omitidos]
+                omitidos = estado[2] if estado else 0
+                self._conteos[clave] = [ahora, 1, 0]
+                if omitidos:
+                    record.suprimidos = omitidos
+                return True
+            if estado[1] < self.maximo:
+                estado[1] += 1
+                return True
+            estado[2] += 1
+            return False
+
+
+class ManejadorCola(logging.handlers.QueueHandler):
+    """
+    Encola el registro sin formatearlo y sin bloquear al thread que loguea.
+
+    Solo se resuelven los argumentos del mensaje y el traceback (no se puede
+    pasar entre threads); el formato JSON/texto y la escritura los hace el
+    thread del QueueListener.
+    """
+
+    def __init__(self, cola: queue.Queue):
+        super().__init__(cola)
+        self.descartados = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+manejador_cola: Optional[ManejadorCola] = None
+
+
+def configurar(nivel: str = LOG_LEVEL, formato: str = LOG_FORMATO):
+    """Configura el logger raíz del proyecto (una sola vez por proceso)."""
+    global _listener, manejador_cola
+    with _lock:
+        if _listener is not None:
+            return
+        salida = logging.StreamHandler(sys.stderr)
+        salida.setFormatter(FormatoJSON() if formato == 'json' else FormatoTexto())
+
+        cola: queue.Queue = queue.Queue(maxsize=MAX_COLA_LOGS)
+        manejador_cola = ManejadorCola(cola)
+        manejador_cola.addFilter(FiltroMuestreo())
+
+        raiz = logging.getLogger(RAIZ)
+        raiz.setLevel(getattr(logging, nivel, logging.INFO))
+        raiz.addHandler(manejador_cola)
+        raiz.propagate = False
+
+        _listener = logging.handlers.QueueListener(cola, salida, respect_handler_level=True)
+        _listener.start()
+        # Al salir se vacía la cola antes de terminar
+        atexit.register(_listener.stop)
+
+
+def obtener_logger(nombre: str) -> logging.Logger:
+    """Logger `synapse.<nombre>`; configura la salida la primera vez."""
+    configurar()
+    return logging.getLogger(f"{RAIZ}.{nombre}")
@@ -0,0 +1,272 @@
+"""
+Búsqueda en grilla de LOWER_THRESHOLD, UPPER_THRESHOLD y REGIME_CUTOFF.
+
+Uso:
+    python busqueda_umbrales.py velas.csv [--lower 0.30:0.50:0.01] [--upper 0.50:0.70:0.01]
+                                          [--cutoff 0:0.002:0.0001] [--procesos 4]
+                                          [--validacion 0.3] [--aplicar]
+
+El modelo puntúa la serie una sola vez (backtest.preparar) y las
+probabilidades quedan en cache en `<velas>.probas.npz`, que se reutiliza
+mientras no cambien las velas ni el modelo. La serie se parte en orden
+cronológico: la grilla solo ve el tramo de entrenamiento y el último
+--validacion (30%) queda reservado. Cada combinación se evalúa de forma
+vectorizada con un monto fijo de $1 por señal; los cortes de régimen se
+reparten en un pool de procesos. Las mejores combinaciones se vuelven a
+simular con backtest.simular (una operación a la vez y gestor de riesgo) en
+ambos tramos. Solo con --aplicar la primera del ranking se guarda en
+UMBRALES_FILE, que ejecutar_operacion lee en caliente, y solo si también
+gana en el tramo de validación.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from modelos import _hash_archivo
+from operar import MODEL_FILE, EXPIRATION_TIME, UMBRALES_FILE
+from backtest import (
+    PAYOUT, BALANCE_INICIAL, Serie, cargar_velas, inferir_timeframe, preparar, senales, simular,
+    velas_expiracion
+)
+
+ORDENES = ('pnl', 'pnl_por_operacion', 'win_rate')
+COLUMNAS = ['lower_threshold', 'upper_threshold', 'regime_cutoff', 'operaciones', 'ganadas', 'perdidas',
+            'win_rate', 'pnl', 'pnl_por_operacion', 'max_drawdown']
+
+
+def parsear_rango(texto: str) -> np.ndarray:
+    """"inicio:fin:paso" (fin incluido) o lista separada por comas."""
+    if ':' in texto:
+        inicio, fin, paso = (float(x) for x in texto.split(':'))
+        if paso <= 0:
+            raise argparse.ArgumentTypeError(f"Paso inválido en {texto!r}")
+        return np.round(np.arange(inicio, fin + paso / 2, paso), 10)
+    return np.array(sorted(float(x) for x in texto.split(',')))
+
+
+def serie_en_cache(ruta_velas: str, ruta_cache: str, timeframe: int = None,
+                   expiracion_min: int = EXPIRATION_TIME) -> Serie:
+    """Serie puntuada desde la cache .npz, o calculada (y guardada) si cambió algo."""
+    h = hashlib.sha256()
+    for parte in (_hash_archivo(ruta_velas), _hash_archivo(MODEL_FILE), str(timeframe), str(expiracion_min)):
+        h.update(parte.encode())
+    firma = h.hexdigest()
+
+    if os.path.exists(ruta_cache):
+        with np.load(ruta_cache) as datos:
+            if str(datos['firma']) == firma:
+                print(f"📦 Probabilidades en cache: {ruta_cache}", file=sys.stderr)
+                return Serie(datos['ts'], datos['close'], datos['regimen'], datos['proba'], datos['movimiento'])
+
+    df = cargar_velas(ruta_velas)
+    inicio = time.perf_counter()
+    serie = preparar(df, timeframe=timeframe or inferir_timeframe(df), expiracion_min=expiracion_min)
+    print(f"🧠 Serie puntuada en {time.perf_counter() - inicio:.2f}s ({len(serie)} velas)", file=sys.stderr)
+
+    temporal = ruta_cache + '.tmp.npz'
+    np.savez(temporal, firma=firma, ts=serie.ts, close=serie.close, regimen=serie.regimen,
+             proba=serie.proba, movimiento=serie.movimiento)
+    os.replace(temporal, ruta_cache)
+    return serie
+
+
+# Datos de cada proceso del pool (se envían una vez, en el inicializador)
+_datos: Dict[str, np.ndarray] = {}
+
+
+def _iniciar_worker(proba: np.ndarray, regimen: np.ndarray, ganancia_call: np.ndarray,
+                    ganancia_put: np.ndarray):
+    _datos.update(proba=proba, regimen=regimen, ganancia_call=ganancia_call, ganancia_put=ganancia_put)
+
+
+def _evaluar_corte(cutoff: float, lowers: np.ndarray, uppers: np.ndarray) -> List[tuple]:
+    """Todas las combinaciones (lower, upper) para un corte de régimen."""
+    seleccion = _datos['regimen'] >= cutoff
+    proba = _datos['proba'][seleccion]
+    ganancia_call = _datos['ganancia_call'][seleccion]
+    ganancia_put = _datos['ganancia_put'][seleccion]
+    es_call = {upper: proba >= upper for upper in uppers}
+
+    filas = []
+    for lower in lowers:
+        es_put = proba <= lower
+        ganancia = np.where(es_put, ganancia_put, ganancia_call)
+        for upper in uppers:
+            if lower >= upper:
+                continue
+            g = ganancia[es_put | es_call[upper]]
+            n = len(g)
+            ganadas = int(np.count_nonzero(g > 0))
+            perdidas = int(np.count_nonzero(g < 0))
+            pnl = float(g.sum())
+            if n:
+                curva = np.cumsum(g)
+                max_drawdown = float((np.maximum.accumulate(np.maximum(curva, 0)) - curva).max())
+            else:
+                max_drawdown = 0.0
+            filas.append((float(lower), float(upper), float(cutoff), n, ganadas, perdidas,
+                          ganadas / (ganadas + perdidas) if ganadas + perdidas else np.nan,
+                          pnl, pnl / n if n else np.nan, max_drawdown))
+    return filas
+
+
+def evaluar(serie: Serie, lowers: np.ndarray, uppers: np.ndarray, cutoffs: np.ndarray,
+            payout: float = PAYOUT, procesos: int = None) -> pd.DataFrame:
+    """Métricas por combinación con $1 por señal (sin gestor de riesgo, operaciones solapables)."""
+    validas = ~np.isnan(serie.movimiento)
+    movimiento = serie.movimiento[validas]
+    ganancia_call = np.where(movimiento > 0, payout, np.where(movimiento < 0, -1.0, 0.0))
+    ganancia_put = np.where(movimiento < 0, payout, np.where(movimiento > 0, -1.0, 0.0))
+    datos = (serie.proba[validas], serie.regimen[validas], ganancia_call, ganancia_put)
+    tarea = functools.partial(_evaluar_corte, lowers=lowers, uppers=uppers)
+
+    procesos = max(1, min(procesos or os.cpu_count() or 1, len(cutoffs)))
+    if procesos == 1:
+        _iniciar_worker(*datos)
+        bloques = map(tarea, cutoffs)
+        filas = [fila for bloque in bloques for fila in bloque]
+    else:
+        with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_worker, initargs=datos) as pool:
+            filas = [fila for bloque in pool.map(tarea, cutoffs) for fila in bloque]
+    return pd.DataFrame(filas, columns=COLUMNAS)
+
+
+def pnl_unitario(serie: Serie, tipo: np.ndarray, payout: float = PAYOUT) -> tuple:
+    """(operaciones, pnl) con $1 por señal, como una fila de la grilla."""
+    acierto = (serie.movimiento * tipo)[tipo != 0]
+    ganancia = np.where(acierto > 0, payout, np.where(acierto < 0, -1.0, 0.0))
+    return int(len(ganancia)), float(ganancia.sum())
+
+
+def guardar_config(ruta: str, mejor: Dict[str, Any], extra: Dict[str, Any]):
+    """Escribe el archivo de umbrales de forma atómica (el servidor puede estar leyéndolo)."""
+    config = {
+        'lower_threshold': mejor['lower_threshold'],
+        'upper_threshold': mejor['upper_threshold'],
+        'regime_cutoff': mejor['regime_cutoff'],
+        'generado': datetime.now().isoformat(),
+        **extra
+    }
+    temporal = ruta + '.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+    os.replace(temporal, ruta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("velas", help="Archivo CSV o Parquet con las velas")
+    parser.add_argument("--lower", type=parsear_rango, default=parsear_rango("0.30:0.50:0.01"))
+    parser.add_argument("--upper", type=parsear_rango, default=parsear_rango("0.50:0.70:0.01"))
+    parser.add_argument("--cutoff", type=parsear_rango, default=None,
+                        help="Cortes de régimen (por defecto, 20 cuantiles de bb_width)")
+    parser.add_argument("--timeframe", type=int, default=None, help="Segundos por vela (por defecto, según los datos)")
+    parser.add_argument("--expiracion", type=int, default=EXPIRATION_TIME, help="Minutos de cada operación")
+    parser.add_argument("--payout", type=float, default=PAYOUT)
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos del pool (por defecto, CPUs)")
+    parser.add_argument("--orden", choices=ORDENES, default='pnl')
+    parser.add_argument("--min-operaciones", type=int, default=200,
+                        help="Operaciones mínimas en entrenamiento para entrar al ranking")
+    parser.add_argument("--validacion", type=float, default=0.3,
+                        help="Fracción final de la serie reservada para validar (0 = sin validación)")
+    parser.add_argument("--top", type=int, default=20, help="Filas del ranking a mostrar")
+    parser.add_argument("--verificar", type=int, default=5,
+                        help="Mejores combinaciones a re-simular con backtest.simular")
+    parser.add_argument("--balance", type=float, default=BALANCE_INICIAL)
+    parser.add_argument("--cache", help="Cache de probabilidades (por defecto, <velas>.probas.npz)")
+    parser.add_argument("--tabla", help="Guardar el ranking completo en CSV")
+    parser.add_argument("--aplicar", action="store_true",
+                        help="Escribir la mejor combinación en el archivo de umbrales (lo usa el bot en vivo)")
+    parser.add_argument("--config", default=UMBRALES_FILE, help="Archivo de umbrales a escribir con --aplicar")
+    args = parser.parse_args()
+
+    if not 0 <= args.validacion < 1:
+        parser.error("--validacion debe estar en [0, 1)")
+    if args.aplicar and not args.validacion:
+        parser.error("--aplicar necesita un tramo de validación (--validacion > 0)")
+
+    try:
+        serie = serie_en_cache(args.velas, args.cache or args.velas + '.probas.npz', args.timeframe,
+                               args.expiracion)
+        k = velas_expiracion(args.timeframe or int(np.median(np.diff(serie.ts[:10000]))), args.expiracion)
+    except ValueError as e:
+        parser.error(str(e))
+    corte = int(len(serie) * (1 - args.validacion))
+    entrenamiento, validacion = serie[:corte], serie[corte:]
+    cutoffs = args.cutoff if args.cutoff is not None else \
+        np.unique(np.nanquantile(entrenamiento.regimen, np.linspace(0, 0.95, 20)))
+
+    combinaciones = sum(1 for lo in args.lower for up in args.upper if lo < up) * len(cutoffs)
+    print(f"🔎 Evaluando {combinaciones} combinaciones sobre {len(entrenamiento)} velas "
+          f"({len(validacion)} reservadas para validación)...", file=sys.stderr)
+    inicio = time.perf_counter()
+    tabla = evaluar(entrenamiento, args.lower, args.upper, cutoffs, payout=args.payout, procesos=args.procesos)
+    print(f"⏱️  Grilla evaluada en {time.perf_counter() - inicio:.2f}s", file=sys.stderr)
+
+    ranking = tabla[tabla['operaciones'] >= args.min_operaciones] \
+        .sort_values([args.orden, 'operaciones'], ascending=False).reset_index(drop=True)
+    if ranking.empty:
+        print(f"❌ Ninguna combinación con al menos {args.min_operaciones} operaciones", file=sys.stderr)
+        sys.exit(1)
+
+    # Las mejores se re-simulan como el backtest (una operación a la vez y gestor de
+    # riesgo) en entrenamiento y se miden en el tramo reservado, que la grilla no vio
+    verificar = max(args.verificar, 1) if args.aplicar else args.verificar
+    if verificar:
+        columnas = {}
+        for fila in ranking.head(verificar).itertuples():
+            umbrales = (fila.lower_threshold, fila.upper_threshold, fila.regime_cutoff)
+            metricas = {}
+            for prefijo, tramo in (('sim', entrenamiento), ('val_sim', validacion)):
+                if not len(tramo):
+                    continue
+                tipo = senales(tramo, *umbrales)
+                resultado = simular(tramo, tipo, payout=args.payout, balance_inicial=args.balance,
+                                    velas_operacion=k)
+                metricas[f'{prefijo}_pnl'] = resultado['pnl']
+                metricas[f'{prefijo}_drawdown_pct'] = resultado['max_drawdown_pct']
+                if prefijo == 'val_sim':
+                    metricas['val_operaciones'], metricas['val_pnl'] = pnl_unitario(tramo, tipo, args.payout)
+            for columna, valor in metricas.items():
+                columnas.setdefault(columna, []).append(valor)
+        for columna, valores in columnas.items():
+            ranking.loc[:len(valores) - 1, columna] = valores
+
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print(ranking.head(args.top).to_string(float_format=lambda x: f"{x:.4f}"))
+    if args.tabla:
+        ranking.to_csv(args.tabla, index=False)
+
+    if not args.aplicar:
+        return
+    mejor = json.loads(ranking.head(1).to_json(orient='records'))[0]
+    # Fuera de muestra: al menos tantas operaciones por vela como exige el entrenamiento
+    min_validacion = max(1, int(args.min_operaciones * len(validacion) / max(len(entrenamiento), 1)))
+    fallas = [f'{c}={mejor.get(c)}' for c in ('pnl', 'sim_pnl', 'val_pnl', 'val_sim_pnl')
+              if mejor.get(c) is None or mejor[c] <= 0]
+    if (mejor.get('val_operaciones') or 0) < min_validacion:
+        fallas.append(f"val_operaciones={mejor.get('val_operaciones')} < {min_validacion}")
+    if fallas:
+        print(f"❌ La mejor combinación no se sostiene ({', '.join(fallas)}): no se escribe {args.config}",
+              file=sys.stderr)
+        sys.exit(1)
+    guardar_config(args.config, mejor, {
+        'velas': os.path.basename(args.velas),
+        'orden': args.orden,
+        'metricas': {c: mejor[c] for c in ranking.columns if c not in COLUMNAS[:3] and mejor[c] is not None}
+    })
+    print(f"💾 Umbrales guardados en {args.config}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
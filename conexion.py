@@ -6,14 +6,132 @@ import sys
 import json
 import time
 import os
-from typing import Optional
+import hmac
+import hashlib
+import threading
+import weakref
+from typing import Dict, Optional
 from iqoptionapi.stable_api import IQ_Option
+from bitacora import obtener_logger
+
+log = obtener_logger("conexion")
 
 
 class IQOptionLoginError(Exception):
     pass
 
 
+# Un lock por sesión de IQ Option: iqoptionapi guarda la respuesta de
+# get_candles en un único slot por sesión, así que dos descargas simultáneas
+# sobre la misma sesión pueden recibir las velas de otro activo.
+_locks_sesion = weakref.WeakKeyDictionary()
+_locks_guard = threading.Lock()
+
+
+def lock_sesion(iq: IQ_Option) -> threading.Lock:
+    """Retorna el lock que serializa las peticiones de velas de una sesión"""
+    with _locks_guard:
+        lock = _locks_sesion.get(iq)
+        if lock is None:
+            lock = threading.Lock()
+            _locks_sesion[iq] = lock
+        return lock
+
+
+# La conexión es compartida (sesiones HTTP y bot) y el balance activo es
+# estado de la sesión: cambiar de balance y comprar debe ser atómico para que
+# una operación demo y una real simultáneas no se crucen.
+_locks_operaciones = weakref.WeakKeyDictionary()
+
+
+def lock_operaciones(iq: IQ_Option) -> threading.RLock:
+    """Retorna el lock que serializa los cambios de balance y las compras de una sesión"""
+    with _locks_guard:
+        lock = _locks_operaciones.get(iq)
+        if lock is None:
+            lock = threading.RLock()
+            _locks_operaciones[iq] = lock
+        return lock
+
+
+# Tipos de balance de IQ Option
+TIPOS_BALANCE = {'REAL': 1, 'PRACTICE': 4}
+# Espera máxima para confirmar un cambio de balance o una conexión recién abierta
+TIMEOUT_LISTO = 5.0
+
+# Balance activo confirmado de cada sesión ('REAL' / 'PRACTICE') e IDs de sus balances
+_balance_activo = weakref.WeakKeyDictionary()
+_ids_balance = weakref.WeakKeyDictionary()
+_balance_guard = threading.Lock()
+
+
+def esperar_condicion(condicion, timeout: float = TIMEOUT_LISTO, intervalo: float = 0.05) -> bool:
+    """Espera hasta que `condicion()` sea verdadera; False si se agota el timeout"""
+    limite = time.time() + timeout
+    while True:
+        try:
+            if condicion():
+                return True
+        except Exception:
+            pass
+        if time.time() >= limite:
+            return False
+        time.sleep(intervalo)
+
+
+def _id_balance(iq: IQ_Option, tipo: str):
+    """ID del balance REAL/PRACTICE de la sesión (se consulta una sola vez)"""
+    with _balance_guard:
+        ids = _ids_balance.get(iq)
+    if ids is None:
+        ids = {}
+        try:
+            for balance in iq.get_profile_ansyc()["balances"]:
+                for nombre, codigo in TIPOS_BALANCE.items():
+                    if balance.get("type") == codigo:
+                        ids[nombre] = balance.get("id")
+        except Exception as e:
+            log.warning("No se pudieron leer los IDs de balance: %s", e)
+            return None
+        with _balance_guard:
+            _ids_balance[iq] = ids
+    return ids.get(tipo)
+
+
+def balance_activo(iq: IQ_Option) -> Optional[str]:
+    """Último balance confirmado con cambiar_balance (None si no se sabe)"""
+    with _balance_guard:
+        return _balance_activo.get(iq)
+
+
+def olvidar_balance(iq: IQ_Option):
+    """La sesión se reconectó: el broker vuelve a su balance por defecto"""
+    with _balance_guard:
+        _balance_activo.pop(iq, None)
+
+
+def cambiar_balance(iq: IQ_Option, tipo: str, timeout: float = TIMEOUT_LISTO) -> bool:
+    """
+    Activa el balance 'REAL' o 'PRACTICE' y espera a que el broker lo confirme.
+
+    Si la sesión ya está en ese balance no se envía nada. Retorna False si
+    el cambio no se confirmó dentro del timeout.
+    """
+    objetivo = _id_balance(iq, tipo)
+    if balance_activo(iq) == tipo and (objetivo is None or iq.get_balance_id() == objetivo):
+        return True
+
+    iq.change_balance(tipo)
+    if objetivo is not None and not esperar_condicion(lambda: iq.get_balance_id() == objetivo, timeout):
+        log.warning("El cambio a %s no se confirmó en %.0fs", tipo, timeout)
+        olvidar_balance(iq)
+        return False
+
+    with _balance_guard:
+        _balance_activo[iq] = tipo
+    return True
+
+
 def _connect(email: str, password: str, retries: int = 3, backoff: float = 2.0) -> IQ_Option:
     """Conecta a IQ Option con reintentos"""
     iq = IQ_Option(email, password)
@@ -25,7 +143,7 @@ def _connect(email: str, password: str, retries: int = 3, backoff: float = 2.0)
             check, reason = iq.connect()
             if check:
                 # Verificar que realmente está conectado
-                time.sleep(1)
+                esperar_condicion(iq.check_connect)
                 try:
                     # Test de conexión simple
                     iq.get_balance()
@@ -43,9 +161,223 @@ def _connect(email: str, password: str, retries: int = 3, backoff: float = 2.0)
         if i < retries:
             time.sleep(backoff * (i + 1))
     
+    _cerrar(iq)
     raise IQOptionLoginError(last_reason)
 
 
+# Cada cuánto se revisan las conexiones compartidas
+INTERVALO_SALUD = 30
+# Segundos que una conexión sin usuarios sigue abierta (logout + login no reconecta)
+GRACIA_CIERRE = 60
+# Espera máxima entre reintentos de reconexión
+MAX_BACKOFF_RECONEXION = 300
+
+
+def _cerrar(iq: IQ_Option):
+    try:
+        iq.api.close()
+    except Exception:
+        pass
+
+
+def _hash_password(password: str, sal: bytes) -> bytes:
+    return hashlib.sha256(sal + password.encode('utf-8')).digest()
+
+
+class _Conexion:
+    __slots__ = ("email", "sal", "hash_password", "iq", "usuarios", "sin_uso_desde", "backoff", "proximo_intento",
+                 "lock")
+
+    def __init__(self, email: str, password: str, iq: IQ_Option):
+        self.email = email
+        # Solo el hash con sal: el password en claro no queda en la conexión compartida
+        self.sal = os.urandom(16)
+        self.hash_password = _hash_password(password, self.sal)
+        self.iq = iq
+        self.usuarios = 0
+        self.sin_uso_desde: Optional[float] = None
+        self.backoff = 0.0
+        self.proximo_intento = 0.0
+        self.lock = threading.Lock()
+
+    def verificar_password(self, password: str) -> bool:
+        """Compara en tiempo constante (acepta passwords con caracteres no ASCII)."""
+        return hmac.compare_digest(self.hash_password, _hash_password(password, self.sal))
+
+
+class GestorConexiones:
+    """
+    Una conexión de IQ Option por cuenta, compartida por las sesiones HTTP y el bot.
+
+    `adquirir` reutiliza la conexión viva del email (validando el password
+    sin ir al broker) y `liberar` la devuelve; sin usuarios se cierra tras
+    GRACIA_CIERRE segundos. Un thread revisa cada INTERVALO_SALUD segundos
+    que las conexiones en uso sigan conectadas y las reconecta sobre el mismo
+    objeto IQ_Option, con backoff exponencial, para que quienes ya la tienen
+    no noten el cambio.
+    """
+
+    def __init__(self, intervalo: float = INTERVALO_SALUD, gracia: float = GRACIA_CIERRE):
+        self.intervalo = intervalo
+        self.gracia = gracia
+        self._lock = threading.Lock()
+        self._por_email: Dict[str, _Conexion] = {}
+        self._por_iq: Dict[int, _Conexion] = {}
+        self._locks_email: Dict[str, threading.Lock] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def adquirir(self, email: str, password: str) -> IQ_Option:
+        """Conexión viva para la cuenta; IQOptionLoginError si no se puede conectar."""
+        with self._lock:
+            lock_email = self._locks_email.setdefault(email, threading.Lock())
+
+        # Dos logins simultáneos de la misma cuenta hacen un solo handshake
+        with lock_email:
+            with self._lock:
+                conexion = self._por_email.get(email)
+                if conexion is not None and conexion.verificar_password(password):
+                    # Reservada antes de revisarla: la limpieza no la cierra mientras tanto
+                    conexion.usuarios += 1
+                    conexion.sin_uso_desde = None
+                else:
+                    conexion = None
+
+            if conexion is not None:
+                if self._conectada(conexion.iq) or self._reconectar(conexion):
+                    log.debug("Reutilizando conexión de %s", email)
+                    return conexion.iq
+                self.liberar(conexion.iq)
+
+            nueva = _Conexion(email, password, _connect(email, password))
+            nueva.usuarios = 1
+            with self._lock:
+                anterior = self._por_email.get(email)
+                self._por_email[email] = nueva
+                self._por_iq[id(nueva.iq)] = nueva
+                # La anterior sigue abierta mientras alguien la use
+                retirar = anterior is not None and anterior.usuarios == 0
+            if retirar:
+                self._retirar(anterior)
+            log.info("Nueva conexión para %s", email)
+            self._iniciar_revision()
+            return nueva.iq
+
+    def adquirir_existente(self, email: str) -> Optional[IQ_Option]:
+        """Conexión viva de la cuenta sin volver a autenticar (sesión validada en otro proceso), o None."""
+        with self._lock:
+            conexion = self._por_email.get(email)
+            if conexion is None:
+                return None
+            conexion.usuarios += 1
+            conexion.sin_uso_desde = None
+        if self._conectada(conexion.iq) or self._reconectar(conexion):
+            return conexion.iq
+        self.liberar(conexion.iq)
+        return None
+
+    def liberar(self, iq: IQ_Option):
+        """Devuelve una conexión obtenida con `adquirir`."""
+        with self._lock:
+            conexion = self._por_iq.get(id(iq))
+            if conexion is None or conexion.usuarios == 0:
+                return
+            conexion.usuarios -= 1
+            if conexion.usuarios == 0:
+                conexion.sin_uso_desde = time.time()
+                reemplazada = self._por_email.get(conexion.email) is not conexion
+            else:
+                reemplazada = False
+        if reemplazada:
+            self._retirar(conexion)
+
+    def _quitar(self, conexion: _Conexion):
+        if self._por_iq.get(id(conexion.iq)) is conexion:
+            del self._por_iq[id(conexion.iq)]
+        if self._por_email.get(conexion.email) is conexion:
+            del self._por_email[conexion.email]
+
+    def _retirar(self, conexion: _Conexion):
+        with self._lock:
+            self._quitar(conexion)
+        _cerrar(conexion.iq)
+        log.info("Conexión cerrada para %s", conexion.email)
+
+    @staticmethod
+    def _conectada(iq: IQ_Option) -> bool:
+        try:
+            return bool(iq.check_connect())
+        except Exception:
+            return False
+
+    def _reconectar(self, conexion: _Conexion) -> bool:
+        """Un intento de reconexión sobre el mismo objeto; ajusta el backoff."""
+        with conexion.lock, lock_sesion(conexion.iq):
+            if self._conectada(conexion.iq):
+                return True
+            try:
+                check, reason = conexion.iq.connect()
+            except Exception as e:
+                check, reason = False, str(e)
+            if check:
+                conexion.backoff = 0.0
+                olvidar_balance(conexion.iq)
+                log.info("Conexión de %s restablecida", conexion.email)
+                return True
+            conexion.backoff = min(max(conexion.backoff * 2, 2.0), MAX_BACKOFF_RECONEXION)
+            conexion.proximo_intento = time.time() + conexion.backoff
+            log.warning("No se pudo reconectar %s (%s); reintento en %.0fs", conexion.email, reason, conexion.backoff)
+            return False
+
+    def _iniciar_revision(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._bucle, daemon=True, name="salud-conexiones")
+                self._thread.start()
+
+    def _bucle(self):
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                self.revisar()
+            except Exception as e:
+                log.warning("Error revisando conexiones: %s", e)
+
+    def revisar(self):
+        """Cierra las conexiones sin uso y reconecta las caídas."""
+        ahora = time.time()
+        with self._lock:
+            sin_uso = [c for c in self._por_iq.values()
+                       if c.usuarios == 0 and c.sin_uso_desde is not None and ahora - c.sin_uso_desde >= self.gracia]
+            for conexion in sin_uso:
+                self._quitar(conexion)
+            en_uso = [c for c in self._por_iq.values() if c.usuarios > 0]
+
+        for conexion in sin_uso:
+            _cerrar(conexion.iq)
+            log.info("Conexión cerrada para %s", conexion.email)
+        for conexion in en_uso:
+            if ahora >= conexion.proximo_intento and not self._conectada(conexion.iq):
+                self._reconectar(conexion)
+
+    def cerrar_todas(self):
+        with self._lock:
+            conexiones = list(self._por_iq.values())
+        for conexion in conexiones:
+            self._retirar(conexion)
+
+    def estadisticas(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'conexiones': len(self._por_iq),
+                'en_uso': sum(1 for c in self._por_iq.values() if c.usuarios > 0),
+                'usuarios': sum(c.usuarios for c in self._por_iq.values())
+            }
+
+
+# Instancia única compartida por el proceso
+gestor_conexiones = GestorConexiones()
+
+
 def get_real_account_data(email: str, password: str) -> dict:
     """
     Conecta a IQ Option en REAL y devuelve datos reales
@@ -58,8 +390,7 @@ def get_real_account_data(email: str, password: str) -> dict:
         
         # Cambiar a cuenta REAL
         try:
-            iq.change_balance('REAL')
-            time.sleep(1)
+            cambiar_balance(iq, 'REAL')
         except Exception as e:
             print(f"[DEBUG] Advertencia al cambiar a REAL: {e}", file=sys.stderr)
 
@@ -78,12 +409,10 @@ def get_real_account_data(email: str, password: str) -> dict:
         # Balance de PRÁCTICA
         practice_balance = None
         try:
-            iq.change_balance('PRACTICE')
-            time.sleep(1)
+            cambiar_balance(iq, 'PRACTICE')
             practice_balance = float(iq.get_balance())
             # Volver a REAL
-            iq.change_balance('REAL')
-            time.sleep(0.5)
+            cambiar_balance(iq, 'REAL')
         except Exception as e:
             print(f"[DEBUG] Error obteniendo balance práctica: {e}", file=sys.stderr)
 
@@ -1,124 +1,614 @@
 import json
 import os
 import time
+import atexit
+import sqlite3
+import threading
 from datetime import datetime
 
-DB_FILE = 'trading_data.json'
+DB_FILE = os.environ.get('DB_FILE', 'trading_data.db')
+# Archivo JSON de versiones anteriores; se importa una sola vez
+DB_JSON_LEGADO = 'trading_data.json'
+
+# Políticas de retención del historial (0 = sin límite)
+RETENCION_DIAS = float(os.environ.get('RETENCION_DIAS', 0))
+RETENCION_MAX_OPERACIONES = int(os.environ.get('RETENCION_MAX_OPERACIONES', 0))
+# Cada cuántas operaciones nuevas se aplica la retención
+RETENCION_CADA = 100
+
+# Operaciones que incluye load_database() (lo que guardaba el JSON)
+OPERACIONES_EN_CARGA = 100
+
+# Segundos que se agrupan los cambios del bot servidor antes de escribirlos
+DEBOUNCE_ESCRITURA = float(os.environ.get('DEBOUNCE_ESCRITURA', 1.0))
+
+BOT_SERVIDOR_INICIAL = {
+    'activo': False,
+    'config': {},
+    'credenciales': None,
+    'ultima_operacion': None,
+    'estadisticas': {
+        'operaciones_ejecutadas': 0,
+        'operaciones_exitosas': 0,
+        'ganancia_total': 0.0,
+        'ultima_operacion_timestamp': None
+    }
+}
+
+# Dimensiones de los agregados; '*' agrupa todos los valores
+DIMENSIONES_AGREGADOS = ('dia', 'modo', 'activo', 'decision')
+TODOS = '*'
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_escritura_lock = threading.Lock()
+_inicializada = False
+_insertadas = 0
+
+
+def _conexion():
+    """Conexión SQLite del thread actual (una por thread, WAL permite lecturas concurrentes)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'archivo', None) != DB_FILE:
+        conn = sqlite3.connect(DB_FILE, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _local.conn = conn
+        _local.archivo = DB_FILE
+    if not _inicializada:
+        init_database()
+    return conn
+
+
+def _epoch(valor):
+    """Epoch en segundos a partir de un número, un número en texto o un ISO 8601."""
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(valor).timestamp()
+
+
+def _timestamp_numerico(valor):
+    """Como _epoch, pero con la hora actual si el valor no es válido."""
+    try:
+        return _epoch(valor)
+    except (TypeError, ValueError):
+        return time.time()
+
+
+def _json(valor):
+    return json.dumps(valor, ensure_ascii=False, default=str)
+
 
 def init_database():
     """Inicializar la base de datos si no existe"""
-    if not os.path.exists(DB_FILE):
-        data = {
-            'operaciones': [],
-            'estadisticas': {},
-            'bot_servidor': {
-                'activo': False,
-                'config': {},
-                'credenciales': None,
-                'ultima_operacion': None,
-                'estadisticas': {
-                    'operaciones_ejecutadas': 0,
-                    'operaciones_exitosas': 0,
-                    'ganancia_total': 0.0,
-                    'ultima_operacion_timestamp': None
-                }
-            }
-        }
-        save_database(data)
+    global _inicializada
+    with _init_lock:
+        if _inicializada:
+            return
+        conn = sqlite3.connect(DB_FILE, timeout=10)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS operaciones (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        ts REAL NOT NULL,
+                        modo TEXT,
+                        decision TEXT,
+                        activo TEXT,
+                        datos TEXT NOT NULL
+                    )''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_operaciones_ts ON operaciones (ts)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_operaciones_modo_ts ON operaciones (modo, ts)')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS estado (
+                        clave TEXT PRIMARY KEY,
+                        valor TEXT
+                    )''')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS agregados (
+                        dia TEXT NOT NULL,
+                        modo TEXT NOT NULL,
+                        activo TEXT NOT NULL,
+                        decision TEXT NOT NULL,
+                        operaciones INTEGER NOT NULL DEFAULT 0,
+                        ejecutadas INTEGER NOT NULL DEFAULT 0,
+                        ganadas INTEGER NOT NULL DEFAULT 0,
+                        perdidas INTEGER NOT NULL DEFAULT 0,
+                        empates INTEGER NOT NULL DEFAULT 0,
+                        ganancia REAL NOT NULL DEFAULT 0,
+                        suma_probabilidad REAL NOT NULL DEFAULT 0,
+                        con_probabilidad INTEGER NOT NULL DEFAULT 0,
+                        pico REAL NOT NULL DEFAULT 0,
+                        max_drawdown REAL NOT NULL DEFAULT 0,
+                        racha INTEGER NOT NULL DEFAULT 0,
+                        max_racha_ganadora INTEGER NOT NULL DEFAULT 0,
+                        max_racha_perdedora INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (dia, modo, activo, decision)
+                    )''')
+                conn.executemany(
+                    'INSERT OR IGNORE INTO estado (clave, valor) VALUES (?, ?)',
+                    [('estadisticas', _json({}))] +
+                    [(f'bot_servidor.{k}', _json(v)) for k, v in BOT_SERVIDOR_INICIAL.items()]
+                )
+            _completar_agregados(conn)
+            _migrar_json(conn)
+        finally:
+            conn.close()
+        _inicializada = True
+
+
+def _migrar_json(conn):
+    """Importa trading_data.json (formato anterior) la primera vez."""
+    if not os.path.exists(DB_JSON_LEGADO):
+        return
+    if conn.execute("SELECT 1 FROM estado WHERE clave = 'migrado_json'").fetchone():
+        return
 
-def load_database():
-    """Cargar la base de datos"""
     try:
-        with open(DB_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except:
-        init_database()
-        return load_database()
+        with open(DB_JSON_LEGADO, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"⚠️ No se pudo leer {DB_JSON_LEGADO} para migrar: {e}")
+        return
+
+    with conn:
+        for operacion in data.get('operaciones', []):
+            _insertar_operacion(conn, operacion)
+        _guardar_estado(conn, data)
+        conn.execute("INSERT OR REPLACE INTO estado (clave, valor) VALUES ('migrado_json', ?)",
+                     (_json(time.time()),))
+    print(f"📦 Migradas {len(data.get('operaciones', []))} operaciones desde {DB_JSON_LEGADO}")
+
+
+def _escribir(**valores):
+    """Actualiza varias claves del bot servidor en una sola transacción."""
+    conn = _conexion()
+    with conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO estado (clave, valor) VALUES (?, ?)',
+            [(f'bot_servidor.{k}', _json(v)) for k, v in valores.items()]
+        )
+
+
+def _copia(valor):
+    return dict(valor) if isinstance(valor, dict) else valor
+
+
+class EstadoBotServidor:
+    """
+    Estado del bot servidor en memoria con escritura diferida.
+
+    Las lecturas no tocan la base de datos. Los cambios se marcan como
+    pendientes y un thread los escribe juntos en una sola transacción
+    después de DEBOUNCE_ESCRITURA segundos; `activo` y `credenciales` se
+    escriben de inmediato. `detenido` es un Event que se activa en cuanto el
+    bot se detiene, así los loops pueden esperar con `esperar_detencion`.
+    """
+
+    def __init__(self, debounce: float = DEBOUNCE_ESCRITURA):
+        self.debounce = debounce
+        self.detenido = threading.Event()
+        self._lock = threading.Lock()
+        self._valores = None
+        self._pendientes = set()
+        self._hay_cambios = threading.Event()
+        self._thread = None
+        self._observadores = []
+
+    def _cargar(self):
+        if self._valores is not None:
+            return
+        valores = {k: _copia(v) for k, v in BOT_SERVIDOR_INICIAL.items()}
+        for clave, valor in _conexion().execute(
+                "SELECT clave, valor FROM estado WHERE clave LIKE 'bot_servidor.%'"):
+            valores[clave[len('bot_servidor.'):]] = json.loads(valor)
+        self._valores = valores
+        if valores.get('activo'):
+            self.detenido.clear()
+        else:
+            self.detenido.set()
+
+    def obtener(self, clave, defecto=None):
+        with self._lock:
+            self._cargar()
+            return _copia(self._valores.get(clave, defecto))
+
+    def todos(self):
+        with self._lock:
+            self._cargar()
+            return {k: _copia(v) for k, v in self._valores.items()}
+
+    @property
+    def activo(self) -> bool:
+        with self._lock:
+            self._cargar()
+        return not self.detenido.is_set()
+
+    def actualizar(self, inmediato: bool = False, **valores):
+        with self._lock:
+            self._cargar()
+            for clave, valor in valores.items():
+                self._valores[clave] = _copia(valor)
+                self._pendientes.add(clave)
+            if 'activo' in valores:
+                if valores['activo']:
+                    self.detenido.clear()
+                else:
+                    self.detenido.set()
+
+        if inmediato:
+            self.flush()
+        else:
+            self._programar()
+
+        for observador in list(self._observadores):
+            try:
+                observador(set(valores))
+            except Exception as e:
+                print(f"⚠️ Error notificando cambio del bot servidor: {e}")
+
+    def al_cambiar(self, callback):
+        """Registra un callback que recibe las claves modificadas en cada actualización"""
+        self._observadores.append(callback)
+
+    def esperar_detencion(self, timeout: float = None) -> bool:
+        """Espera hasta `timeout` segundos; True si el bot se detuvo."""
+        with self._lock:
+            self._cargar()
+        return self.detenido.wait(timeout)
+
+    def _programar(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._escritor, daemon=True,
+                                                name="escritura-bot-servidor")
+                self._thread.start()
+        self._hay_cambios.set()
+
+    def _escritor(self):
+        while True:
+            self._hay_cambios.wait()
+            time.sleep(self.debounce)
+            self._hay_cambios.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Error guardando estado del bot servidor: {e}")
+
+    def flush(self):
+        """Escribe los cambios pendientes en una sola transacción."""
+        with self._lock:
+            if not self._pendientes:
+                return
+            valores = {k: self._valores[k] for k in self._pendientes}
+            self._pendientes.clear()
+        try:
+            _escribir(**valores)
+        except Exception:
+            with self._lock:
+                self._pendientes.update(valores)
+            raise
+
+    def recargar(self):
+        """Descarta el estado en memoria (p. ej. tras save_database)."""
+        with self._lock:
+            self._valores = None
+            self._pendientes.clear()
+
+
+estado_bot = EstadoBotServidor()
+atexit.register(estado_bot.flush)
+
+
+def _guardar_estado(conn, data):
+    filas = [(f'bot_servidor.{k}', _json(v)) for k, v in data.get('bot_servidor', {}).items()]
+    if 'estadisticas' in data:
+        filas.append(('estadisticas', _json(data['estadisticas'])))
+    conn.executemany('INSERT OR REPLACE INTO estado (clave, valor) VALUES (?, ?)', filas)
+
+
+def _insertar_operacion(conn, operacion):
+    ts = _timestamp_numerico(operacion.get('timestamp'))
+    conn.execute(
+        'INSERT INTO operaciones (ts, modo, decision, activo, datos) VALUES (?, ?, ?, ?, ?)',
+        (ts, operacion.get('modo'), operacion.get('decision'), operacion.get('activo'), _json(operacion))
+    )
+    _actualizar_agregados(conn, operacion, ts)
+
+
+def _claves_agregado(operacion, ts):
+    """Grupos que actualiza una operación: total, cada dimensión sola y la combinación completa."""
+    valores = {
+        'dia': datetime.fromtimestamp(ts).strftime('%Y-%m-%d'),
+        'modo': operacion.get('modo') or 'N/A',
+        'activo': operacion.get('activo') or 'N/A',
+        # "CALL (FORZADO)" cuenta como CALL
+        'decision': str(operacion.get('decision') or 'N/A').split(' ')[0].upper()
+    }
+    claves = [(TODOS,) * len(DIMENSIONES_AGREGADOS)]
+    for dimension in DIMENSIONES_AGREGADOS:
+        claves.append(tuple(valores[d] if d == dimension else TODOS for d in DIMENSIONES_AGREGADOS))
+    claves.append(tuple(valores[d] for d in DIMENSIONES_AGREGADOS))
+    return claves
+
+
+def _actualizar_agregados(conn, operacion, ts):
+    """Suma una operación a sus agregados (win rate, P&L, drawdown y rachas)."""
+    trade = operacion.get('resultado_trade') or {}
+    finalizada = bool(trade.get('finalizada'))
+    ganancia = float(trade.get('ganancia') or 0) if finalizada else 0.0
+    win = trade.get('win') if finalizada else None
+    try:
+        probabilidad = float(operacion.get('probabilidad'))
+    except (TypeError, ValueError):
+        probabilidad = None
+
+    for clave in _claves_agregado(operacion, ts):
+        fila = conn.execute(
+            'SELECT ganancia, pico, max_drawdown, racha, max_racha_ganadora, max_racha_perdedora '
+            'FROM agregados WHERE dia = ? AND modo = ? AND activo = ? AND decision = ?', clave
+        ).fetchone() or (0.0, 0.0, 0.0, 0, 0, 0)
+        acumulado, pico, max_drawdown, racha, max_ganadora, max_perdedora = fila
+
+        if finalizada:
+            acumulado += ganancia
+            pico = max(pico, acumulado)
+            max_drawdown = max(max_drawdown, pico - acumulado)
+            if win is True:
+                racha = racha + 1 if racha > 0 else 1
+            elif win is False:
+                racha = racha - 1 if racha < 0 else -1
+            max_ganadora = max(max_ganadora, racha)
+            max_perdedora = max(max_perdedora, -racha)
+
+        conn.execute('''
+            INSERT INTO agregados (dia, modo, activo, decision, operaciones, ejecutadas, ganadas, perdidas,
+                                   empates, ganancia, suma_probabilidad, con_probabilidad, pico,
+                                   max_drawdown, racha, max_racha_ganadora, max_racha_perdedora)
+            VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (dia, modo, activo, decision) DO UPDATE SET
+                operaciones = operaciones + 1,
+                ejecutadas = ejecutadas + excluded.ejecutadas,
+                ganadas = ganadas + excluded.ganadas,
+                perdidas = perdidas + excluded.perdidas,
+                empates = empates + excluded.empates,
+                ganancia = excluded.ganancia,
+                suma_probabilidad = suma_probabilidad + excluded.suma_probabilidad,
+                con_probabilidad = con_probabilidad + excluded.con_probabilidad,
+                pico = excluded.pico,
+                max_drawdown = excluded.max_drawdown,
+                racha = excluded.racha,
+                max_racha_ganadora = excluded.max_racha_ganadora,
+                max_racha_perdedora = excluded.max_racha_perdedora
+        ''', clave + (
+            int(bool(operacion.get('ejecutado'))),
+            int(finalizada and win is True),
+            int(finalizada and win is False),
+            int(finalizada and win is None),
+            acumulado,
+            probabilidad or 0.0,
+            int(probabilidad is not None),
+            pico, max_drawdown, racha, max_ganadora, max_perdedora
+        ))
+
+
+def _completar_agregados(conn):
+    """Calcula los agregados de un historial guardado antes de que existieran."""
+    if conn.execute('SELECT 1 FROM agregados LIMIT 1').fetchone():
+        return
+    if not conn.execute('SELECT 1 FROM operaciones LIMIT 1').fetchone():
+        return
+    with conn:
+        for ts, datos in conn.execute('SELECT ts, datos FROM operaciones ORDER BY ts, id').fetchall():
+            _actualizar_agregados(conn, json.loads(datos), ts)
+    print("📊 Agregados de estadísticas calculados desde el historial")
+
+
+_COLUMNAS_AGREGADOS = ('dia', 'modo', 'activo', 'decision', 'operaciones', 'ejecutadas', 'ganadas',
+                       'perdidas', 'empates', 'ganancia', 'suma_probabilidad', 'con_probabilidad',
+                       'pico', 'max_drawdown', 'racha', 'max_racha_ganadora', 'max_racha_perdedora')
+
+
+def _fila_agregado(fila):
+    datos = dict(zip(_COLUMNAS_AGREGADOS, fila))
+    cerradas = datos['ganadas'] + datos['perdidas']
+    datos['win_rate'] = datos['ganadas'] / cerradas if cerradas else None
+    suma = datos.pop('suma_probabilidad')
+    datos['probabilidad_media'] = suma / datos['con_probabilidad'] if datos['con_probabilidad'] else None
+    datos['drawdown_actual'] = datos['pico'] - datos['ganancia']
+    return datos
+
+
+def load_database():
+    """Cargar la base de datos (mismo formato que el antiguo JSON)"""
+    estadisticas = json.loads(_conexion().execute(
+        "SELECT valor FROM estado WHERE clave = 'estadisticas'").fetchone()[0])
+
+    operaciones = obtener_historial(limit=OPERACIONES_EN_CARGA)
+    operaciones.reverse()
+    return {
+        'operaciones': operaciones,
+        'estadisticas': estadisticas,
+        'bot_servidor': estado_bot.todos()
+    }
+
 
 def save_database(data):
-    """Guardar la base de datos"""
-    with open(DB_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    """
+    Guardar la base de datos
+
+    Persiste bot_servidor y estadisticas en una transacción. El historial
+    de operaciones solo crece con agregar_operacion.
+    """
+    estado_bot.flush()
+    conn = _conexion()
+    with conn:
+        _guardar_estado(conn, data)
+    estado_bot.recargar()
+
 
 def agregar_operacion(operacion):
     """Agregar una operación al historial"""
-    data = load_database()
-    
+    global _insertadas
+
     # Agregar timestamp si no existe
     if 'timestamp' not in operacion:
         operacion['timestamp'] = time.time()
         operacion['fecha_hora'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    
-    data['operaciones'].append(operacion)
-    
-    # Mantener solo las últimas 100 operaciones
-    if len(data['operaciones']) > 100:
-        data['operaciones'] = data['operaciones'][-100:]
-    
-    save_database(data)
+
+    conn = _conexion()
+    # Un escritor a la vez: los agregados se leen y reescriben en la misma transacción
+    with _escritura_lock, conn:
+        _insertar_operacion(conn, operacion)
+
+    _insertadas += 1
+    if _insertadas % RETENCION_CADA == 0:
+        aplicar_retencion()
     return operacion
 
-def obtener_historial(limit=50):
-    """Obtener historial de operaciones"""
-    data = load_database()
-    operaciones = data.get('operaciones', [])
-    # Ordenar por timestamp descendente
-    operaciones.sort(key=lambda x: x.get('timestamp', 0), reverse=True)
-    return operaciones[:limit]
+
+def obtener_agregados(dimension=None, limite=None):
+    """
+    Estadísticas materializadas (se actualizan en cada agregar_operacion).
+
+    Sin `dimension` retorna el total; con 'dia', 'modo', 'activo' o
+    'decision' retorna un grupo por valor (los días más recientes primero).
+    Solo lee la tabla de agregados, nunca el historial. La retención no
+    descuenta operaciones de los agregados.
+    """
+    conn = _conexion()
+    columnas = ', '.join(_COLUMNAS_AGREGADOS)
+    if dimension is None:
+        fila = conn.execute(
+            f'SELECT {columnas} FROM agregados WHERE dia = ? AND modo = ? AND activo = ? AND decision = ?',
+            (TODOS,) * 4
+        ).fetchone()
+        return _fila_agregado(fila) if fila else None
+
+    if dimension not in DIMENSIONES_AGREGADOS:
+        raise ValueError(f"Dimensión inválida: {dimension}")
+    condiciones = ' AND '.join(f"{d} {'!=' if d == dimension else '='} ?" for d in DIMENSIONES_AGREGADOS)
+    consulta = f'SELECT {columnas} FROM agregados WHERE {condiciones} ORDER BY {dimension} DESC'
+    parametros = [TODOS] * len(DIMENSIONES_AGREGADOS)
+    if limite:
+        consulta += ' LIMIT ?'
+        parametros.append(int(limite))
+    return [_fila_agregado(f) for f in conn.execute(consulta, parametros)]
+
+
+def aplicar_retencion(dias=None, max_operaciones=None):
+    """Elimina operaciones según RETENCION_DIAS / RETENCION_MAX_OPERACIONES. Retorna las borradas."""
+    dias = RETENCION_DIAS if dias is None else dias
+    max_operaciones = RETENCION_MAX_OPERACIONES if max_operaciones is None else max_operaciones
+    conn = _conexion()
+    borradas = 0
+    with conn:
+        if dias and dias > 0:
+            borradas += conn.execute('DELETE FROM operaciones WHERE ts < ?',
+                                     (time.time() - dias * 86400,)).rowcount
+        if max_operaciones and max_operaciones > 0:
+            borradas += conn.execute('''
+                DELETE FROM operaciones WHERE id IN (
+                    SELECT id FROM operaciones ORDER BY ts DESC, id DESC LIMIT -1 OFFSET ?
+                )''', (max_operaciones,)).rowcount
+    return borradas
+
+
+def iterar_historial(limit=50, before_timestamp=None, before_id=None, modo=None, decision=None, desde=None,
+                     hasta=None):
+    """
+    Recorre el historial (más recientes primero) sin cargarlo completo.
+
+    Retorna tuplas (timestamp, id, json_de_la_operacion) con la operación
+    tal como está guardada. Es paginación por cursor: para la página
+    siguiente se pasan como `before_timestamp` y `before_id` el timestamp y
+    el id de la última fila recibida (sin `before_id`, las operaciones con
+    ese mismo timestamp se saltean). `decision` filtra por prefijo ("CALL"
+    incluye "CALL (FORZADO)"); `desde`/`hasta` aceptan epoch o fecha ISO.
+    """
+    condiciones, parametros = [], []
+    if before_timestamp is not None and before_id is not None:
+        condiciones.append('(ts, id) < (?, ?)')
+        parametros.extend((float(before_timestamp), int(before_id)))
+    elif before_timestamp is not None:
+        condiciones.append('ts < ?')
+        parametros.append(float(before_timestamp))
+    if modo:
+        condiciones.append('modo = ?')
+        parametros.append(modo)
+    if decision:
+        condiciones.append('decision LIKE ?')
+        parametros.append(decision.upper() + '%')
+    if desde is not None:
+        condiciones.append('ts >= ?')
+        parametros.append(_epoch(desde))
+    if hasta is not None:
+        condiciones.append('ts <= ?')
+        parametros.append(_epoch(hasta))
+
+    consulta = 'SELECT ts, id, datos FROM operaciones'
+    if condiciones:
+        consulta += ' WHERE ' + ' AND '.join(condiciones)
+    consulta += ' ORDER BY ts DESC, id DESC LIMIT ?'
+    parametros.append(int(limit))
+
+    yield from _conexion().execute(consulta, parametros)
+
+
+def obtener_historial(limit=50, **filtros):
+    """Obtener historial de operaciones (más recientes primero)"""
+    return [json.loads(datos) for _, _, datos in iterar_historial(limit, **filtros)]
+
 
 def actualizar_estadisticas_bot(estadisticas):
     """Actualizar estadísticas del bot servidor"""
-    data = load_database()
-    data['bot_servidor']['estadisticas'] = estadisticas
-    save_database(data)
+    estado_bot.actualizar(estadisticas=estadisticas)
+
 
 def obtener_estadisticas_bot():
     """Obtener estadísticas del bot servidor"""
-    data = load_database()
-    return data['bot_servidor']['estadisticas']
+    return estado_bot.obtener('estadisticas', BOT_SERVIDOR_INICIAL['estadisticas'])
+
 
 def guardar_config_bot(config):
     """Guardar configuración del bot servidor"""
-    data = load_database()
-    data['bot_servidor']['config'] = config
-    data['bot_servidor']['activo'] = True
-    save_database(data)
+    estado_bot.actualizar(inmediato=True, config=config, activo=True)
+
 
 def obtener_credenciales_bot():
     """Obtener credenciales del bot servidor"""
-    data = load_database()
-    return data['bot_servidor'].get('credenciales')
+    return estado_bot.obtener('credenciales')
+
 
 def guardar_credenciales_bot(credenciales):
     """Guardar credenciales del bot servidor"""
-    data = load_database()
-    data['bot_servidor']['credenciales'] = credenciales
-    save_database(data)
+    estado_bot.actualizar(inmediato=True, credenciales=credenciales)
+
 
 def obtener_ultima_operacion_bot():
     """Obtener la última operación del bot servidor"""
-    data = load_database()
-    return data['bot_servidor'].get('ultima_operacion')
+    return estado_bot.obtener('ultima_operacion')
+
 
 def guardar_ultima_operacion_bot(operacion):
     """Guardar la última operación del bot servidor"""
-    data = load_database()
-    data['bot_servidor']['ultima_operacion'] = operacion
-    save_database(data)
+    estado_bot.actualizar(ultima_operacion=operacion)
+
 
 def limpiar_credenciales_bot():
     """Limpiar credenciales del bot servidor"""
-    data = load_database()
-    data['bot_servidor']['credenciales'] = None
-    save_database(data)
+    estado_bot.actualizar(inmediato=True, credenciales=None)
+
 
 def detener_bot_servidor():
     """Detener el bot servidor en la base de datos"""
-    data = load_database()
-    data['bot_servidor']['activo'] = False
-    save_database(data)
+    estado_bot.actualizar(inmediato=True, activo=False)
+
 
 def esta_activo_bot_servidor():
-    """Verificar si el bot servidor está activo"""
-    data = load_database()
-    return data['bot_servidor']['activo']
+    """Verificar si el bot servidor está activo (en memoria)"""
+    return estado_bot.activo
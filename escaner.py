@@ -0,0 +1,108 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from operar import (
+    FEATURES, REGIME_FEATURE, TIMEFRAME, FEATURES_INCREMENTALES,
+    get_latest_market_data, calcular_features, calcular_features_incremental,
+    decision_desde_probabilidad, obtener_modelo, umbrales_vigentes
+)
+from bitacora import obtener_logger
+
+log = obtener_logger("escaner")
+
+MAX_WORKERS_ESCANEO = 8
+
+
+def _features_activo(iq, activo: str, timeframe: int):
+    """Descarga velas de un activo y retorna su última fila de features."""
+    df = get_latest_market_data(iq, activo, timeframe)
+
+    if FEATURES_INCREMENTALES:
+        df_feat = calcular_features_incremental(df, activo, timeframe)
+    else:
+        df_feat = calcular_features(df)
+
+    if df_feat.empty:
+        raise ValueError("No se pudieron calcular features")
+    return df_feat.iloc[-1]
+
+
+def escanear_activos(iq, activos: List[str], timeframe: int = TIMEFRAME,
+                     max_workers: int = MAX_WORKERS_ESCANEO, forzar: bool = False,
+                     modelo=None) -> List[Dict[str, Any]]:
+    """
+    Evalúa varios activos en un solo ciclo y retorna las señales ordenadas.
+
+    La descarga y el cálculo de features corren en un pool acotado que
+    comparte la sesión `iq` (las peticiones de velas se serializan con
+    `lock_sesion`, el resto del trabajo se solapa); luego todas las filas se
+    puntúan con una única llamada a `predict`. Primero van las señales
+    CALL/PUT, de mayor a menor distancia de la probabilidad a 0.5, y después
+    los SKIP y errores.
+    """
+    if not activos:
+        return []
+
+    modelo = modelo or obtener_modelo()
+    umbrales = umbrales_vigentes()
+    inicio = time.time()
+    filas: Dict[str, Any] = {}
+    resultados: List[Dict[str, Any]] = []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(activos))),
+                            thread_name_prefix="escaner") as pool:
+        futuros = {pool.submit(_features_activo, iq, activo, timeframe): activo for activo in activos}
+        for futuro in as_completed(futuros):
+            activo = futuros[futuro]
+            try:
+                filas[activo] = futuro.result()
+            except Exception as e:
+                log.warning("Error escaneando %s: %s", activo, e)
+                resultados.append({
+                    "activo": activo, "decision": "ERROR", "tipo": None,
+                    "razon": str(e), "probabilidad": None, "fuerza": 0.0
+                })
+
+    # Filtro de régimen antes de puntuar
+    candidatos = []
+    for activo in activos:
+        fila = filas.get(activo)
+        if fila is None:
+            continue
+        regime_value = float(fila[REGIME_FEATURE])
+        if not forzar and regime_value < umbrales['regime_cutoff']:
+            resultados.append({
+                "activo": activo, "decision": "SKIP", "tipo": None,
+                "razon": f"Volatilidad baja ({regime_value:.6f})",
+                "probabilidad": None, "fuerza": 0.0
+            })
+        else:
+            candidatos.append(activo)
+
+    # Una sola llamada al modelo para todos los activos
+    if candidatos:
+        X = np.vstack([filas[a][FEATURES].to_numpy(dtype=np.float64) for a in candidatos])
+        probas = modelo.predict(X)
+        for activo, proba in zip(candidatos, probas):
+            decision = decision_desde_probabilidad(float(proba), umbrales)
+            resultados.append({
+                "activo": activo,
+                "decision": decision["decision"],
+                "tipo": decision["tipo"],
+                "razon": decision["razon"],
+                "probabilidad": float(proba),
+                "fuerza": abs(float(proba) - 0.5)
+            })
+
+    resultados.sort(key=lambda r: (r["tipo"] is None, -r["fuerza"]))
+    log.info("Escaneo de %d activos en %.2fs: %d señales", len(activos), time.time() - inicio,
+             sum(1 for r in resultados if r['tipo']))
+    return resultados
+
+
+def mejor_senal(resultados: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Retorna la señal más fuerte del escaneo, o None si no hay ninguna."""
+    return resultados[0] if resultados and resultados[0]["tipo"] else None
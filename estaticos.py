@@ -0,0 +1,154 @@
+import os
+import gzip
+import hashlib
+import mimetypes
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+try:
+    import brotli  # opcional: variante .br si está instalado
+except ImportError:
+    brotli = None
+
+# Archivos más grandes (y los videos) se sirven desde disco con sendfile y soporte de Range
+MAX_BYTES_EN_MEMORIA = 1 << 20
+# Por debajo de este tamaño no vale la pena comprimir
+MIN_BYTES_COMPRESION = 512
+
+TIPOS_COMPRIMIBLES = ('text/', 'application/javascript', 'application/json', 'application/xml',
+                      'image/svg+xml')
+
+# La raíz estática es el directorio de la app: junto a index.html viven la base
+# (con los tokens de sesión), los umbrales, las velas grabadas y el código
+EXTENSIONES_PRIVADAS = ('.db', '.db-wal', '.db-shm', '.db-journal', '.json', '.jsonl', '.npz', '.py', '.pyc',
+                        '.txt', '.toml', '.patch')
+DIRECTORIOS_PRIVADOS = ('velas', '__pycache__', 'benchmarks')
+
+mimetypes.add_type('application/javascript', '.js')
+mimetypes.add_type('video/quicktime', '.mov')
+mimetypes.add_type('video/mp4', '.mp4')
+
+
+def tipo_mime(ruta: str) -> str:
+    tipo = mimetypes.guess_type(ruta)[0] or 'application/octet-stream'
+    if tipo.startswith('text/') or tipo in ('application/javascript', 'application/json'):
+        tipo += '; charset=utf-8'
+    return tipo
+
+
+class Recurso:
+    """Un archivo estático con sus metadatos y, si es chico, su contenido y variantes comprimidas."""
+
+    __slots__ = ("ruta", "tamano", "mtime", "mtime_ns", "etag", "ultima_modificacion", "tipo",
+                 "contenido", "variantes")
+
+    def __init__(self, ruta: str, stat: os.stat_result):
+        self.ruta = ruta
+        self.tamano = stat.st_size
+        self.mtime = stat.st_mtime
+        self.mtime_ns = stat.st_mtime_ns
+        self.ultima_modificacion = formatdate(stat.st_mtime, usegmt=True)
+        self.tipo = tipo_mime(ruta)
+        self.contenido: Optional[bytes] = None
+        self.variantes: Dict[str, bytes] = {}
+
+        # Video/audio siempre desde disco: los navegadores los piden por rangos
+        if self.tamano <= MAX_BYTES_EN_MEMORIA and not self.tipo.startswith(('video/', 'audio/')):
+            with open(ruta, 'rb') as f:
+                self.contenido = f.read()
+            self.etag = '"%s"' % hashlib.sha1(self.contenido).hexdigest()[:20]
+            if self.tamano >= MIN_BYTES_COMPRESION and self.tipo.startswith(TIPOS_COMPRIMIBLES):
+                self.variantes['gzip'] = gzip.compress(self.contenido, compresslevel=9, mtime=0)
+                if brotli is not None:
+                    self.variantes['br'] = brotli.compress(self.contenido)
+        else:
+            self.etag = '"%x-%x"' % (self.tamano, self.mtime_ns)
+
+    def vigente(self, stat: os.stat_result) -> bool:
+        return stat.st_size == self.tamano and stat.st_mtime_ns == self.mtime_ns
+
+    def codificacion_para(self, accept_encoding: str) -> Optional[str]:
+        """Mejor variante comprimida aceptada por el cliente (br antes que gzip)."""
+        aceptadas = {parte.split(';')[0].strip().lower() for parte in accept_encoding.split(',')}
+        for codificacion in ('br', 'gzip'):
+            if codificacion in self.variantes and codificacion in aceptadas:
+                return codificacion
+        return None
+
+    def no_modificado(self, if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+        """Condiciones para responder 304 (If-None-Match tiene prioridad)."""
+        if if_none_match:
+            etags = {e.strip() for e in if_none_match.split(',')}
+            return '*' in etags or self.etag in etags or ('W/' + self.etag) in etags
+        if if_modified_since:
+            try:
+                return int(self.mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def rango(self, cabecera: Optional[str]) -> Optional[Tuple[int, int]]:
+        """
+        Interpreta un header Range de un solo rango.
+
+        Retorna (inicio, fin) inclusivo, None si no hay rango utilizable (se
+        envía el archivo completo) o (-1, -1) si el rango es insatisfacible.
+        """
+        if not cabecera or not cabecera.startswith('bytes=') or ',' in cabecera:
+            return None
+        inicio_txt, _, fin_txt = cabecera[len('bytes='):].strip().partition('-')
+        try:
+            if inicio_txt == '':
+                largo = int(fin_txt)
+                if largo <= 0:
+                    return (-1, -1)
+                return (max(self.tamano - largo, 0), self.tamano - 1)
+            inicio = int(inicio_txt)
+            fin = int(fin_txt) if fin_txt else self.tamano - 1
+        except ValueError:
+            return None
+        if inicio >= self.tamano or fin < inicio:
+            return (-1, -1)
+        return (inicio, min(fin, self.tamano - 1))
+
+
+class CacheEstaticos:
+    """
+    Cache en memoria de los archivos estáticos del servidor.
+
+    Cada petición solo hace un `stat`; el archivo se vuelve a leer (y a
+    comprimir) únicamente si cambió su tamaño o fecha de modificación.
+    """
+
+    def __init__(self, raiz: str):
+        self.raiz = os.path.abspath(raiz)
+        self._lock = threading.Lock()
+        self._recursos: Dict[str, Recurso] = {}
+
+    def resolver(self, ruta_url: str) -> Optional[str]:
+        """Ruta absoluta dentro de la raíz, o None si intenta salir de ella o es un archivo privado."""
+        ruta = os.path.abspath(os.path.join(self.raiz, ruta_url.lstrip('/')))
+        if ruta != self.raiz and not ruta.startswith(self.raiz + os.sep):
+            return None
+        partes = os.path.relpath(ruta, self.raiz).split(os.sep)
+        if partes[0] in DIRECTORIOS_PRIVADOS or any(p.startswith('.') and p != '.' for p in partes):
+            return None
+        if ruta.lower().endswith(EXTENSIONES_PRIVADAS):
+            return None
+        return ruta
+
+    def obtener(self, ruta: str) -> Recurso:
+        """Recurso vigente para una ruta absoluta; FileNotFoundError si no existe."""
+        stat = os.stat(ruta)
+        if not os.path.isfile(ruta):
+            raise FileNotFoundError(ruta)
+        with self._lock:
+            recurso = self._recursos.get(ruta)
+        if recurso is not None and recurso.vigente(stat):
+            return recurso
+
+        recurso = Recurso(ruta, stat)
+        with self._lock:
+            self._recursos[ruta] = recurso
+        return recurso
@@ -0,0 +1,86 @@
+import json
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+# Eventos que se guardan por suscriptor antes de descartar los más viejos
+MAX_EVENTOS_EN_COLA = 100
+# Cada cuánto se envía un comentario SSE para mantener viva la conexión
+INTERVALO_PING = 15
+
+
+class Suscriptor:
+    """Cola de eventos de una conexión (un dashboard abierto)."""
+
+    def __init__(self, email: Optional[str]):
+        self.email = email
+        self.cola: queue.Queue = queue.Queue(maxsize=MAX_EVENTOS_EN_COLA)
+        # Se llama después de cada entrega (el servidor asyncio despierta su tarea)
+        self.al_entregar: Optional[Callable[[], None]] = None
+
+    def entregar(self, evento: Dict[str, Any]):
+        # Un cliente lento pierde los eventos más viejos, nunca bloquea al que publica
+        while True:
+            try:
+                self.cola.put_nowait(evento)
+                break
+            except queue.Full:
+                try:
+                    self.cola.get_nowait()
+                except queue.Empty:
+                    pass
+        if self.al_entregar is not None:
+            self.al_entregar()
+
+    def siguiente(self, timeout: float = INTERVALO_PING) -> Optional[Dict[str, Any]]:
+        try:
+            return self.cola.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class BusEventos:
+    """
+    Publicación de eventos en proceso para el canal SSE (/eventos).
+
+    `publicar` no bloquea: deja el evento en la cola de cada suscriptor. Los
+    eventos con `destinatario` solo llegan a las conexiones de ese email.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._suscriptores = set()
+
+    def suscribir(self, email: Optional[str] = None) -> Suscriptor:
+        suscriptor = Suscriptor(email)
+        with self._lock:
+            self._suscriptores.add(suscriptor)
+        return suscriptor
+
+    def cancelar(self, suscriptor: Suscriptor):
+        with self._lock:
+            self._suscriptores.discard(suscriptor)
+
+    def publicar(self, tipo: str, datos: Dict[str, Any], destinatario: Optional[str] = None):
+        evento = {'tipo': tipo, 'datos': datos, 'timestamp': time.time()}
+        with self._lock:
+            suscriptores = [s for s in self._suscriptores
+                            if destinatario is None or s.email == destinatario]
+        for suscriptor in suscriptores:
+            suscriptor.entregar(evento)
+
+    @property
+    def conexiones(self) -> int:
+        with self._lock:
+            return len(self._suscriptores)
+
+
+def formato_sse(evento: Dict[str, Any]) -> bytes:
+    """Serializa un evento con el formato de text/event-stream."""
+    datos = json.dumps(dict(evento['datos'], timestamp_evento=evento['timestamp']), default=str)
+    return f"event: {evento['tipo']}\ndata: {datos}\n\n".encode('utf-8')
+
+
+# Instancia única compartida por el proceso
+bus_eventos = BusEventos()
@@ -0,0 +1,292 @@
+import sys
+import math
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Mismos parámetros que usa calcular_features con la librería `ta`
+RSI_WINDOW = 14
+EMA_RAPIDA = 20
+EMA_LENTA = 50
+MACD_FAST, MACD_SLOW, MACD_SIGN = 12, 26, 9
+BB_WINDOW, BB_DEV = 20, 2
+ATR_WINDOW = 14
+VOL_WINDOW = 10
+
+# Velas necesarias para que todas las features dejen de ser NaN (ema_50)
+VELAS_MINIMAS = EMA_LENTA
+
+COLUMNAS_FEATURES = [
+    "rsi_14", "ema_20", "ema_50",
+    "macd", "macd_signal", "macd_hist",
+    "bb_high", "bb_low", "bb_width",
+    "atr_14",
+    "ret_1", "ret_3", "ret_6", "vol_10",
+    "harami"
+]
+
+
+def _alpha_span(span: int) -> float:
+    return 2.0 / (span + 1.0)
+
+
+def _ema(anterior: Optional[float], valor: float, alpha: float) -> float:
+    """Paso de una EMA con adjust=False (la primera observación es la semilla)."""
+    return valor if anterior is None else anterior + alpha * (valor - anterior)
+
+
+class EstadoIndicadores:
+    """
+    Estado incremental de todos los indicadores de FEATURES para un activo/timeframe.
+
+    Cada vela cerrada se incorpora en O(1) con `actualizar`. Las recurrencias
+    son las mismas que usa `ta` (EMA con adjust=False, RSI y ATR de Wilder,
+    Bollinger con ddof=0), así que sobre la misma serie los valores coinciden
+    con el cálculo batch. Con `verificar=True` se guarda la serie completa y
+    cada actualización se compara contra `calcular_features`.
+    """
+
+    def __init__(self, verificar: bool = False, rtol: float = 1e-6, atol: float = 1e-9):
+        self.lock = threading.Lock()
+        self.verificar = verificar
+        self.rtol = rtol
+        self.atol = atol
+        self.divergencias: List[Dict[str, Any]] = []
+        self._historial: List[Dict[str, float]] = []
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Descarta todo el estado acumulado"""
+        self.n = 0
+        self.ultimo_ts = None
+        self.ultimas_features: Optional[Dict[str, float]] = None
+        self.prev: Optional[Tuple[float, float, float, float]] = None  # open, high, low, close
+        self.rsi_up = None
+        self.rsi_dn = None
+        self.ema_rapida = None
+        self.ema_lenta = None
+        self.ema_fast = None
+        self.ema_slow = None
+        self.macd_signal = None
+        self.macd_obs = 0
+        self.atr = 0.0
+        self.tr_suma = 0.0
+        self.closes_bb = deque(maxlen=BB_WINDOW)
+        self.closes_ret = deque(maxlen=7)
+        self.rets = deque(maxlen=VOL_WINDOW)
+        self._historial = []
+
+    @property
+    def listo(self) -> bool:
+        return self.n >= VELAS_MINIMAS
+
+    def _clonar(self) -> "EstadoIndicadores":
+        copia = EstadoIndicadores.__new__(EstadoIndicadores)
+        copia.__dict__.update(self.__dict__)
+        copia.closes_bb = deque(self.closes_bb, maxlen=BB_WINDOW)
+        copia.closes_ret = deque(self.closes_ret, maxlen=7)
+        copia.rets = deque(self.rets, maxlen=VOL_WINDOW)
+        copia.verificar = False
+        return copia
+
+    def _paso(self, o: float, h: float, l: float, c: float) -> Dict[str, float]:
+        """Incorpora una vela al estado y retorna sus features (NaN si aún no hay datos)."""
+        nan = float('nan')
+        indice = self.n
+
+        # --- RSI (Wilder, alpha = 1/14; la primera diferencia cuenta como 0) ---
+        diff = 0.0 if self.prev is None else c - self.prev[3]
+        self.rsi_up = _ema(self.rsi_up, max(diff, 0.0), 1.0 / RSI_WINDOW)
+        self.rsi_dn = _ema(self.rsi_dn, max(-diff, 0.0), 1.0 / RSI_WINDOW)
+        if indice + 1 < RSI_WINDOW:
+            rsi = nan
+        elif self.rsi_dn == 0:
+            rsi = 100.0
+        else:
+            rsi = 100.0 - 100.0 / (1.0 + self.rsi_up / self.rsi_dn)
+
+        # --- EMAs ---
+        self.ema_rapida = _ema(self.ema_rapida, c, _alpha_span(EMA_RAPIDA))
+        self.ema_lenta = _ema(self.ema_lenta, c, _alpha_span(EMA_LENTA))
+
+        # --- MACD (la señal arranca en el primer MACD válido) ---
+        self.ema_fast = _ema(self.ema_fast, c, _alpha_span(MACD_FAST))
+        self.ema_slow = _ema(self.ema_slow, c, _alpha_span(MACD_SLOW))
+        macd = macd_signal = nan
+        if indice + 1 >= MACD_SLOW:
+            macd = self.ema_fast - self.ema_slow
+            self.macd_signal = _ema(self.macd_signal, macd, _alpha_span(MACD_SIGN))
+            self.macd_obs += 1
+            if self.macd_obs >= MACD_SIGN:
+                macd_signal = self.macd_signal
+
+        # --- Bollinger (ddof=0) ---
+        self.closes_bb.append(c)
+        bb_high = bb_low = nan
+        if len(self.closes_bb) == BB_WINDOW:
+            media = math.fsum(self.closes_bb) / BB_WINDOW
+            desv = math.sqrt(math.fsum((x - media) ** 2 for x in self.closes_bb) / BB_WINDOW)
+            bb_high = media + BB_DEV * desv
+            bb_low = media - BB_DEV * desv
+
+        # --- ATR (media simple de las primeras 14 TR y luego Wilder; 0 antes) ---
+        if self.prev is None:
+            tr = h - l
+        else:
+            pc = self.prev[3]
+            tr = max(h - l, abs(h - pc), abs(l - pc))
+        if indice < ATR_WINDOW:
+            self.tr_suma += tr
+            if indice == ATR_WINDOW - 1:
+                self.atr = self.tr_suma / ATR_WINDOW
+        else:
+            self.atr = (self.atr * (ATR_WINDOW - 1) + tr) / ATR_WINDOW
+
+        # --- Retornos y volatilidad ---
+        self.closes_ret.append(c)
+
+        def _ret(k):
+            if len(self.closes_ret) <= k:
+                return nan
+            return c / self.closes_ret[-1 - k] - 1.0
+
+        ret_1 = _ret(1)
+        if not math.isnan(ret_1):
+            self.rets.append(ret_1)
+        vol_10 = nan
+        if len(self.rets) == VOL_WINDOW:
+            media = math.fsum(self.rets) / VOL_WINDOW
+            vol_10 = math.sqrt(math.fsum((x - media) ** 2 for x in self.rets) / (VOL_WINDOW - 1))
+
+        # --- Harami contra la vela anterior ---
+        harami = 0
+        if self.prev is not None:
+            po, pc = self.prev[0], self.prev[3]
+            inside = max(o, c) <= max(po, pc) and min(o, c) >= min(po, pc)
+            harami = int(abs(c - o) < abs(pc - po) and inside)
+
+        self.prev = (o, h, l, c)
+        self.n += 1
+
+        return {
+            "open": o, "high": h, "low": l, "close": c,
+            "rsi_14": rsi,
+            "ema_20": self.ema_rapida if self.n >= EMA_RAPIDA else nan,
+            "ema_50": self.ema_lenta if self.n >= EMA_LENTA else nan,
+            "macd": macd,
+            "macd_signal": macd_signal,
+            "macd_hist": macd - macd_signal,
+            "bb_high": bb_high,
+            "bb_low": bb_low,
+            "bb_width": (bb_high - bb_low) / c,
+            "atr_14": self.atr,
+            "ret_1": ret_1,
+            "ret_3": _ret(3),
+            "ret_6": _ret(6),
+            "vol_10": vol_10,
+            "harami": harami
+        }
+
+    @staticmethod
+    def _ohlc(vela) -> Tuple[float, float, float, float]:
+        return float(vela["open"]), float(vela["high"]), float(vela["low"]), float(vela["close"])
+
+    def actualizar(self, vela, ts=None) -> Dict[str, float]:
+        """Incorpora una vela cerrada y retorna sus features."""
+        o, h, l, c = self._ohlc(vela)
+        features = self._paso(o, h, l, c)
+        self.ultimo_ts = ts
+        self.ultimas_features = features
+
+        if self.verificar:
+            self._historial.append({"open": o, "high": h, "low": l, "close": c})
+            self._verificar_ultima(features)
+
+        return features
+
+    def provisional(self, vela) -> Dict[str, float]:
+        """Features de una vela que aún no cerró, sin modificar el estado."""
+        return self._clonar()._paso(*self._ohlc(vela))
+
+    def _verificar_ultima(self, features: Dict[str, float]):
+        """Compara la última vela contra el cálculo batch con `ta`."""
+        if not self.listo:
+            return
+
+        from operar import calcular_features
+        batch = calcular_features(pd.DataFrame(self._historial))
+        if batch.empty:
+            return
+
+        fila = batch.iloc[-1]
+        for col in COLUMNAS_FEATURES:
+            esperado = float(fila[col])
+            obtenido = float(features[col])
+            if not np.isclose(obtenido, esperado, rtol=self.rtol, atol=self.atol):
+                divergencia = {'vela': self.n - 1, 'feature': col, 'incremental': obtenido, 'batch': esperado}
+                self.divergencias.append(divergencia)
+                print(f"⚠️ Divergencia en {col} (vela {self.n - 1}): "
+                      f"incremental={obtenido:.10g} batch={esperado:.10g}", file=sys.stderr)
+
+
+def verificar_contra_batch(df: pd.DataFrame, rtol: float = 1e-6, atol: float = 1e-9,
+                           ventana: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Alimenta todas las velas de `df` al estado incremental y compara cada fila
+    contra `calcular_features(df)`. Retorna la diferencia máxima por feature.
+
+    Con `ventana` (NUM_VELAS en vivo) cada fila se compara contra el cálculo
+    batch de las `ventana` velas que terminan en ella, que es lo que ve el
+    modelo sin features incrementales: mide la deriva de las EMAs por usar
+    toda la historia en lugar de la ventana.
+    """
+    from operar import calcular_features
+
+    estado = EstadoIndicadores()
+    filas = [estado.actualizar(vela) for vela in df[["open", "high", "low", "close"]].to_dict('records')]
+    incremental = pd.DataFrame(filas, index=df.index)
+    if ventana:
+        referencia = [calcular_features(df.iloc[i - ventana + 1:i + 1]).iloc[-1:]
+                      for i in range(ventana - 1, len(df))]
+        referencia = [r for r in referencia if not r.empty]
+        batch = pd.concat(referencia) if referencia else calcular_features(df.iloc[:0])
+    else:
+        batch = calcular_features(df)
+    incremental = incremental.loc[batch.index]
+
+    diferencias = {}
+    ok = True
+    for col in COLUMNAS_FEATURES:
+        a = incremental[col].to_numpy(dtype=np.float64)
+        b = batch[col].to_numpy(dtype=np.float64)
+        diferencias[col] = float(np.max(np.abs(a - b))) if len(a) else 0.0
+        ok = ok and bool(np.allclose(a, b, rtol=rtol, atol=atol))
+
+    return {'filas': len(batch), 'max_diferencia': diferencias, 'ok': ok}
+
+
+class RegistroEstados:
+    """Estados incrementales compartidos por el proceso, uno por (activo, timeframe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._estados: Dict[Tuple[str, int], EstadoIndicadores] = {}
+
+    def obtener(self, activo: str, timeframe: int, verificar: bool = False) -> EstadoIndicadores:
+        clave = (activo, int(timeframe))
+        with self._lock:
+            estado = self._estados.get(clave)
+            if estado is None:
+                estado = EstadoIndicadores(verificar=verificar)
+                self._estados[clave] = estado
+            return estado
+
+    def eliminar(self, activo: str, timeframe: int):
+        with self._lock:
+            self._estados.pop((activo, int(timeframe)), None)
+
+
+registro_estados = RegistroEstados()
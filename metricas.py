@@ -0,0 +1,194 @@
+import time
+import bisect
+import threading
+import contextlib
+from typing import Callable, Dict, List, Tuple
+
+# Límites (segundos) de los histogramas: del predict (ms) a la liquidación (~1 min)
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(nombres: Tuple[str, ...], valores: Tuple, extra: str = '') -> str:
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return '{' + ','.join(partes) + '}' if partes else ''
+
+
+def _numero(valor: float) -> str:
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+
+class _Metrica:
+    tipo = ''
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+
+    def _clave(self, valores: Tuple) -> Tuple:
+        if len(valores) != len(self.etiquetas):
+            raise ValueError(f"{self.nombre} espera etiquetas {self.etiquetas}, recibió {valores}")
+        return tuple(str(v) for v in valores)
+
+    def _cabecera(self) -> List[str]:
+        return [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} {self.tipo}']
+
+
+class Contador(_Metrica):
+    """Contador monótono por combinación de etiquetas."""
+
+    tipo = 'counter'
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = ()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self._valores: Dict[Tuple, float] = {}
+
+    def inc(self, *etiquetas, valor: float = 1.0):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0.0) + valor
+
+    def exportar(self) -> List[str]:
+        with self._lock:
+            valores = sorted(self._valores.items())
+        return self._cabecera() + [f'{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(v)}'
+                                   for clave, v in valores]
+
+
+class Histograma(_Metrica):
+    """
+    Histograma con buckets fijos por combinación de etiquetas.
+
+    Observar cuesta una búsqueda binaria y un incremento bajo lock; los
+    buckets acumulados del formato Prometheus se arman solo al exportar.
+    """
+
+    tipo = 'histogram'
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, List] = {}
+
+    def observar(self, valor: float, *etiquetas):
+        clave = self._clave(etiquetas)
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                # conteos por bucket (el último es +Inf), suma
+                serie = self._series[clave] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][indice] += 1
+            serie[1] += valor
+
+    @contextlib.contextmanager
+    def medir(self, *etiquetas):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, *etiquetas)
+
+    def exportar(self) -> List[str]:
+        with self._lock:
+            series = sorted((clave, list(conteos), suma) for clave, (conteos, suma) in self._series.items())
+        lineas = self._cabecera()
+        for clave, conteos, suma in series:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + (float('inf'),), conteos):
+                acumulado += conteo
+                etiquetas = _etiquetas(self.etiquetas, clave, f'le="{_numero(limite)}"')
+                lineas.append(f'{self.nombre}_bucket{etiquetas} {acumulado}')
+            lineas.append(f'{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {_numero(suma)}')
+            lineas.append(f'{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {acumulado}')
+        return lineas
+
+
+class Medidor(_Metrica):
+    """Valor instantáneo que se lee de una función al exportar."""
+
+    tipo = 'gauge'
+
+    def __init__(self, nombre: str, ayuda: str, funcion: Callable[[], float]):
+        super().__init__(nombre, ayuda)
+        self.funcion = funcion
+
+    def exportar(self) -> List[str]:
+        try:
+            valor = float(self.funcion())
+        except Exception:
+            return []
+        return self._cabecera() + [f'{self.nombre} {_numero(valor)}']
+
+
+class RegistroMetricas:
+    """Métricas del proceso en formato de texto de Prometheus (ruta /metrics)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metricas: Dict[str, _Metrica] = {}
+
+    def _registrar(self, metrica: _Metrica) -> _Metrica:
+        with self._lock:
+            # Registrar dos veces el mismo nombre devuelve la métrica existente
+            return self._metricas.setdefault(metrica.nombre, metrica)
+
+    def contador(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = ()) -> Contador:
+        return self._registrar(Contador(nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = (),
+                   buckets: Tuple[float, ...] = BUCKETS_SEGUNDOS) -> Histograma:
+        return self._registrar(Histograma(nombre, ayuda, etiquetas, buckets))
+
+    def medidor(self, nombre: str, ayuda: str, funcion: Callable[[], float]) -> Medidor:
+        return self._registrar(Medidor(nombre, ayuda, funcion))
+
+    def exportar(self) -> str:
+        with self._lock:
+            metricas = list(self._metricas.values())
+        lineas = []
+        for metrica in metricas:
+            lineas.extend(metrica.exportar())
+        return '\n'.join(lineas) + '\n'
+
+
+# Instancia única compartida por el proceso
+registro_metricas = RegistroMetricas()
+
+duracion_etapas = registro_metricas.histograma(
+    'synapse_etapa_duracion_segundos',
+    'Duración de cada etapa de ejecutar_operacion (balance, modelo, velas, features, predict, compra, liquidacion)',
+    ('etapa',))
+errores_etapas = registro_metricas.contador(
+    'synapse_etapa_errores_total', 'Etapas que terminaron con una excepción', ('etapa',))
+operaciones_liquidadas = registro_metricas.contador(
+    'synapse_operaciones_liquidadas_total', 'Operaciones liquidadas por resultado', ('resultado',))
+peticiones_http = registro_metricas.contador(
+    'synapse_http_peticiones_total', 'Peticiones HTTP atendidas', ('metodo', 'ruta', 'codigo'))
+duracion_http = registro_metricas.histograma(
+    'synapse_http_duracion_segundos', 'Duración de las peticiones HTTP', ('metodo', 'ruta'))
+
+
+@contextlib.contextmanager
+def medir_etapa(etapa: str):
+    """Mide una etapa del camino señal → orden; las excepciones se cuentan y se propagan."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        errores_etapas.inc(etapa)
+        raise
+    finally:
+        duracion_etapas.observar(time.perf_counter() - inicio, etapa)
@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+
+def _hash_archivo(ruta: str) -> str:
+    """Calcula el hash SHA-256 del contenido de un archivo."""
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 16), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+class RegistroModelos:
+    """
+    Cache de modelos compartida por todo el proceso.
+
+    Cada modelo se carga una sola vez y se reutiliza entre los threads del
+    servidor. Solo se recarga si cambia el mtime/tamaño del archivo y además
+    su hash es distinto (un simple `touch` no provoca recarga).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entradas: Dict[Tuple[str, Any], Dict[str, Any]] = {}
+        self.aciertos = 0
+        self.fallos = 0
+        self.recargas = 0
+
+    def obtener(self, ruta: str, cargador: Callable[[str], Any]):
+        """Retorna el modelo de `ruta`, cargándolo con `cargador` solo si es necesario."""
+        ruta = os.path.abspath(ruta)
+        clave = (ruta, cargador)
+        stat = os.stat(ruta)
+        firma = (stat.st_mtime_ns, stat.st_size)
+
+        entrada = self._entradas.get(clave)
+        if entrada is not None and entrada['firma'] == firma:
+            with self._lock:
+                self.aciertos += 1
+            return entrada['modelo']
+
+        with self._lock:
+            # Otro thread pudo haber recargado mientras esperábamos el lock
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada['firma'] == firma:
+                self.aciertos += 1
+                return entrada['modelo']
+
+            hash_actual = _hash_archivo(ruta)
+            if entrada is not None and entrada['hash'] == hash_actual:
+                # Mismo contenido con otro mtime: no hace falta volver a parsear
+                entrada['firma'] = firma
+                self.aciertos += 1
+                return entrada['modelo']
+
+            inicio = time.perf_counter()
+            modelo = cargador(ruta)
+            duracion = time.perf_counter() - inicio
+
+            if entrada is not None:
+                self.recargas += 1
+                print(f"🔄 Modelo recargado por cambio en disco: {os.path.basename(ruta)}", file=sys.stderr)
+            self.fallos += 1
+
+            self._entradas[clave] = {
+                'modelo': modelo,
+                'firma': firma,
+                'hash': hash_actual,
+                'cargado_en': time.time(),
+                'tiempo_carga_ms': duracion * 1000
+            }
+            return modelo
+
+    def invalidar(self):
+        """Descarta todos los modelos en cache"""
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """Retorna estadísticas de la cache para diagnóstico"""
+        with self._lock:
+            return {
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'recargas': self.recargas,
+                'modelos': [
+                    {
+                        'archivo': os.path.basename(ruta),
+                        'cargador': getattr(cargador, '__name__', str(cargador)),
+                        'hash': entrada['hash'][:12],
+                        'cargado_en': entrada['cargado_en'],
+                        'tiempo_carga_ms': round(entrada['tiempo_carga_ms'], 3)
+                    }
+                    for (ruta, cargador), entrada in self._entradas.items()
+                ]
+            }
+
+
+# Instancia única compartida por el proceso
+registro_modelos = RegistroModelos()
@@ -0,0 +1,275 @@
+import os
+import sys
+import numpy as np
+from typing import Any, Dict, List
+
+# Constantes de LightGBM para decision_type
+_MASK_DEFAULT_LEFT = 2
+_MISSING_NONE = 0
+_MISSING_ZERO = 1
+_MISSING_NAN = 2
+_ZERO_THRESHOLD = 1e-35
+
+# Hasta cuántas filas conviene el recorrido en Python puro en vez del vectorizado
+_FILAS_MODO_FILA = 4
+
+
+def _leer_bloques(ruta: str):
+    """Lee el modelo de texto y retorna (cabecera, lista de árboles) como dicts clave=valor."""
+    cabecera: Dict[str, str] = {}
+    arboles: List[Dict[str, str]] = []
+    actual = cabecera
+
+    with open(ruta, 'r', encoding='utf-8') as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea:
+                continue
+            if linea == 'end of trees':
+                break
+            if linea.startswith('Tree='):
+                actual = {}
+                arboles.append(actual)
+                continue
+            if '=' in linea:
+                clave, valor = linea.split('=', 1)
+                actual[clave] = valor
+
+    return cabecera, arboles
+
+
+def _parse_array(valor: str, dtype) -> np.ndarray:
+    return np.array(valor.split(), dtype=dtype) if valor else np.array([], dtype=dtype)
+
+
+class ModeloCompilado:
+    """
+    Ensamble de árboles de LightGBM aplanado en arrays de NumPy.
+
+    Todos los nodos internos de todos los árboles comparten los mismos arrays
+    (split_feature, threshold, left_child, right_child). Un hijo con índice
+    >= num_internos es la hoja global `hijo - num_internos` en leaf_value.
+    """
+
+    def __init__(self, ruta: str):
+        cabecera, arboles = _leer_bloques(ruta)
+        if not arboles:
+            raise ValueError(f"El modelo no contiene árboles: {ruta}")
+
+        if int(cabecera.get('num_class', 1)) != 1:
+            raise ValueError("Solo se soportan modelos de una clase")
+
+        self.feature_names = cabecera.get('feature_name', cabecera.get('feature_names', '')).split()
+        self.num_features = int(cabecera['max_feature_idx']) + 1
+
+        objetivo = cabecera.get('objective', 'regression').split()
+        self.objetivo = objetivo[0]
+        self.sigmoid = None
+        if self.objetivo == 'binary':
+            self.sigmoid = 1.0
+            for parametro in objetivo[1:]:
+                if parametro.startswith('sigmoid:'):
+                    self.sigmoid = float(parametro.split(':', 1)[1])
+        elif not self.objetivo.startswith('regression'):
+            raise ValueError(f"Objetivo no soportado: {self.objetivo}")
+
+        split_feature, threshold, left, right = [], [], [], []
+        default_left, missing_type, leaf_value, raices = [], [], [], []
+        offset_nodos = 0
+        offset_hojas = 0
+
+        for arbol in arboles:
+            num_leaves = int(arbol['num_leaves'])
+            hojas = _parse_array(arbol['leaf_value'], np.float64)
+
+            if num_leaves == 1:
+                raices.append(-(offset_hojas + 1))
+            else:
+                if int(arbol.get('num_cat', 0)) > 0:
+                    raise ValueError("Los splits categóricos no están soportados")
+
+                tipos = _parse_array(arbol['decision_type'], np.int64)
+                hijos_izq = _parse_array(arbol['left_child'], np.int64)
+                hijos_der = _parse_array(arbol['right_child'], np.int64)
+
+                split_feature.append(_parse_array(arbol['split_feature'], np.int64))
+                threshold.append(_parse_array(arbol['threshold'], np.float64))
+                default_left.append((tipos & _MASK_DEFAULT_LEFT) != 0)
+                missing_type.append((tipos >> 2) & 3)
+                left.append(np.where(hijos_izq >= 0, hijos_izq + offset_nodos, hijos_izq - offset_hojas))
+                right.append(np.where(hijos_der >= 0, hijos_der + offset_nodos, hijos_der - offset_hojas))
+                raices.append(offset_nodos)
+                offset_nodos += num_leaves - 1
+
+            leaf_value.append(hojas)
+            offset_hojas += num_leaves
+
+        def _concat(partes, dtype):
+            return np.concatenate(partes).astype(dtype) if partes else np.array([], dtype=dtype)
+
+        internos = offset_nodos
+
+        def _hijos(partes):
+            # Hoja global k (codificada como -(k + 1)) -> nodo internos + k
+            hijos = _concat(partes, np.int64)
+            return np.where(hijos >= 0, hijos, internos - hijos - 1)
+
+        self.split_feature = _concat(split_feature, np.int64)
+        self.threshold = _concat(threshold, np.float64)
+        self.left_child = _hijos(left)
+        self.right_child = _hijos(right)
+        self.default_left = _concat(default_left, bool)
+        self.missing_type = _concat(missing_type, np.int64)
+        self.leaf_value = _concat(leaf_value, np.float64)
+        self.raices = np.array([r if r >= 0 else internos - r - 1 for r in raices], dtype=np.int64)
+        self.num_trees = len(arboles)
+        self.num_internos = internos
+        self._con_faltantes = bool(np.any(self.missing_type != _MISSING_NONE))
+
+        # Copias en listas de Python: para una sola fila recorrer los árboles
+        # en Python puro es más rápido que pagar el overhead de NumPy por nivel
+        self._listas = (self.split_feature.tolist(), self.threshold.tolist(),
+                        self.left_child.tolist(), self.right_child.tolist(),
+                        self.default_left.tolist(), self.missing_type.tolist(),
+                        self.leaf_value.tolist(), self.raices.tolist())
+
+    def _raw_fila(self, fila) -> float:
+        """Score crudo de una fila recorriendo cada árbol en Python puro."""
+        split_feature, threshold, left, right, default_left, missing_type, leaf_value, raices = self._listas
+        internos = self.num_internos
+        total = 0.0
+
+        for nodo in raices:
+            while nodo < internos:
+                fval = fila[split_feature[nodo]]
+                if self._con_faltantes:
+                    missing = missing_type[nodo]
+                    if fval != fval and missing != _MISSING_NAN:
+                        fval = 0.0
+                    if (missing == _MISSING_ZERO and abs(fval) <= _ZERO_THRESHOLD) or \
+                       (missing == _MISSING_NAN and fval != fval):
+                        nodo = left[nodo] if default_left[nodo] else right[nodo]
+                        continue
+                elif fval != fval:
+                    fval = 0.0
+                nodo = left[nodo] if fval <= threshold[nodo] else right[nodo]
+            total += leaf_value[nodo - internos]
+
+        return total
+
+    def _raw_lote(self, X: np.ndarray) -> np.ndarray:
+        """Score crudo de un lote avanzando todos los pares (fila, árbol) a la vez."""
+        if not self._con_faltantes:
+            # Sin missing_type, LightGBM trata NaN como 0.0
+            X = np.where(np.isnan(X), 0.0, X)
+
+        n = X.shape[0]
+        nodos = np.tile(self.raices, n)
+        filas = np.repeat(np.arange(n), self.num_trees)
+        pendientes = np.flatnonzero(nodos < self.num_internos)
+
+        while pendientes.size:
+            idx = nodos[pendientes]
+            fval = X[filas[pendientes], self.split_feature[idx]]
+            if self._con_faltantes:
+                missing = self.missing_type[idx]
+                es_nan = np.isnan(fval)
+                fval = np.where(es_nan & (missing != _MISSING_NAN), 0.0, fval)
+                por_defecto = ((missing == _MISSING_ZERO) & (np.abs(fval) <= _ZERO_THRESHOLD)) | \
+                              ((missing == _MISSING_NAN) & es_nan)
+                ir_izquierda = np.where(por_defecto, self.default_left[idx], fval <= self.threshold[idx])
+            else:
+                ir_izquierda = fval <= self.threshold[idx]
+
+            siguientes = np.where(ir_izquierda, self.left_child[idx], self.right_child[idx])
+            nodos[pendientes] = siguientes
+            pendientes = pendientes[siguientes < self.num_internos]
+
+        hojas = (nodos - self.num_internos).reshape(n, self.num_trees)
+        return self.leaf_value[hojas].sum(axis=1)
+
+    def predict(self, X, raw_score: bool = False) -> np.ndarray:
+        """Misma interfaz que `lgb.Booster.predict` para filas numéricas."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.num_features:
+            raise ValueError(f"Se esperaban {self.num_features} features, se recibieron {X.shape[1]}")
+
+        if X.shape[0] <= _FILAS_MODO_FILA:
+            raw = np.array([self._raw_fila(fila) for fila in X.tolist()])
+        else:
+            raw = self._raw_lote(X)
+        if raw_score or self.sigmoid is None:
+            return raw
+        return 1.0 / (1.0 + np.exp(-self.sigmoid * raw))
+
+
+def cargar_modelo_compilado(model_file: str) -> ModeloCompilado:
+    """Carga el modelo de texto de LightGBM en el motor compilado."""
+    if not os.path.exists(model_file):
+        raise FileNotFoundError(f"Modelo no encontrado: {model_file}")
+
+    try:
+        modelo = ModeloCompilado(model_file)
+        print(f"🧠 Modelo compilado cargado ({modelo.num_trees} árboles).", file=sys.stderr)
+        return modelo
+    except Exception as e:
+        raise IOError(f"No se pudo compilar el modelo: {e}")
+
+
+def verificar_paridad(model_file: str, n_filas: int = 5000, tolerancia: float = 1e-9,
+                      semilla: int = 0) -> Dict[str, Any]:
+    """
+    Compara las predicciones del motor compilado contra `lgb.Booster.predict`.
+
+    Las filas de prueba se generan dentro de los rangos de `feature_infos`,
+    incluyendo valores exactamente iguales a los thresholds y NaN.
+    """
+    import lightgbm as lgb
+
+    bst = lgb.Booster(model_file=model_file)
+    compilado = ModeloCompilado(model_file)
+    rng = np.random.default_rng(semilla)
+
+    rangos = []
+    for info in bst.dump_model().get('feature_infos', {}).values():
+        rangos.append((info.get('min_value', -1.0), info.get('max_value', 1.0)))
+    if len(rangos) != compilado.num_features:
+        rangos = [(-1.0, 1.0)] * compilado.num_features
+
+    minimos = np.array([r[0] for r in rangos])
+    maximos = np.array([r[1] for r in rangos])
+    X = minimos + rng.random((n_filas, compilado.num_features)) * (maximos - minimos)
+
+    # Forzar valores en los thresholds exactos y algunos faltantes
+    if compilado.threshold.size:
+        k = rng.integers(0, compilado.threshold.size, n_filas // 4)
+        filas = rng.integers(0, n_filas, k.size)
+        X[filas, compilado.split_feature[k]] = compilado.threshold[k]
+    X[rng.random(X.shape) < 0.01] = np.nan
+
+    esperado = bst.predict(X)
+    obtenido = compilado.predict(X)
+    diferencia = float(np.max(np.abs(esperado - obtenido)))
+
+    # Una fila suelta debe coincidir también
+    una_fila = float(abs(bst.predict(X[:1])[0] - compilado.predict(X[0])[0]))
+
+    return {
+        'filas': n_filas,
+        'max_diferencia': max(diferencia, una_fila),
+        'ok': diferencia <= tolerancia and una_fila <= tolerancia
+    }
+
+
+# ---------------------------
+# Modo CLI: verificación de paridad
+# ---------------------------
+if __name__ == "__main__":
+    ruta = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "lgbm_model.txt")
+    resultado = verificar_paridad(ruta)
+    print(f"{'✅' if resultado['ok'] else '❌'} Paridad con LightGBM: "
+          f"{resultado['filas']} filas, diferencia máxima {resultado['max_diferencia']:.3e}")
+    sys.exit(0 if resultado['ok'] else 1)
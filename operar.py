@@ -1,35 +1,69 @@
 import os
-import sys
+import json
 import numpy as np
 import pandas as pd
-import lightgbm as lgb
 import time
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Tuple, Callable, Optional
 from datetime import datetime
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 
 from iqoptionapi.stable_api import IQ_Option
+from conexion import lock_sesion, lock_operaciones, cambiar_balance
+from modelos import registro_modelos
+from motor_arboles import cargar_modelo_compilado
+from features_incrementales import registro_estados
+from almacen_velas import almacen_velas
+from streaming_velas import gestor_streaming
+from seguimiento_operaciones import seguimiento_operaciones, MARGEN_ESPERA
+from balances import cache_balances
+from metricas import medir_etapa
+from bitacora import obtener_logger
 
 # Importar las mismas librerías de indicadores
 from ta.momentum import RSIIndicator
 from ta.trend import EMAIndicator, MACD
 from ta.volatility import BollingerBands, AverageTrueRange
 
+log = obtener_logger("operar")
+
 # ====================================================================
 # CONFIGURACIÓN Y CONSTANTES
 # ====================================================================
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_FILE = os.path.join(SCRIPT_DIR, "lgbm_model.txt")
+# "lightgbm" usa lgb.Booster; "compilado" usa el motor NumPy de motor_arboles.py
+MODEL_BACKEND = os.environ.get("MODEL_BACKEND", "lightgbm").lower()
 
 # --- Umbrales y configuración del modelo ---
 LOWER_THRESHOLD = 0.45
 UPPER_THRESHOLD = 0.52
 REGIME_FEATURE  = "bb_width"
 REGIME_CUTOFF   = 0.0005
+# Umbrales elegidos con busqueda_umbrales.py; si el archivo existe reemplaza a los
+# de arriba y se recarga en caliente cuando cambia
+UMBRALES_FILE = os.environ.get("UMBRALES_FILE", os.path.join(SCRIPT_DIR, "umbrales.json"))
 
 # --- Configuración de trading ---
 EXPIRATION_TIME = 1  # Minutos (1, 5, 15, etc.)
 DEFAULT_AMOUNT = 1   # Monto por defecto en USD
 
+# --- Datos de mercado ---
+ACTIVO = "EURUSD-OTC"
+TIMEFRAME = 300      # Segundos por vela
+NUM_VELAS = 120
+
+# --- Features incrementales ---
+# Desactivado por defecto: el estado incremental acumula toda la historia desde
+# el arranque y las EMAs (macd, macd_signal...) no coinciden con el cálculo
+# sobre las últimas NUM_VELAS velas con el que se entrenó y se opera en batch;
+# la probabilidad puede moverse lo suficiente para cambiar señales en el borde.
+# verificar_contra_batch(df, ventana=NUM_VELAS) mide la diferencia.
+FEATURES_INCREMENTALES = os.environ.get("FEATURES_INCREMENTALES", "0") == "1"
+VERIFICAR_FEATURES = os.environ.get("VERIFICAR_FEATURES", "0") == "1"
+
+# --- Almacén local de velas (solo se descargan las velas nuevas) ---
+ALMACEN_VELAS = os.environ.get("ALMACEN_VELAS", "1") == "1"
+
 # --- Lista de features ---
 FEATURES = [
     "rsi_14", "ema_20", "ema_50",
@@ -69,10 +103,10 @@ class GestorRiesgoInteligente:
             # 2. Ajustar por calidad de señal
             if señal_calidad == "alta":
                 riesgo_base *= 1.2  # +20% para señales fuertes
-                print(f"📈 Señal ALTA - Aumentando riesgo a {riesgo_base:.1f}%", file=sys.stderr)
+                log.debug("Señal alta, riesgo aumentado a %.1f%%", riesgo_base)
             elif señal_calidad == "baja":
                 riesgo_base *= 0.8  # -20% para señales débiles
-                print(f"📉 Señal BAJA - Reduciendo riesgo a {riesgo_base:.1f}%", file=sys.stderr)
+                log.debug("Señal baja, riesgo reducido a %.1f%%", riesgo_base)
                 
             # 3. Ajustar por racha de resultados
             riesgo_base = self._ajustar_por_racha(riesgo_base)
@@ -83,11 +117,11 @@ class GestorRiesgoInteligente:
             # 5. Aplicar límites inteligentes
             monto_final = self._aplicar_limites_inteligentes(monto_base, balance_actual)
             
-            print(f"🎯 Monto calculado: ${monto_final:.2f} ({(monto_final/balance_actual)*100:.1f}% del balance)", file=sys.stderr)
+            log.debug("Monto calculado $%.2f (%.1f%% del balance)", monto_final, (monto_final/balance_actual)*100)
             return round(monto_final, 2)
             
         except Exception as e:
-            print(f"⚠️ Error calculando monto inteligente: {e}, usando monto por defecto", file=sys.stderr)
+            log.warning("Error calculando monto inteligente: %s, usando monto por defecto", e)
             return DEFAULT_AMOUNT
     
     def _ajustar_por_racha(self, riesgo_base):
@@ -97,13 +131,13 @@ class GestorRiesgoInteligente:
         # Reducir riesgo después de pérdidas consecutivas
         if self.racha_perdidas >= self.config.get('max_perdidas_consecutivas', 3):
             nuevo_riesgo = riesgo_base * 0.5  # Reducir 50%
-            print(f"🔻 Racha de {self.racha_perdidas} pérdidas - Reduciendo riesgo a {nuevo_riesgo:.1f}%", file=sys.stderr)
+            log.info("Racha de %d pérdidas, riesgo reducido a %.1f%%", self.racha_perdidas, nuevo_riesgo)
             return nuevo_riesgo
         
         # Aumentar ligeramente en rachas ganadoras
         if self.racha_ganancias >= 3:
             nuevo_riesgo = riesgo_base * 1.1  # Aumentar 10%
-            print(f"🔺 Racha de {self.racha_ganancias} ganancias - Aumentando riesgo a {nuevo_riesgo:.1f}%", file=sys.stderr)
+            log.debug("Racha de %d ganancias, riesgo aumentado a %.1f%%", self.racha_ganancias, nuevo_riesgo)
             return nuevo_riesgo
             
         return riesgo_base
@@ -129,7 +163,7 @@ class GestorRiesgoInteligente:
         # Verificar stop loss diario
         stop_diario = balance * (self.config.get('stop_loss_diario', 15) / 100)
         if self.profit_diario <= -stop_diario:
-            print(f"🛑 STOP LOSS DIARIO ACTIVADO - Profit hoy: ${self.profit_diario:.2f}", file=sys.stderr)
+            log.warning("Stop loss diario activado, profit hoy $%.2f", self.profit_diario)
             return 0  # No operar más hoy
             
         return monto_final
@@ -148,7 +182,8 @@ class GestorRiesgoInteligente:
         self.profit_diario += ganancia
         self.operaciones_hoy += 1
         
-        print(f"📊 Estadísticas actualizadas - Racha: {self.racha_ganancias if ganancia > 0 else self.racha_perdidas} {'✅' if ganancia > 0 else '❌'} | Profit hoy: ${self.profit_diario:.2f}", file=sys.stderr)
+        log.debug("Resultado %s, racha %d, profit hoy $%.2f", "ganada" if ganancia > 0 else "perdida",
+                  self.racha_ganancias if ganancia > 0 else self.racha_perdidas, self.profit_diario)
     
     def obtener_estadisticas(self):
         """
@@ -163,20 +198,46 @@ class GestorRiesgoInteligente:
         }
 
 
-def get_latest_market_data(iq: IQ_Option):
-    """Obtiene los datos más recientes del mercado"""
+def get_latest_market_data(iq: IQ_Option, activo: str = ACTIVO, timeframe: int = TIMEFRAME,
+                           num_velas: int = NUM_VELAS, incluir_en_curso: bool = True):
+    """
+    Obtiene los datos más recientes del mercado
+    
+    Si hay una suscripción de streaming activa para el activo, las velas se
+    leen del buffer del websocket en vez de pedirlas al broker. Con
+    incluir_en_curso=False se descarta la vela que todavía no cerró.
+    """
     if not iq:
         raise ValueError("La sesión de IQ Option no es válida.")
 
-    print("📈 Obteniendo velas de EURUSD (5min)...", file=sys.stderr)
+    log.debug("Obteniendo velas de %s (%dmin)", activo, timeframe // 60)
     
-    candles = iq.get_candles("EURUSD-OTC", 300, 120, time.time())
+    suscripcion = gestor_streaming.obtener_activa(iq, activo, timeframe)
+    
+    def descargar(cantidad):
+        if suscripcion and suscripcion.cubre(cantidad):
+            return suscripcion.ultimas(cantidad)
+        with lock_sesion(iq):
+            return iq.get_candles(activo, timeframe, cantidad, time.time())
+    
+    cantidad = num_velas if incluir_en_curso else num_velas + 1
+    if ALMACEN_VELAS:
+        candles = almacen_velas.obtener(activo, timeframe, cantidad, time.time(), descargar)
+    else:
+        candles = descargar(cantidad)
+    
+    if candles and not incluir_en_curso:
+        candles = candles[:-1]
     
     if not candles:
-        raise RuntimeError("No se pudieron obtener velas de EURUSD.")
+        raise RuntimeError(f"No se pudieron obtener velas de {activo}.")
 
     df = pd.DataFrame(candles)
     
+    # Indexar por timestamp de apertura para poder detectar velas nuevas
+    if 'from' in df.columns:
+        df.index = df['from'].astype(int)
+    
     # Mapear nombres de columnas
     column_mapping = {
         'open': 'open',
@@ -204,7 +265,7 @@ def get_latest_market_data(iq: IQ_Option):
     if 'volume' not in df.columns:
         df['volume'] = 0
     
-    print(f"📊 Se obtuvieron {len(df)} velas", file=sys.stderr)
+    log.debug("Se obtuvieron %d velas de %s", len(df), activo)
     return df
 
 def detect_harami(row_prev, row_curr):
@@ -217,9 +278,27 @@ def detect_harami(row_prev, row_curr):
              (min(row_curr["open"], row_curr["close"]) >= low_prev)
     return int((body_curr < body_prev) and inside)
 
+def detect_harami_vectorizado(open_, close) -> np.ndarray:
+    """
+    Versión vectorizada de detect_harami sobre toda la serie.
+    La primera vela siempre es 0 (no tiene vela anterior).
+    """
+    o = np.asarray(open_, dtype=np.float64)
+    c = np.asarray(close, dtype=np.float64)
+    
+    body = np.abs(c - o)
+    high = np.maximum(o, c)
+    low = np.minimum(o, c)
+    
+    harami = np.zeros(len(o), dtype=np.int64)
+    if len(o) > 1:
+        inside = (high[1:] <= high[:-1]) & (low[1:] >= low[:-1])
+        harami[1:] = (body[1:] < body[:-1]) & inside
+    return harami
+
 def calcular_features(df: pd.DataFrame) -> pd.DataFrame:
     """Calcula todos los features técnicos necesarios para el modelo."""
-    print("⚙️  Calculando features técnicos...", file=sys.stderr)
+    log.debug("Calculando features técnicos de %d velas", len(df))
     df_feat = df.copy()
     
     df_feat["rsi_14"]  = RSIIndicator(df_feat["close"], window=14).rsi()
@@ -243,25 +322,88 @@ def calcular_features(df: pd.DataFrame) -> pd.DataFrame:
     df_feat["ret_6"]  = df_feat["close"].pct_change(6)
     df_feat["vol_10"] = df_feat["ret_1"].rolling(10).std()
     
-    harami = [0]
-    for i in range(1, len(df_feat)):
-        harami.append(detect_harami(df_feat.iloc[i - 1], df_feat.iloc[i]))
-    df_feat["harami"] = harami
+    df_feat["harami"] = detect_harami_vectorizado(df_feat["open"], df_feat["close"])
     
-    print("✅ Features calculados.", file=sys.stderr)
     return df_feat.dropna()
 
-def predecir_decision(model, df_vela_actual: pd.DataFrame, forzar: bool = False) -> Dict[str, Any]:
+def calcular_features_incremental(df: pd.DataFrame, activo: str = ACTIVO, timeframe: int = TIMEFRAME) -> pd.DataFrame:
+    """
+    Calcula los features de la última vela usando el estado incremental del activo.
+    
+    Las velas cerradas (todas menos la última) que aún no se vieron se incorporan
+    en O(1) cada una; la última vela, todavía abierta, se evalúa sin modificar
+    el estado. Si el estado no puede continuar la serie se reconstruye desde df.
+    Si la última vela ya fue incorporada (p. ej. por el streaming al cerrar),
+    se reutilizan sus features.
+    Retorna un DataFrame de una fila, o el cálculo batch si no hay timestamps.
+    """
+    if df.empty or not pd.api.types.is_integer_dtype(df.index):
+        return calcular_features(df)
+    
+    estado = registro_estados.obtener(activo, timeframe, verificar=VERIFICAR_FEATURES)
+    
+    with estado.lock:
+        if estado.listo and estado.ultimo_ts == df.index[-1]:
+            return pd.DataFrame([estado.ultimas_features], index=df.index[-1:])
+        
+        cerradas = df.iloc[:-1]
+        if estado.ultimo_ts is None or estado.ultimo_ts not in cerradas.index:
+            # Primera vez o hueco en la serie: reconstruir con toda la ventana
+            estado.reiniciar()
+            nuevas = cerradas
+        else:
+            nuevas = cerradas[cerradas.index > estado.ultimo_ts]
+        
+        for ts, vela in zip(nuevas.index, nuevas.to_dict('records')):
+            estado.actualizar(vela, ts=ts)
+        
+        if not estado.listo:
+            return calcular_features(df)
+        
+        features = estado.provisional(df.iloc[-1])
+    
+    return pd.DataFrame([features], index=df.index[-1:])
+
+def cargar_umbrales(ruta: str) -> Dict[str, float]:
+    """Lee un archivo de umbrales (JSON con lower_threshold, upper_threshold y regime_cutoff)."""
+    with open(ruta, 'r', encoding='utf-8') as f:
+        datos = json.load(f)
+    umbrales = {
+        'lower_threshold': float(datos.get('lower_threshold', LOWER_THRESHOLD)),
+        'upper_threshold': float(datos.get('upper_threshold', UPPER_THRESHOLD)),
+        'regime_cutoff': float(datos.get('regime_cutoff', REGIME_CUTOFF))
+    }
+    if not 0 <= umbrales['lower_threshold'] < umbrales['upper_threshold'] <= 1:
+        raise ValueError(f"Umbrales inválidos en {ruta}: {umbrales}")
+    log.info("Umbrales cargados de %s", os.path.basename(ruta), extra=umbrales)
+    return umbrales
+
+def umbrales_vigentes() -> Dict[str, float]:
+    """Umbrales de UMBRALES_FILE si existe y es válido; si no, las constantes del módulo."""
+    if os.path.exists(UMBRALES_FILE):
+        try:
+            return registro_modelos.obtener(UMBRALES_FILE, cargar_umbrales)
+        except Exception as e:
+            log.warning("No se pudo cargar %s: %s, usando umbrales por defecto", UMBRALES_FILE, e)
+    return {
+        'lower_threshold': LOWER_THRESHOLD,
+        'upper_threshold': UPPER_THRESHOLD,
+        'regime_cutoff': REGIME_CUTOFF
+    }
+
+def predecir_decision(model, df_vela_actual: pd.DataFrame, forzar: bool = False,
+                      umbrales: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
     """Toma la última vela y retorna una decisión estructurada."""
     if df_vela_actual.empty:
         return {"decision": "SKIP", "razon": "No hay datos", "probabilidad": "N/A", "tipo": None}
         
+    umbrales = umbrales or umbrales_vigentes()
     vela_features = df_vela_actual.iloc[-1]
     
     # Chequeo de Régimen de Volatilidad (solo si no se fuerza la operación)
     if not forzar:
         regime_value = vela_features[REGIME_FEATURE]
-        if regime_value < REGIME_CUTOFF:
+        if regime_value < umbrales['regime_cutoff']:
             return {
                 "decision": "SKIP",
                 "razon": f"Volatilidad baja ({regime_value:.6f})",
@@ -271,15 +413,20 @@ def predecir_decision(model, df_vela_actual: pd.DataFrame, forzar: bool = False)
     
     # Predicción de probabilidad
     try:
-        proba = model.predict([vela_features[FEATURES]])[0]
+        fila = vela_features[FEATURES].to_numpy(dtype=np.float64).reshape(1, -1)
+        proba = model.predict(fila)[0]
     except Exception as e:
         return {"decision": "SKIP", "razon": f"Error: {e}", "probabilidad": "N/A", "tipo": None}
         
-    # Decisión según umbrales
-    if proba <= LOWER_THRESHOLD:
+    return decision_desde_probabilidad(proba, umbrales)
+
+def decision_desde_probabilidad(proba: float, umbrales: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """Convierte una probabilidad del modelo en decisión según los umbrales."""
+    umbrales = umbrales or umbrales_vigentes()
+    if proba <= umbrales['lower_threshold']:
         decision = "PUT"
         tipo = "put"
-    elif proba >= UPPER_THRESHOLD:
+    elif proba >= umbrales['upper_threshold']:
         decision = "CALL"
         tipo = "call"
     else:
@@ -293,125 +440,58 @@ def predecir_decision(model, df_vela_actual: pd.DataFrame, forzar: bool = False)
         "tipo": tipo
     }
 
+def calidad_senal(proba: float) -> str:
+    """Calidad de una señal para el gestor de riesgo ("alta", "normal" o "baja")."""
+    if proba <= 0.40 or proba >= 0.80:
+        return "alta"
+    if proba <= 0.45 or proba >= 0.75:
+        return "baja"
+    return "normal"
+
 def ejecutar_trade(iq: IQ_Option, tipo: str, monto: float, activo: str = "EURUSD") -> Tuple[bool, Any, str]:
     """
     Ejecuta una operación en IQ Option
     Retorna: (éxito, id_operación, mensaje)
     """
     try:
-        print(f"💰 Ejecutando trade {tipo.upper()} por ${monto} en {activo}...", file=sys.stderr)
+        log.info("Ejecutando trade %s por $%s en %s", tipo.upper(), monto, activo)
         
         # Ejecutar la compra
         check, id_operation = iq.buy(monto, activo, tipo, EXPIRATION_TIME)
         
         if check:
-            print(f"✅ Trade ejecutado exitosamente. ID: {id_operation}", file=sys.stderr)
+            log.info("Trade ejecutado, id %s", id_operation)
             return True, id_operation, f"Trade {tipo.upper()} ejecutado - ID: {id_operation}"
         else:
-            print(f"❌ Error al ejecutar trade", file=sys.stderr)
+            log.error("El broker rechazó el trade %s en %s", tipo.upper(), activo)
             return False, None, "Error al ejecutar la operación"
             
     except Exception as e:
-        print(f"❌ Excepción al ejecutar trade: {e}", file=sys.stderr)
+        log.error("Excepción al ejecutar trade: %s", e, exc_info=True)
         return False, None, f"Error: {str(e)}"
 
 def verificar_resultado(iq: IQ_Option, id_operation: int, monto: float, timeout: int = 70) -> Dict[str, Any]:
     """
     Verifica el resultado de una operación
-    Espera hasta que la operación se cierre
+    Espera hasta que la operación se cierre (ver seguimiento_operaciones)
     """
     try:
-        print(f"⏳ Esperando resultado de operación {id_operation}...", file=sys.stderr)
-        
-        start_time = time.time()
-        last_status = None
-        
-        while time.time() - start_time < timeout:
-            try:
-                # Método 1: check_win_v3 (nuevo)
-                resultado = iq.check_win_v3(id_operation)
-                
-                # Debug: mostrar qué devuelve la API
-                if resultado != last_status:
-                    print(f"🔍 Estado actual: {resultado} (tipo: {type(resultado)})", file=sys.stderr)
-                    last_status = resultado
-                
-                # Si es un número, la operación está cerrada
-                if isinstance(resultado, (int, float)):
-                    if resultado > 0:
-                        # Ganancia
-                        ganancia = resultado
-                        win = True
-                        print(f"✅ WIN: ${ganancia:.2f}", file=sys.stderr)
-                        return {
-                            "finalizada": True,
-                            "ganancia": ganancia,
-                            "win": win,
-                            "id": id_operation,
-                            "resultado_raw": resultado
-                        }
-                    elif resultado == 0:
-                        # Empate - devolución del monto
-                        ganancia = 0
-                        win = None
-                        print(f"⚪ REFUND: ${ganancia:.2f} (Monto devuelto)", file=sys.stderr)
-                        return {
-                            "finalizada": True,
-                            "ganancia": ganancia,
-                            "win": win,
-                            "id": id_operation,
-                            "resultado_raw": resultado
-                        }
-                    else:
-                        # Pérdida
-                        ganancia = -monto
-                        win = False
-                        print(f"❌ LOSS: ${ganancia:.2f}", file=sys.stderr)
-                        return {
-                            "finalizada": True,
-                            "ganancia": ganancia,
-                            "win": win,
-                            "id": id_operation,
-                            "resultado_raw": resultado
-                        }
-                
-                # Método 2: Intentar con get_binary_option_detail
-                try:
-                    detalle = iq.get_binary_option_detail(id_operation)
-                    if detalle and isinstance(detalle, dict):
-                        if detalle.get('win') is not None:
-                            win = detalle.get('win')
-                            ganancia = detalle.get('profit', 0) if win else -monto
-                            print(f"✅ Resultado por detalle: {'WIN' if win else 'LOSS'} - ${ganancia:.2f}", file=sys.stderr)
-                            return {
-                                "finalizada": True,
-                                "ganancia": ganancia,
-                                "win": win,
-                                "id": id_operation,
-                                "resultado_raw": detalle
-                            }
-                except Exception as e_detail:
-                    pass  # Ignorar errores en método alternativo
-                    
-                # Si llegamos aquí, la operación sigue abierta
-                time.sleep(3)  # Esperar 3 segundos antes de verificar de nuevo
-                    
-            except Exception as e:
-                print(f"⚠️  Error verificando resultado: {e}", file=sys.stderr)
-                time.sleep(3)
-        
-        # Timeout
-        print(f"⏰ Timeout esperando resultado después de {timeout} segundos", file=sys.stderr)
+        log.debug("Esperando resultado de operación %s", id_operation)
+        futuro = seguimiento_operaciones.registrar(iq, id_operation, monto,
+                                                   expiracion=EXPIRATION_TIME * 60, timeout=timeout)
+        return futuro.result(timeout=timeout + MARGEN_ESPERA)
+
+    except FuturesTimeoutError:
+        log.error("Sin resultado de %s después de %d segundos", id_operation, timeout + MARGEN_ESPERA)
         return {
             "finalizada": False,
             "ganancia": 0,
             "win": None,
             "id": id_operation,
-            "mensaje": f"Timeout después de {timeout} segundos"
+            "mensaje": f"Timeout después de {timeout + MARGEN_ESPERA} segundos"
         }
-        
     except Exception as e:
-        print(f"❌ Error verificando resultado: {e}", file=sys.stderr)
+        log.error("Error verificando resultado de %s: %s", id_operation, e)
         return {
             "finalizada": False,
             "ganancia": 0,
@@ -420,14 +500,20 @@ def verificar_resultado(iq: IQ_Option, id_operation: int, monto: float, timeout:
             "error": str(e)
         }
 
+def obtener_modelo():
+    """Modelo compartido por el proceso según MODEL_BACKEND."""
+    cargador = cargar_modelo_compilado if MODEL_BACKEND == "compilado" else load_model
+    return registro_modelos.obtener(MODEL_FILE, cargador)
+
 def load_model(model_file: str):
     """Carga el modelo LightGBM."""
     if not os.path.exists(model_file):
         raise FileNotFoundError(f"Modelo no encontrado: {model_file}")
     
     try:
+        import lightgbm as lgb
         bst = lgb.Booster(model_file=model_file)
-        print(f"🧠 Modelo cargado exitosamente.", file=sys.stderr)
+        log.info("Modelo LightGBM cargado")
         return bst
     except Exception as e:
         raise IOError(f"No se pudo cargar el modelo: {e}")
@@ -435,7 +521,9 @@ def load_model(model_file: str):
 
 def ejecutar_operacion(iq: IQ_Option, modo: str = "demo", monto: float = None, 
                       ejecutar_auto: bool = False, forzar_operacion: bool = False,
-                      config_riesgo: dict = None) -> Dict[str, Any]:
+                      config_riesgo: dict = None, activo: str = ACTIVO,
+                      al_cierre: bool = False, esperar_resultado: bool = True,
+                      al_liquidar: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
     """
     Función principal de trading
     
@@ -446,10 +534,14 @@ def ejecutar_operacion(iq: IQ_Option, modo: str = "demo", monto: float = None,
         ejecutar_auto: Si True, ejecuta automáticamente la operación
         forzar_operacion: Si True, fuerza una operación aunque no haya señal.
         config_riesgo: Configuración para gestión inteligente de riesgo
+        activo: Activo a analizar y operar
+        al_cierre: Si True, decide con la última vela cerrada (modo streaming)
+        esperar_resultado: Si False, retorna apenas se abre la operación con
+            resultado_trade pendiente; el resultado llega luego a `al_liquidar`
+        al_liquidar: Callback opcional que recibe este mismo resultado con
+            resultado_trade y estadisticas_riesgo ya actualizados
     """
-    print("\n" + "-"*50, file=sys.stderr)
-    print(f"🚀 INICIANDO ANÁLISIS - Modo: {modo.upper()}", file=sys.stderr)
-    print("-"*50, file=sys.stderr)
+    log.debug("Iniciando análisis de %s en modo %s", activo, modo)
     
     # Inicializar gestor de riesgo
     gestor_riesgo = GestorRiesgoInteligente(config_riesgo)
@@ -457,39 +549,56 @@ def ejecutar_operacion(iq: IQ_Option, modo: str = "demo", monto: float = None,
     try:
         # Cambiar a la cuenta correcta
         balance_type = 'PRACTICE' if modo == 'demo' else 'REAL'
+        balance_actual = None
         try:
-            iq.change_balance(balance_type)
-            time.sleep(1)
-            balance_actual = iq.get_balance()
-            print(f"💰 Balance {modo}: ${balance_actual:.2f}", file=sys.stderr)
+            with medir_etapa('balance'), lock_operaciones(iq):
+                if cambiar_balance(iq, balance_type):
+                    balance_actual = iq.get_balance()
         except Exception as e:
-            print(f"⚠️  Advertencia cambiando balance: {e}", file=sys.stderr)
-            balance_actual = 10000  # Valor por defecto si hay error
+            log.warning("Advertencia cambiando balance: %s", e)
+
+        if balance_actual is not None:
+            log.debug("Balance %s: $%.2f", modo, balance_actual)
+        elif monto is None:
+            # El monto no se calcula con el balance de otra cuenta: se salta el ciclo
+            razon = f"No se pudo activar el balance {balance_type}"
+            log.warning("%s, se omite la operación en %s", razon, activo)
+            return {
+                "success": False,
+                "decision": "ERROR",
+                "razon": razon,
+                "probabilidad": "N/A",
+                "error": razon,
+                "estadisticas_riesgo": gestor_riesgo.obtener_estadisticas()
+            }
         
-        # Cargar modelo
-        bst = load_model(MODEL_FILE)
+        # Obtener modelo (cacheado por proceso, se recarga solo si cambia el archivo)
+        with medir_etapa('modelo'):
+            bst = obtener_modelo()
+            umbrales = umbrales_vigentes()
 
         # Obtener datos de mercado
-        df_historial = get_latest_market_data(iq)
+        with medir_etapa('velas'):
+            df_historial = get_latest_market_data(iq, activo, incluir_en_curso=not al_cierre)
 
         # Calcular features
-        df_con_features = calcular_features(df_historial)
+        with medir_etapa('features'):
+            if FEATURES_INCREMENTALES:
+                df_con_features = calcular_features_incremental(df_historial, activo, TIMEFRAME)
+            else:
+                df_con_features = calcular_features(df_historial)
         
         if df_con_features.empty:
             raise ValueError("No se pudieron calcular features")
 
         # Tomar decisión
-        print("🤔 Analizando mercado...", file=sys.stderr)
-        decision_data = predecir_decision(bst, df_con_features, forzar=forzar_operacion)
+        with medir_etapa('predict'):
+            decision_data = predecir_decision(bst, df_con_features, forzar=forzar_operacion, umbrales=umbrales)
         
         # Determinar calidad de señal para gestión de riesgo
         señal_calidad = "normal"
         if decision_data["tipo"]:
-            proba = float(decision_data["probabilidad"])
-            if proba <= 0.40 or proba >= 0.80:
-                señal_calidad = "alta"
-            elif proba <= 0.45 or proba >= 0.75:
-                señal_calidad = "baja"
+            señal_calidad = calidad_senal(float(decision_data["probabilidad"]))
         
         # Calcular monto inteligente si no se especifica
         if monto is None:
@@ -509,7 +618,7 @@ def ejecutar_operacion(iq: IQ_Option, modo: str = "demo", monto: float = None,
                     "estadisticas_riesgo": gestor_riesgo.obtener_estadisticas()
                 }
         else:
-            print(f"💰 Usando monto fijo: ${monto:.2f}", file=sys.stderr)
+            log.debug("Usando monto fijo $%.2f", monto)
         
         resultado = {
             "success": True,
@@ -518,6 +627,7 @@ def ejecutar_operacion(iq: IQ_Option, modo: str = "demo", monto: float = None,
             "probabilidad": decision_data["probabilidad"],
             "timestamp": datetime.now().isoformat(),
             "modo": modo,
+            "activo": activo,
             "ejecutado": False,
             "trade_id": None,
             "resultado_trade": None,
@@ -525,9 +635,8 @@ def ejecutar_operacion(iq: IQ_Option, modo: str = "demo", monto: float = None,
             "estadisticas_riesgo": gestor_riesgo.obtener_estadisticas()
         }
         
-        print(f"\n🎯 DECISIÓN: {decision_data['decision']}", file=sys.stderr)
-        print(f"📊 Probabilidad: {decision_data['probabilidad']}", file=sys.stderr)
-        print(f"💰 Monto a operar: ${monto:.2f}", file=sys.stderr)
+        log.info("Decisión %s en %s", decision_data['decision'], activo,
+                 extra={'probabilidad': decision_data['probabilidad'], 'monto': monto, 'modo': modo})
         
         tipo_operacion = decision_data["tipo"]
 
@@ -536,41 +645,57 @@ def ejecutar_operacion(iq: IQ_Option, modo: str = "demo", monto: float = None,
             tipo_operacion = "call"
             resultado["decision"] = "CALL (FORZADO)"
             resultado["razon"] = "Operación manual forzada sin señal"
-            print(f"⚠️  No se encontró señal. Forzando 'CALL' por petición manual.", file=sys.stderr)
+            log.warning("Sin señal: se fuerza CALL por petición manual")
 
         # Ejecutar si el bot está activo y hay señal, o si se ha forzado la operación
         if (ejecutar_auto and decision_data["tipo"]) or (forzar_operacion and tipo_operacion):
-            print(f"\n🤖 EJECUCIÓN AUTOMÁTICA/FORZADA ACTIVADA", file=sys.stderr)
-            
-            # Ejecutar el trade
-            check, trade_id, mensaje = ejecutar_trade(
-                iq, 
-                tipo_operacion, 
-                monto, 
-                "EURUSD-OTC"
-            )
+            # Ejecutar el trade (en el balance del modo, aunque otra operación lo haya cambiado)
+            with medir_etapa('compra'), lock_operaciones(iq):
+                if cambiar_balance(iq, balance_type):
+                    check, trade_id, mensaje = ejecutar_trade(
+                        iq, 
+                        tipo_operacion, 
+                        monto, 
+                        activo
+                    )
+                else:
+                    check, trade_id, mensaje = False, None, f"No se pudo activar el balance {balance_type}"
             
             resultado["ejecutado"] = check
             resultado["trade_id"] = trade_id
             resultado["mensaje_trade"] = mensaje
             
             if check and trade_id:
-                # Esperar y verificar resultado
-                resultado_trade = verificar_resultado(iq, trade_id, monto)
-                resultado["resultado_trade"] = resultado_trade
-                
-                # Actualizar estadísticas de riesgo
-                if resultado_trade["finalizada"]:
-                    gestor_riesgo.actualizar_resultado(resultado_trade["ganancia"])
-                    resultado["estadisticas_riesgo"] = gestor_riesgo.obtener_estadisticas()
+                # El monto ya se descontó: /check_session no debe mostrar el balance previo
+                cache_balances.invalidar(iq)
+                def _liquidada(resultado_trade: Dict[str, Any]):
+                    resultado["resultado_trade"] = resultado_trade
+                    # Actualizar estadísticas de riesgo
+                    if resultado_trade["finalizada"]:
+                        gestor_riesgo.actualizar_resultado(resultado_trade["ganancia"])
+                        resultado["estadisticas_riesgo"] = gestor_riesgo.obtener_estadisticas()
+                    if al_liquidar:
+                        al_liquidar(resultado)
+
+                if esperar_resultado:
+                    # Esperar y verificar resultado
+                    _liquidada(verificar_resultado(iq, trade_id, monto))
+                else:
+                    resultado["resultado_trade"] = {
+                        "finalizada": False,
+                        "ganancia": 0,
+                        "win": None,
+                        "id": trade_id,
+                        "pendiente": True
+                    }
+                    # El seguimiento de operaciones avisa cuando se liquide
+                    seguimiento_operaciones.registrar(iq, trade_id, monto, expiracion=EXPIRATION_TIME * 60,
+                                                      callback=_liquidada)
         
-        print("="*50 + "\n", file=sys.stderr)
         return resultado
 
     except Exception as e:
-        print(f"❌ ERROR: {e}", file=sys.stderr)
-        import traceback
-        traceback.print_exc(file=sys.stderr)
+        log.error("Error en ejecutar_operacion: %s", e, exc_info=True)
         
         return {
             "success": False,
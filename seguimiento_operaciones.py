@@ -0,0 +1,248 @@
+import time
+import threading
+from concurrent.futures import Future, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from metricas import duracion_etapas, operaciones_liquidadas
+from bitacora import obtener_logger
+
+log = obtener_logger("seguimiento")
+
+# Cada cuánto se revisan los eventos del websocket (solo memoria)
+INTERVALO_REVISION = 0.5
+# Mínimo entre consultas get_optioninfo_v2 a una misma sesión
+INTERVALO_CONSULTA = 1.5
+# Las consultas al broker empiezan este tiempo antes de la expiración estimada
+MARGEN_CONSULTA = 5
+# get_optioninfo_v2 espera la respuesta sin límite: corre en threads aparte
+# (daemon, para no retener el cierre del proceso), a lo sumo MAX_CONSULTAS a
+# la vez y una por sesión
+MAX_CONSULTAS = 4
+# Espera máxima por las consultas de una revisión; las colgadas se siguen
+# recogiendo en revisiones posteriores sin frenar los timeouts
+TIMEOUT_CONSULTA = 2.0
+# Holgura sobre el timeout de una operación para quien espera su Future
+MARGEN_ESPERA = 10
+
+
+def _resultado(id_operacion, ganancia, win, raw) -> Dict[str, Any]:
+    return {
+        "finalizada": True,
+        "ganancia": ganancia,
+        "win": win,
+        "id": id_operacion,
+        "resultado_raw": raw
+    }
+
+
+def _desde_estado(id_operacion, estado: str, monto: float, ganancia_bruta: float, raw) -> Optional[Dict[str, Any]]:
+    """Interpreta los estados 'win' / 'loose' / 'equal' que usa IQ Option."""
+    estado = (estado or "").lower()
+    if estado == "win":
+        return _resultado(id_operacion, ganancia_bruta, True, raw)
+    if estado == "equal":
+        return _resultado(id_operacion, 0, None, raw)
+    if estado in ("loose", "lose", "loss"):
+        return _resultado(id_operacion, -monto, False, raw)
+    return None
+
+
+class _Posicion:
+    __slots__ = ("iq", "id", "monto", "registrada", "consultar_desde", "vence", "futuro")
+
+    def __init__(self, iq, id_operacion, monto: float, expiracion: float, timeout: float):
+        ahora = time.time()
+        self.iq = iq
+        self.id = id_operacion
+        self.monto = monto
+        self.registrada = ahora
+        self.consultar_desde = ahora + max(expiracion - MARGEN_CONSULTA, 0)
+        self.vence = ahora + timeout
+        self.futuro: Future = Future()
+
+
+class SeguimientoOperaciones:
+    """
+    Seguimiento de todas las operaciones abiertas desde un único thread.
+
+    Cada operación registrada recibe un Future que se resuelve con el mismo
+    dict que retornaba verificar_resultado. En cada revisión se consulta
+    primero el evento de cierre que el websocket ya dejó en memoria
+    (`socket_option_closed`, sin ida y vuelta al broker); para las que ya
+    deberían haber expirado se hace una sola consulta `get_optioninfo_v2` por
+    sesión que cubre todas sus posiciones. Es la misma fuente que usa
+    check_win_v3, pero sin bloquear hasta que la operación sea la última
+    cerrada. Esa consulta corre en un thread aparte: si el websocket de una
+    sesión se cae, sus posiciones terminan por timeout y las demás sesiones
+    se siguen liquidando.
+    """
+
+    def __init__(self, intervalo: float = INTERVALO_REVISION):
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._pendientes: Dict[Any, _Posicion] = {}
+        self._hay_trabajo = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._ultima_consulta: Dict[int, float] = {}
+        self._en_curso: Dict[int, Tuple[Future, List[_Posicion]]] = {}
+        self._observadores = []
+
+    def registrar(self, iq, id_operacion, monto: float, expiracion: float = 60, timeout: float = 70,
+                  callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Future:
+        """
+        Registra una operación abierta y retorna un Future con su resultado.
+
+        `expiracion` son los segundos estimados hasta el cierre; `callback`
+        recibe el dict de resultado cuando la operación se liquida.
+        """
+        posicion = _Posicion(iq, id_operacion, monto, expiracion, timeout)
+        if callback:
+            posicion.futuro.add_done_callback(lambda f: callback(f.result()))
+
+        with self._lock:
+            self._pendientes[id_operacion] = posicion
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._bucle, daemon=True, name="seguimiento-operaciones")
+                self._thread.start()
+        self._hay_trabajo.set()
+        return posicion.futuro
+
+    def al_liquidar(self, callback: Callable[[Any, Dict[str, Any]], None]):
+        """Registra un callback que recibe (sesión iq, resultado) de cada operación liquidada"""
+        self._observadores.append(callback)
+
+    @property
+    def abiertas(self) -> int:
+        with self._lock:
+            return len(self._pendientes)
+
+    def _bucle(self):
+        while True:
+            self._hay_trabajo.wait()
+            with self._lock:
+                posiciones = list(self._pendientes.values())
+                if not posiciones:
+                    self._hay_trabajo.clear()
+                    continue
+
+            try:
+                self._revisar(posiciones)
+            except Exception as e:
+                log.warning("Error revisando operaciones abiertas: %s", e)
+            time.sleep(self.intervalo)
+
+    def _liquidar(self, posicion: _Posicion, resultado: Dict[str, Any]):
+        with self._lock:
+            if self._pendientes.pop(posicion.id, None) is None:
+                return
+        duracion_etapas.observar(time.time() - posicion.registrada, 'liquidacion')
+        if resultado.get("finalizada"):
+            estado = "win" if resultado["win"] else ("refund" if resultado["win"] is None else "loss")
+            log.info("Operación %s liquidada: %s $%.2f", posicion.id, estado.upper(), resultado['ganancia'])
+            operaciones_liquidadas.inc(estado)
+        else:
+            operaciones_liquidadas.inc("sin_resultado")
+        for observador in list(self._observadores):
+            try:
+                observador(posicion.iq, resultado)
+            except Exception as e:
+                log.warning("Error notificando liquidación de %s: %s", posicion.id, e)
+        posicion.futuro.set_result(resultado)
+
+    def _revisar(self, posiciones: List[_Posicion]):
+        ahora = time.time()
+        por_consultar: Dict[int, List[_Posicion]] = {}
+
+        for posicion in posiciones:
+            resultado = self._desde_evento(posicion)
+            if resultado:
+                self._liquidar(posicion, resultado)
+            elif ahora >= posicion.vence:
+                timeout = int(posicion.vence - posicion.registrada)
+                log.warning("Timeout esperando resultado de %s después de %d segundos", posicion.id, timeout)
+                self._liquidar(posicion, {
+                    "finalizada": False,
+                    "ganancia": 0,
+                    "win": None,
+                    "id": posicion.id,
+                    "mensaje": f"Timeout después de {timeout} segundos"
+                })
+            elif ahora >= posicion.consultar_desde:
+                por_consultar.setdefault(id(posicion.iq), []).append(posicion)
+
+        # Una consulta por sesión para todas sus posiciones vencidas
+        lanzadas = []
+        for sesion, grupo in por_consultar.items():
+            if sesion in self._en_curso or len(self._en_curso) >= MAX_CONSULTAS:
+                continue
+            if ahora - self._ultima_consulta.get(sesion, 0) >= INTERVALO_CONSULTA:
+                self._ultima_consulta[sesion] = ahora
+                futuro = self._consultar(grupo[0].iq, max(10, len(grupo) * 2))
+                self._en_curso[sesion] = (futuro, grupo)
+                lanzadas.append(futuro)
+        if lanzadas:
+            wait(lanzadas, timeout=TIMEOUT_CONSULTA)
+
+        for sesion, (futuro, grupo) in list(self._en_curso.items()):
+            if not futuro.done():
+                continue
+            del self._en_curso[sesion]
+            try:
+                cerradas = futuro.result()
+            except Exception as e:
+                log.debug("Consulta de operaciones cerradas fallida: %s", e)
+                continue
+            self._desde_historial(grupo, cerradas)
+
+    @staticmethod
+    def _desde_evento(posicion: _Posicion) -> Optional[Dict[str, Any]]:
+        """Evento 'socket-option-closed' recibido por el websocket (sin red)."""
+        try:
+            cerradas = getattr(posicion.iq.api, "socket_option_closed", None) or {}
+            evento = cerradas.get(posicion.id)
+            if not evento:
+                return None
+            msg = evento.get("msg", evento)
+            ganancia = float(msg.get("win_amount", 0) or 0) - float(msg.get("sum", posicion.monto) or 0)
+            return _desde_estado(posicion.id, msg.get("win"), posicion.monto, ganancia, evento)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _consultar(iq, cantidad: int) -> Future:
+        """Lanza get_optioninfo_v2 en un thread; el Future trae las últimas operaciones cerradas."""
+        futuro: Future = Future()
+
+        def consultar():
+            try:
+                info = iq.get_optioninfo_v2(cantidad)
+                futuro.set_result((info or {}).get("msg", {}).get("closed_options", []))
+            except Exception as e:
+                futuro.set_exception(e)
+
+        threading.Thread(target=consultar, daemon=True, name="seguimiento-consulta").start()
+        return futuro
+
+    def _desde_historial(self, grupo: List[_Posicion], cerradas: List[Dict[str, Any]]) -> List[_Posicion]:
+        """Resuelve un grupo de posiciones con el resultado de get_optioninfo_v2; retorna las no resueltas."""
+        por_id = {}
+        for opcion in cerradas:
+            ids = opcion.get("id")
+            for op_id in (ids if isinstance(ids, list) else [ids]):
+                por_id[op_id] = opcion
+
+        restantes = []
+        for posicion in grupo:
+            opcion = por_id.get(posicion.id)
+            resultado = None
+            if opcion:
+                ganancia = float(opcion.get("win_amount", 0) or 0) - float(opcion.get("amount", posicion.monto) or 0)
+                resultado = _desde_estado(posicion.id, opcion.get("win"), posicion.monto, ganancia, opcion)
+            if resultado:
+                self._liquidar(posicion, resultado)
+            else:
+                restantes.append(posicion)
+        return restantes
+
+
+# Instancia única compartida por el proceso
+seguimiento_operaciones = SeguimientoOperaciones()
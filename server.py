@@ -1,24 +1,40 @@
 import http.server
 import socketserver
+import asyncio
 import json
 import os
-import sys
 import traceback
 import time
-import uuid
 import threading
-from urllib.parse import urlparse, parse_qs
-from conexion import _connect
-from operar import ejecutar_operacion
+import contextlib
+from urllib.parse import urlparse, parse_qs, unquote
+from conexion import gestor_conexiones
+from balances import cache_balances
+from sesiones import almacen_sesiones
+from operar import ejecutar_operacion, ACTIVO, TIMEFRAME
+from escaner import escanear_activos
+from streaming_velas import gestor_streaming
+from modelos import registro_modelos
+from trabajos import gestor_trabajos, ColaTrabajosLlena, COMPLETADO, ERROR
+from eventos import bus_eventos, formato_sse, INTERVALO_PING
+from estaticos import CacheEstaticos
+from servidor_async import ServidorAsync, cabeceras_respuesta, respuesta_simple
+from seguimiento_operaciones import seguimiento_operaciones
+from metricas import registro_metricas, peticiones_http, duracion_http, TIPO_CONTENIDO
+from bitacora import obtener_logger
 from datetime import datetime
 import database  # ✅ Importación correcta
 
 PORT = int(os.environ.get("PORT", 8000))
+# "polling": ciclo por reloj | "streaming": decide al cierre de cada vela
+MODO_DATOS_BOT = os.environ.get("MODO_DATOS_BOT", "polling")
+# "threads": un thread por conexión | "asyncio": event loop + pool acotado (servidor_async.py)
+SERVIDOR_HTTP = os.environ.get("SERVIDOR_HTTP", "threads")
+MAX_LIMITE_HISTORIAL = 500
 CWD = os.path.dirname(os.path.abspath(__file__))
-
-# Sistema de sesiones mejorado
-active_sessions = {}
-session_tokens = {}
+cache_estaticos = CacheEstaticos(CWD)
+log_bot = obtener_logger("bot")
+log_http = obtener_logger("http")
 
 # Cargar estado del bot desde la base de datos al iniciar
 db_data = database.load_database()
@@ -29,68 +45,41 @@ bot_servidor_config = db_data['bot_servidor']['config']
 bot_servidor_thread = None
 bot_servidor_estadisticas = db_data['bot_servidor']['estadisticas']
 
+registro_metricas.medidor('synapse_bot_activo', '1 si el bot del servidor está activo',
+                          lambda: database.esta_activo_bot_servidor())
+registro_metricas.medidor('synapse_sesiones_activas', 'Sesiones HTTP de este proceso',
+                          lambda: almacen_sesiones.estadisticas()['sesiones'])
+registro_metricas.medidor('synapse_conexiones_iq', 'Conexiones abiertas a IQ Option',
+                          lambda: gestor_conexiones.estadisticas()['conexiones'])
+registro_metricas.medidor('synapse_operaciones_abiertas', 'Operaciones esperando liquidación',
+                          lambda: seguimiento_operaciones.abiertas)
+
 class SessionManager:
-    SESSION_TIMEOUT = 24 * 3600  # 24 horas
-    
-    @staticmethod
-    def generate_token():
-        return str(uuid.uuid4())
+    """Fachada sobre sesiones.almacen_sesiones (thread-safe, expiración por heap)"""
+    SESSION_TIMEOUT = almacen_sesiones.timeout
     
     @staticmethod
     def create_session(email, iq_instance):
-        token = SessionManager.generate_token()
-        active_sessions[token] = {
-            'email': email,
-            'iq': iq_instance,
-            'created_at': time.time(),
-            'last_activity': time.time(),
-            'gestor_riesgo': None
-        }
-        session_tokens[email] = token
-        return token
+        return almacen_sesiones.crear(email, iq_instance)
     
     @staticmethod
     def get_session(token):
-        if token in active_sessions:
-            session = active_sessions[token]
-            # Verificar expiración
-            if time.time() - session['last_activity'] > SessionManager.SESSION_TIMEOUT:
-                SessionManager.delete_session(token)
-                return None
-            
-            session['last_activity'] = time.time()
-            return session
-        return None
+        return almacen_sesiones.obtener(token)
     
     @staticmethod
     def delete_session(token):
-        if token in active_sessions:
-            email = active_sessions[token]['email']
-            if email in session_tokens:
-                del session_tokens[email]
-            del active_sessions[token]
+        almacen_sesiones.eliminar(token)
     
     @staticmethod
     def delete_session_by_email(email):
-        if email in session_tokens:
-            token = session_tokens[email]
-            SessionManager.delete_session(token)
+        almacen_sesiones.eliminar_email(email)
     
     @staticmethod
     def cleanup_expired_sessions():
         """Limpiar sesiones expiradas"""
-        current_time = time.time()
-        expired_tokens = []
-        
-        for token, session_data in active_sessions.items():
-            if current_time - session_data['last_activity'] > SessionManager.SESSION_TIMEOUT:
-                expired_tokens.append(token)
-        
-        for token in expired_tokens:
-            SessionManager.delete_session(token)
-        
-        if expired_tokens:
-            print(f"🧹 Sesiones expiradas limpiadas: {len(expired_tokens)}")
+        expiradas = almacen_sesiones.expirar()
+        if expiradas:
+            print(f"🧹 Sesiones expiradas limpiadas: {expiradas}")
 
 def get_authenticated_session(handler):
     """Obtener sesión autenticada desde headers con mejor manejo de errores"""
@@ -110,90 +99,110 @@ def get_authenticated_session(handler):
         print(f"❌ Error en autenticación: {e}")
         return None
 
-def obtener_balances_reales(iq):
-    """Obtiene balances REALES de las cuentas demo y real"""
-    real_balance = 0.0
-    demo_balance = 0.0
-    real_id = None
-    demo_id = None
-    
-    try:
-        print("💰 Obteniendo balances REALES...")
-        
-        # Método 1: Intentar con get_balances()
+def estado_bot_servidor_actual():
+    """Estado del bot servidor (mismo cuerpo que /estado_bot_servidor), desde memoria"""
+    bot_servidor = database.estado_bot.todos()
+    bot_stats = bot_servidor['estadisticas']
+    bot_config = bot_servidor['config']
+
+    proxima_operacion = bot_stats.get('proxima_operacion_timestamp')
+    tiempo_restante = None
+    if proxima_operacion:
+        tiempo_restante = max(0, proxima_operacion - time.time())
+
+    return {
+        'success': True,
+        'bot_activo': bot_servidor['activo'],
+        'config': bot_config,
+        'estadisticas': bot_stats,
+        'ultima_operacion': bot_servidor['ultima_operacion'],
+        'ultima_operacion_timestamp': bot_stats.get('ultima_operacion_timestamp'),
+        'proxima_operacion_timestamp': proxima_operacion,
+        'tiempo_restante_segundos': tiempo_restante,
+        'intervalo': bot_config.get('intervalo', 5)
+    }
+
+def publicar_estado_bot(claves):
+    """Empuja el estado del bot a los dashboards conectados (/eventos)"""
+    if claves != {'credenciales'}:
+        bus_eventos.publicar('estado_bot', estado_bot_servidor_actual())
+
+def publicar_trabajo(trabajo, propietario):
+    """Avisa al dueño de una operación manual cada cambio de estado"""
+    bus_eventos.publicar('trabajo', trabajo, destinatario=propietario)
+
+database.estado_bot.al_cambiar(publicar_estado_bot)
+gestor_trabajos.al_cambiar(publicar_trabajo)
+
+def resumen_operacion(resultado):
+    """Campos de una operación que se envían en los eventos de decisión"""
+    return {k: resultado.get(k) for k in ('decision', 'razon', 'probabilidad', 'modo', 'activo',
+                                          'ejecutado', 'trade_id', 'monto_calculado', 'resultado_trade')}
+
+def trabajo_operacion_manual(trabajo_id, iq, config):
+    """
+    Trabajo en segundo plano de /operar.
+
+    El worker solo analiza y abre la operación; el cierre llega desde el
+    seguimiento de operaciones y la consulta de balances y el guardado se
+    hacen en una tarea aparte del mismo pool.
+    """
+    def finalizar(resultado):
+        # Balances después de la operación (la liquidación invalidó el cache)
+        real_balance, demo_balance, real_id, demo_id = cache_balances.obtener(iq)
+
+        # Agregar balances actualizados al resultado
+        resultado['balances_actualizados'] = {
+            'real': real_balance,
+            'demo': demo_balance
+        }
+
+        # Guardar operación en la base de datos
+        database.agregar_operacion(resultado)
+        gestor_trabajos.completar(trabajo_id, resultado)
+        log_http.info("Operación manual completada (%s)", trabajo_id)
+
+    def finalizar_seguro(resultado):
         try:
-            balances_data = iq.get_balances()
-            
-            if balances_data and isinstance(balances_data, dict):
-                balances_list = balances_data.get('msg', [])
-                
-                for bal in balances_list:
-                    if isinstance(bal, dict):
-                        bal_type = bal.get('type')
-                        amount = bal.get('amount', 0)
-                        bal_id = bal.get('id')
-                        
-                        # Tipo 1 = REAL, Tipo 4 = PRACTICE
-                        if bal_type == 1:
-                            real_balance = float(amount)
-                            real_id = bal_id
-                            print(f"✅ Balance REAL: ${real_balance}")
-                        elif bal_type == 4:
-                            demo_balance = float(amount)
-                            demo_id = bal_id
-                            print(f"✅ Balance DEMO: ${demo_balance}")
-            
+            finalizar(resultado)
         except Exception as e:
-            print(f"⚠️ Error con get_balances(): {e}")
+            log_http.error("Error finalizando operación manual %s: %s", trabajo_id, e)
+            gestor_trabajos.fallar(trabajo_id, str(e))
 
-        # Método 2: Método alternativo si no se encontraron balances
-        if real_balance == 0 and demo_balance == 0:
-            print("🔄 Usando método alternativo para balances...")
-            try:
-                # Cambiar a REAL y obtener balance
-                if iq.change_balance('REAL'):
-                    time.sleep(1)
-                    real_balance_raw = iq.get_balance()
-                    if real_balance_raw:
-                        real_balance = float(real_balance_raw)
-                        print(f"💰 Balance REAL (alternativo): ${real_balance}")
-                
-                # Cambiar a PRACTICE y obtener balance
-                if iq.change_balance('PRACTICE'):
-                    time.sleep(1)
-                    demo_balance_raw = iq.get_balance()
-                    if demo_balance_raw:
-                        demo_balance = float(demo_balance_raw)
-                        print(f"🎯 Balance DEMO (alternativo): ${demo_balance}")
-                
-                # Volver a REAL por defecto
-                iq.change_balance('REAL')
-                time.sleep(0.5)
-                
-            except Exception as e2:
-                print(f"❌ Error en método alternativo: {e2}")
+    def al_liquidar(resultado):
+        # Llamado desde el thread de seguimiento: no bloquearlo con la red
+        gestor_trabajos.enviar_tarea(finalizar_seguro, resultado)
 
-        # Si aún no hay balances, usar valores por defecto
-        if real_balance == 0 and demo_balance == 0:
-            print("💰 Usando valores por defecto para balances")
-            real_balance = 0.0
-            demo_balance = 10000.0
+    resultado = ejecutar_operacion(
+        iq,
+        modo=config.get('modo', 'demo'),
+        monto=config.get('monto'),
+        ejecutar_auto=config.get('ejecutar_auto', False),
+        forzar_operacion=config.get('forzar_operacion', False),
+        config_riesgo={
+            'riesgo_porcentaje': config.get('riesgo_porcentaje', 2.0),
+            'max_perdidas_consecutivas': config.get('max_perdidas_consecutivas', 3),
+            'stop_loss_diario': config.get('stop_loss_diario', 15),
+            'monto_maximo': config.get('monto_maximo', 10)
+        },
+        esperar_resultado=False,
+        al_liquidar=al_liquidar
+    )
 
-        print(f"📊 RESUMEN FINAL: REAL: ${real_balance}, DEMO: ${demo_balance}")
-        
-    except Exception as e:
-        print(f"❌ Error general obteniendo balances: {e}")
-        real_balance = 0.0
-        demo_balance = 10000.0
-    
-    return real_balance, demo_balance, real_id, demo_id
+    if (resultado.get('resultado_trade') or {}).get('pendiente'):
+        # Operación abierta: liberar el worker hasta que se liquide
+        gestor_trabajos.esperar_resultado(trabajo_id, dict(resultado))
+        return None
+
+    finalizar(resultado)
+    return resultado
 
 # 🔥 NUEVA FUNCIÓN MEJORADA: Bot servidor 24/7 con timing preciso
 def ejecutar_bot_servidor():
     """Ejecuta el bot automático en el servidor de forma continua y precisa"""
     global bot_servidor_thread
     
-    print(f"\n🎯 INICIANDO BOT SERVIDOR 24/7 - INDEPENDIENTE DEL CLIENTE")
+    log_bot.info("Iniciando bot servidor 24/7")
     
     # Cargar configuración desde la base de datos
     db_data = database.load_database()
@@ -202,16 +211,16 @@ def ejecutar_bot_servidor():
     bot_credenciales = db_data['bot_servidor']['credenciales']
 
     if not bot_credenciales or not bot_credenciales.get('email') or not bot_credenciales.get('password'):
-        print("❌ ERROR: Credenciales del bot no configuradas. Deteniendo bot.")
+        log_bot.error("Credenciales del bot no configuradas, deteniendo bot")
         database.detener_bot_servidor()
         return
 
     try:
-        print(f"🤖 Conectando bot ({bot_credenciales['email']}) a IQ Option...")
-        iq_session = _connect(bot_credenciales['email'], bot_credenciales['password'])
-        print("✅ Bot conectado exitosamente.")
+        log_bot.info("Conectando bot (%s) a IQ Option", bot_credenciales['email'])
+        iq_session = gestor_conexiones.adquirir(bot_credenciales['email'], bot_credenciales['password'])
+        log_bot.info("Bot conectado")
     except Exception as e:
-        print(f"❌ ERROR FATAL al conectar el bot: {e}")
+        log_bot.error("Error fatal al conectar el bot: %s", e)
         database.detener_bot_servidor()
         return
 
@@ -220,14 +229,32 @@ def ejecutar_bot_servidor():
         'iq': iq_session
     }
 
-    print(f"⏰ Intervalo: {bot_config.get('intervalo', 5)} minutos")
-    print(f"🎮 Modo: {bot_config.get('modo', 'demo').upper()}")
-    print(f"📊 Configuración riesgo: {bot_config.get('riesgo_porcentaje', 2)}%")
+    log_bot.info("Configuración del bot", extra={'intervalo_min': bot_config.get('intervalo', 5),
+                                                 'modo': bot_config.get('modo', 'demo'),
+                                                 'riesgo_porcentaje': bot_config.get('riesgo_porcentaje', 2)})
     
     # 🔥 TIMING PRECISO: Calcular el próximo ciclo exacto
     intervalo_segundos = bot_config.get('intervalo', 5) * 60
     siguiente_ciclo = time.time()
     
+    # 📡 STREAMING: suscripción en vivo, las decisiones se toman al cierre de vela
+    suscripcion = None
+    if bot_config.get('modo_datos', MODO_DATOS_BOT) == 'streaming':
+        try:
+            suscripcion = gestor_streaming.suscribir(iq_session, ACTIVO, TIMEFRAME)
+            log_bot.info("Modo streaming: se decide al cierre de cada vela de %dmin", TIMEFRAME // 60)
+        except Exception as e:
+            log_bot.warning("No se pudo iniciar el streaming, usando polling: %s", e)
+    ultimo_cierre = None
+    
+    def esperar_cierre_vela():
+        """Espera el primer cierre de vela que cumpla el intervalo; None si el bot se detiene"""
+        while not database.estado_bot.detenido.is_set():
+            vela = suscripcion.esperar_cierre(timeout=1)
+            if vela and (ultimo_cierre is None or vela['from'] - ultimo_cierre >= intervalo_segundos):
+                return vela
+        return None
+    
     # Estadísticas de inicio
     bot_stats['inicio_timestamp'] = time.time()
     database.actualizar_estadisticas_bot(bot_stats)
@@ -239,41 +266,38 @@ def ejecutar_bot_servidor():
             ciclo_numero += 1
             tiempo_actual = time.time()
             
-            # 🔥 TIMING PRECISO: Esperar hasta el próximo ciclo exacto
-            tiempo_espera = siguiente_ciclo - tiempo_actual
-            if tiempo_espera > 0:
-                # Espera precisa en segmentos pequeños para poder detener el bot
-                segmentos = int(tiempo_espera)
-                for i in range(segmentos):
-                    if not database.esta_activo_bot_servidor():
-                        return
-                    time.sleep(1)
-                if tiempo_espera - segmentos > 0:
-                    time.sleep(tiempo_espera - segmentos)
-            
-            # Calcular próximo ciclo
-            siguiente_ciclo = time.time() + intervalo_segundos
+            if suscripcion is not None:
+                # 📡 Esperar el cierre de vela en lugar del reloj
+                vela_cerrada = esperar_cierre_vela()
+                if vela_cerrada is None:
+                    break
+                ultimo_cierre = vela_cerrada['from']
+                siguiente_ciclo = vela_cerrada['from'] + TIMEFRAME + intervalo_segundos
+            else:
+                # 🔥 TIMING PRECISO: Esperar hasta el próximo ciclo exacto
+                tiempo_espera = siguiente_ciclo - tiempo_actual
+                if tiempo_espera > 0:
+                    # Espera precisa; se interrumpe en cuanto se detiene el bot
+                    if database.estado_bot.esperar_detencion(tiempo_espera):
+                        break
+                
+                # Calcular próximo ciclo
+                siguiente_ciclo = time.time() + intervalo_segundos
             bot_stats['proxima_operacion_timestamp'] = siguiente_ciclo
             database.actualizar_estadisticas_bot(bot_stats)
             
-            print(f"\n{'='*60}")
-            print(f"🤖 BOT SERVIDOR - CICLO {ciclo_numero}")
-            print(f"{'='*60}")
-            print(f"👤 Usuario: {session_activa['email']}")
-            print(f"⏰ Hora actual: {time.strftime('%H:%M:%S')}")
-            print(f"⏰ Próxima operación: {time.strftime('%H:%M:%S', time.localtime(siguiente_ciclo))}")
-            print(f"{'='*60}")
+            log_bot.debug("Ciclo %d de %s", ciclo_numero, session_activa['email'])
             
             # 🔥 VERIFICAR STOP LOSS DIARIO
             stop_loss_diario = bot_config.get('stop_loss_diario', 15)
             if (bot_stats['ganancia_total'] < -abs(stop_loss_diario) and 
                 bot_stats['operaciones_ejecutadas'] > 0):
-                print(f"🛑 STOP LOSS DIARIO ACTIVADO: ${bot_stats['ganancia_total']:.2f}")
-                print("🔴 El bot se detendrá automáticamente")
+                log_bot.warning("Stop loss diario activado ($%.2f), deteniendo el bot", bot_stats['ganancia_total'])
                 database.detener_bot_servidor()
                 break
             
             # 🔥 EJECUTAR OPERACIÓN
+            liquidada = threading.Event()
             resultado = ejecutar_operacion(
                 session_activa['iq'],
                 modo=bot_config.get('modo', 'demo'),
@@ -285,8 +309,16 @@ def ejecutar_bot_servidor():
                     'max_perdidas_consecutivas': bot_config.get('max_perdidas_consecutivas', 3),
                     'stop_loss_diario': bot_config.get('stop_loss_diario', 15),
                     'monto_maximo': bot_config.get('monto_maximo', 10)
-                }
+                },
+                al_cierre=suscripcion is not None,
+                esperar_resultado=False,
+                al_liquidar=lambda _: liquidada.set()
             )
+
+            # 📡 La decisión se publica apenas se abre la operación; luego se espera el cierre
+            bus_eventos.publicar('decision', dict(resumen_operacion(resultado), ciclo=ciclo_numero))
+            if (resultado.get('resultado_trade') or {}).get('pendiente'):
+                liquidada.wait(timeout=180)
             
             # 🔥 ACTUALIZAR ESTADÍSTICAS
             bot_stats['operaciones_ejecutadas'] += 1
@@ -303,33 +335,62 @@ def ejecutar_bot_servidor():
                 if resultado.get('resultado_trade') and resultado['resultado_trade'].get('finalizada'):
                     ganancia = resultado['resultado_trade'].get('ganancia', 0)
                     bot_stats['ganancia_total'] += ganancia
-                    print(f"💰 Resultado: {'✅ GANANCIA' if ganancia > 0 else '❌ PÉRDIDA'} - ${abs(ganancia):.2f}")
+                    log_bot.debug("Resultado %s $%.2f", "ganancia" if ganancia > 0 else "pérdida", abs(ganancia))
             
             bot_stats['ultima_operacion_timestamp'] = time.time()
             database.actualizar_estadisticas_bot(bot_stats)
             database.agregar_operacion(resultado)
+
+            if resultado.get('resultado_trade') and resultado['resultado_trade'].get('finalizada'):
+                bus_eventos.publicar('liquidacion', resumen_operacion(resultado))
             
-            # 🔥 MOSTRAR ESTADÍSTICAS ACTUALIZADAS
-            print(f"📊 ESTADÍSTICAS BOT 24/7:")
-            print(f"   Operaciones totales: {bot_stats['operaciones_ejecutadas']}")
-            print(f"   Operaciones exitosas: {bot_stats['operaciones_exitosas']}")
-            print(f"   Ganancia total: ${bot_stats['ganancia_total']:.2f}")
-            print(f"   Stop loss diario: ${stop_loss_diario}")
-            print(f"⏳ Próxima operación: {time.strftime('%H:%M:%S', time.localtime(siguiente_ciclo))}")
-            print(f"{'='*60}\n")
+            # 🔥 UNA LÍNEA POR CICLO CON LAS ESTADÍSTICAS
+            log_bot.info("Ciclo %d terminado", ciclo_numero, extra={
+                'operaciones': bot_stats['operaciones_ejecutadas'],
+                'exitosas': bot_stats['operaciones_exitosas'],
+                'ganancia_total': round(bot_stats['ganancia_total'], 2),
+                'proxima': time.strftime('%H:%M:%S', time.localtime(siguiente_ciclo))
+            })
                 
         except Exception as e:
-            print(f"❌ ERROR en bot servidor: {e}")
-            traceback.print_exc()
+            log_bot.error("Error en bot servidor: %s", e, exc_info=True)
             # En caso de error, esperar 2 minutos antes de reintentar
             siguiente_ciclo = time.time() + 120
     
-    print("🛑 BOT SERVIDOR DETENIDO")
+    if suscripcion is not None:
+        gestor_streaming.cancelar(iq_session, ACTIVO, TIMEFRAME)
+    gestor_conexiones.liberar(iq_session)
+    log_bot.info("Bot servidor detenido")
 
 class MyHttpRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    # Tabla de rutas: path exacto -> método del handler
+    RUTAS_GET = {
+        '/test': 'ruta_test',
+        '/estado_bot_servidor': 'ruta_estado_bot_servidor',
+        '/eventos': 'ruta_eventos',
+        '/historial_operaciones': 'ruta_historial_operaciones',
+        '/estadisticas': 'ruta_estadisticas',
+        '/check_session': 'ruta_check_session',
+        '/debug_sessions': 'ruta_debug_sessions',
+        '/metrics': 'ruta_metrics'
+    }
+    PREFIJOS_GET = (
+        ('/operar/', 'ruta_estado_trabajo'),
+    )
+    RUTAS_POST = {
+        '/login': 'ruta_login',
+        '/logout': 'ruta_logout',
+        '/force_logout': 'ruta_force_logout',
+        '/operar': 'ruta_operar',
+        '/iniciar_bot_servidor': 'ruta_iniciar_bot_servidor',
+        '/detener_bot_servidor': 'ruta_detener_bot_servidor',
+        '/escanear': 'ruta_escanear',
+        '/reset_riesgo': 'ruta_reset_riesgo'
+    }
     
     def log_message(self, format, *args):
-        sys.stderr.write(f"[{self.log_date_time_string()}] {format % args}\n")
+        log_http.debug(format, *args, extra={'cliente': self.client_address[0]})
     
     def end_headers(self):
         self.send_header('Access-Control-Allow-Origin', '*')
@@ -341,547 +402,645 @@ class MyHttpRequestHandler(http.server.BaseHTTPRequestHandler):
         self.send_response(200)
         self.end_headers()
     
+    def send_response(self, code, message=None):
+        self.codigo_respuesta = code
+        super().send_response(code, message)
+
+    @contextlib.contextmanager
+    def medir_peticion(self):
+        """Cuenta la petición y su duración por método, ruta y código de respuesta"""
+        self.ruta_metrica = 'otra'
+        self.codigo_respuesta = 0
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            duracion_http.observar(time.perf_counter() - inicio, self.command, self.ruta_metrica)
+            peticiones_http.inc(self.command, self.ruta_metrica, self.codigo_respuesta)
+
+    def buscar_ruta(self, rutas, prefijos=()):
+        """Método que atiende self.path según la tabla de rutas, o None"""
+        ruta = urlparse(self.path).path
+        clave = ruta.rstrip('/') or '/'
+        nombre = rutas.get(clave)
+        if nombre is None:
+            clave, nombre = next(((prefijo, n) for prefijo, n in prefijos if ruta.startswith(prefijo)), (None, None))
+        if nombre:
+            # Las métricas se etiquetan con la ruta de la tabla (no con cada job_id)
+            self.ruta_metrica = clave
+        return getattr(self, nombre) if nombre else None
+
     def do_GET(self):
-        if self.path.rstrip('/') == '/test':
-            self.send_response(200)
+        with self.medir_peticion():
+            metodo = self.buscar_ruta(self.RUTAS_GET, self.PREFIJOS_GET)
+            if metodo:
+                metodo()
+                return
+
+            # Servir archivos estáticos
+            self.ruta_metrica = 'estaticos'
+            self.servir_estatico()
+
+    def ruta_test(self):
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({
+            'status': 'ok',
+            'message': 'Servidor funcionando correctamente',
+            'cwd': CWD
+        }).encode('utf-8'))
+
+    # 🔥 Endpoint para verificar estado del bot servidor
+    def ruta_estado_bot_servidor(self):
+        session = get_authenticated_session(self)
+        if not session:
+            self.send_response(401)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
             self.wfile.write(json.dumps({
-                'status': 'ok',
-                'message': 'Servidor funcionando correctamente',
-                'cwd': CWD
+                'success': False,
+                'error': 'No autorizado'
             }).encode('utf-8'))
             return
         
-        # 🔥 Endpoint para verificar estado del bot servidor
-        elif self.path == '/estado_bot_servidor':
-            session = get_authenticated_session(self)
-            if not session:
-                self.send_response(401)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({
-                    'success': False,
-                    'error': 'No autorizado'
-                }).encode('utf-8'))
-                return
-            
-            db_data = database.load_database()
-            bot_stats = db_data['bot_servidor']['estadisticas']
-            bot_config = db_data['bot_servidor']['config']
-            
-            proxima_operacion = bot_stats.get('proxima_operacion_timestamp')
-            tiempo_restante = None
-            if proxima_operacion:
-                tiempo_restante = max(0, proxima_operacion - time.time())
-            
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(estado_bot_servidor_actual()).encode('utf-8'))
+
+    # 📡 Canal push (Server-Sent Events); EventSource no envía headers, el token va en la URL
+    def ruta_eventos(self):
+        token = parse_qs(urlparse(self.path).query).get('token', [''])[0]
+        session = SessionManager.get_session(token) if token else None
+        if not session:
+            self.send_response(401)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': False,
+                'error': 'No autorizado'
+            }).encode('utf-8'))
+            return
+
+        self.servir_eventos(token, session['email'])
+
+    def ruta_historial_operaciones(self):
+        session = get_authenticated_session(self)
+        if not session:
+            self.send_response(401)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': False,
+                'error': 'No autorizado'
+            }).encode('utf-8'))
+            return
+        
+        try:
+            # Paginación por cursor y filtros desde los parámetros de la URL
+            query_components = parse_qs(urlparse(self.path).query)
+            param = lambda nombre: query_components.get(nombre, [None])[0]
+            limit = max(1, min(int(param('limit') or 50), MAX_LIMITE_HISTORIAL))
+            filtros = {
+                'before_timestamp': float(param('before_timestamp')) if param('before_timestamp') else None,
+                'before_id': int(param('before_id')) if param('before_id') else None,
+                'modo': param('modo'),
+                'decision': param('decision'),
+                'desde': param('desde'),
+                'hasta': param('hasta')
+            }
+            filas = database.iterar_historial(limit=limit, **filtros)
+            primera = next(filas, None)
+        except ValueError as e:
+            self.send_response(400)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': False,
+                'error': f'Parámetros inválidos: {e}'
+            }).encode('utf-8'))
+            return
+        except Exception as e:
+            print(f"❌ Error en /historial_operaciones: {e}")
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': False,
+                'error': 'Error al obtener el historial'
+            }).encode('utf-8'))
+            return
+
+        # Respuesta en streaming: cada operación se escribe tal como está guardada
+        try:
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
+            self.wfile.write(b'{"success": true, "historial": [')
+            enviadas, ultimo_ts, ultimo_id = 0, None, None
+            fila = primera
+            while fila is not None:
+                if enviadas:
+                    self.wfile.write(b',')
+                ultimo_ts, ultimo_id, datos = fila
+                self.wfile.write(datos.encode('utf-8'))
+                enviadas += 1
+                fila = next(filas, None)
+            # Cursor (timestamp, id) para la página siguiente (null si ya no hay más)
+            if enviadas < limit:
+                ultimo_ts = ultimo_id = None
+            self.wfile.write(f'], "next_before_timestamp": {json.dumps(ultimo_ts)}, '
+                             f'"next_before_id": {json.dumps(ultimo_id)}}}'.encode('utf-8'))
+        except BrokenPipeError:
+            print("⚠️ Cliente cerró la conexión durante /historial_operaciones")
+        except Exception as e:
+            # Los headers ya se enviaron: solo queda cortar la respuesta
+            print(f"❌ Error en /historial_operaciones: {e}")
+
+    # 📊 Estadísticas materializadas (no recorren el historial)
+    def ruta_estadisticas(self):
+        session = get_authenticated_session(self)
+        if not session:
+            self.send_response(401)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
             self.wfile.write(json.dumps({
+                'success': False,
+                'error': 'No autorizado'
+            }).encode('utf-8'))
+            return
+
+        try:
+            query_components = parse_qs(urlparse(self.path).query)
+            dias = int(query_components.get('dias', [30])[0])
+            # Todas las consultas antes de los headers: un error todavía puede responder 500
+            cuerpo = json.dumps({
                 'success': True,
-                'bot_activo': db_data['bot_servidor']['activo'],
-                'config': bot_config,
-                'estadisticas': bot_stats,
-                'ultima_operacion': database.obtener_ultima_operacion_bot(),
-                'ultima_operacion_timestamp': bot_stats.get('ultima_operacion_timestamp'),
-                'proxima_operacion_timestamp': proxima_operacion,
-                'tiempo_restante_segundos': tiempo_restante,
-                'intervalo': bot_config.get('intervalo', 5)
+                'total': database.obtener_agregados(),
+                'por_dia': database.obtener_agregados('dia', limite=dias),
+                'por_modo': database.obtener_agregados('modo'),
+                'por_activo': database.obtener_agregados('activo'),
+                'por_decision': database.obtener_agregados('decision')
+            }).encode('utf-8')
+        except Exception as e:
+            log_http.error("Error en /estadisticas: %s", e)
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': False,
+                'error': 'Error al obtener las estadísticas'
             }).encode('utf-8'))
             return
 
-        elif self.path == '/historial_operaciones':
-            session = get_authenticated_session(self)
-            if not session:
-                self.send_response(401)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({
-                    'success': False,
-                    'error': 'No autorizado'
-                }).encode('utf-8'))
-                return
-            
-            try:
-                # Obtener el límite de operaciones desde los parámetros de la URL
-                query_components = parse_qs(urlparse(self.path).query)
-                limit = int(query_components.get('limit', [50])[0])
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(cuerpo)
 
-                historial = database.obtener_historial(limit=limit)
+    def ruta_check_session(self):
+        try:
+            session = get_authenticated_session(self)
+            if session:
+                real_balance, demo_balance, real_id, demo_id = cache_balances.obtener(session['iq'])
                 
                 self.send_response(200)
                 self.send_header('Content-type', 'application/json')
                 self.end_headers()
                 self.wfile.write(json.dumps({
                     'success': True,
-                    'historial': historial
+                    'session_valid': True,
+                    'user_data': {
+                        'user': {'username': session['email'].split('@')[0], 'email': session['email']},
+                        'real': {'balance': real_balance, 'accountId': real_id or 'real_123'},
+                        'practice': {'balance': demo_balance, 'accountId': demo_id or 'demo_123'}
+                    }
                 }).encode('utf-8'))
-
-            except Exception as e:
-                print(f"❌ Error en /historial_operaciones: {e}")
-                self.send_response(500)
+            else:
+                self.send_response(200)
                 self.send_header('Content-type', 'application/json')
                 self.end_headers()
                 self.wfile.write(json.dumps({
-                    'success': False,
-                    'error': 'Error al obtener el historial'
+                    'success': True,
+                    'session_valid': False,
+                    'message': 'Sesión no válida o expirada'
                 }).encode('utf-8'))
-            return
+        except Exception as e:
+            print(f"❌ Error en check_session: {e}")
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': False,
+                'error': str(e)
+            }).encode('utf-8'))
 
-        elif self.path == '/check_session':
-            try:
-                session = get_authenticated_session(self)
-                if session:
-                    real_balance, demo_balance, real_id, demo_id = obtener_balances_reales(session['iq'])
-                    
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({
-                        'success': True,
-                        'session_valid': True,
-                        'user_data': {
-                            'user': {'username': session['email'].split('@')[0], 'email': session['email']},
-                            'real': {'balance': real_balance, 'accountId': real_id or 'real_123'},
-                            'practice': {'balance': demo_balance, 'accountId': demo_id or 'demo_123'}
-                        }
-                    }).encode('utf-8'))
-                else:
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({
-                        'success': True,
-                        'session_valid': False,
-                        'message': 'Sesión no válida o expirada'
-                    }).encode('utf-8'))
-            except Exception as e:
-                print(f"❌ Error en check_session: {e}")
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({
-                    'success': False,
-                    'error': str(e)
-                }).encode('utf-8'))
+    # Estado y resultado de operaciones manuales en segundo plano
+    def ruta_estado_trabajo(self):
+        session = get_authenticated_session(self)
+        if not session:
+            self.send_response(401)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': False,
+                'error': 'No autorizado'
+            }).encode('utf-8'))
             return
 
-        elif self.path == '/debug_sessions':
-            db_data = database.load_database()
-            self.send_response(200)
+        partes = urlparse(self.path).path.strip('/').split('/')
+        trabajo = None
+        if len(partes) in (2, 3) and (len(partes) == 2 or partes[2] == 'resultado'):
+            trabajo = gestor_trabajos.obtener(partes[1], propietario=session['email'])
+
+        if trabajo is None:
+            self.send_response(404)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
             self.wfile.write(json.dumps({
-                'active_sessions_count': len(active_sessions),
-                'session_tokens_count': len(session_tokens),
-                'bot_activo': db_data['bot_servidor']['activo'],
-                'bot_tiene_credenciales': db_data['bot_servidor']['credenciales'] is not None
+                'success': False,
+                'error': 'Operación no encontrada'
             }).encode('utf-8'))
             return
-        
-        # Servir archivos estáticos
-        path_to_serve = 'index.html' if self.path == '/' else self.path.lstrip('/')
-        requested_path = os.path.abspath(os.path.join(CWD, path_to_serve))
-        
-        if not requested_path.startswith(CWD):
+
+        if len(partes) == 2:
+            codigo, respuesta = 200, dict(trabajo, success=True)
+        elif trabajo['estado'] == COMPLETADO:
+            # Mismo cuerpo que retornaba /operar antes de ser asíncrono
+            codigo, respuesta = 200, trabajo['resultado']
+        elif trabajo['estado'] == ERROR:
+            codigo, respuesta = 500, {'success': False, 'error': trabajo['error']}
+        else:
+            codigo, respuesta = 202, {'success': True, 'job_id': trabajo['job_id'],
+                                      'estado': trabajo['estado'], 'pendiente': True}
+
+        self.send_response(codigo)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(respuesta).encode('utf-8'))
+
+    def ruta_debug_sessions(self):
+        db_data = database.load_database()
+        sesiones = almacen_sesiones.estadisticas()
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({
+            'active_sessions_count': sesiones['sesiones'],
+            'session_tokens_count': sesiones['cuentas'],
+            'sesiones': sesiones,
+            'bot_activo': db_data['bot_servidor']['activo'],
+            'bot_tiene_credenciales': db_data['bot_servidor']['credenciales'] is not None,
+            'modelo_cache': registro_modelos.estadisticas(),
+            'trabajos': gestor_trabajos.estadisticas(),
+            'conexiones_iq': gestor_conexiones.estadisticas(),
+            'conexiones_eventos': bus_eventos.conexiones
+        }).encode('utf-8'))
+
+    def ruta_metrics(self):
+        cuerpo = registro_metricas.exportar().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-type', TIPO_CONTENIDO)
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def servir_estatico(self):
+        """Archivos estáticos desde cache_estaticos (ETag, 304, gzip/br y Range)"""
+        ruta_url = unquote(urlparse(self.path).path)
+        path_to_serve = 'index.html' if ruta_url == '/' else ruta_url.lstrip('/')
+        requested_path = cache_estaticos.resolver(path_to_serve)
+
+        if requested_path is None:
             self.send_error(403, "Forbidden")
             return
 
         try:
-            with open(requested_path, 'rb') as file:
-                self.send_response(200)
-                
-                if requested_path.endswith(".html"):
-                    self.send_header('Content-type', 'text/html; charset=utf-8')
-                elif requested_path.endswith(".css"):
-                    self.send_header('Content-type', 'text/css')
-                elif requested_path.endswith(".js"):
-                    self.send_header('Content-type', 'application/javascript')
-                else:
-                    self.send_header('Content-type', 'application/octet-stream')
-                
-                self.end_headers()
-                self.wfile.write(file.read())
-                
-        except FileNotFoundError:
+            recurso = cache_estaticos.obtener(requested_path)
+        except (FileNotFoundError, NotADirectoryError):
             self.send_error(404, f'File Not Found: {path_to_serve}')
+            return
         except Exception as e:
             print(f"❌ Error en GET: {e}")
             traceback.print_exc()
             self.send_error(500, f'Server Error: {e}')
+            return
 
-    def do_POST(self):
-        global bot_servidor_thread
-        
         try:
-            if self.path == '/login':
-                try:
-                    content_length = int(self.headers.get('Content-Length', 0))
-                    if content_length == 0:
-                        raise Exception("Request body vacío")
-                    
-                    post_data = self.rfile.read(content_length)
-                    credentials = json.loads(post_data.decode('utf-8'))
-                    
-                    email = credentials.get('email', '').strip()
-                    password = credentials.get('password', '').strip()
-                    
-                    if not email or not password:
-                        raise Exception("Email y password son requeridos")
-                    
-                    print(f"\n{'='*70}")
-                    print(f"🔥 LOGIN REQUEST")
-                    print(f"{'='*70}")
-                    print(f"📧 Email: {email}")
-                    print(f"{'='*70}\n")
-
-                    # Verificar si ya hay sesión activa
-                    if email in session_tokens:
-                        existing_token = session_tokens[email]
-                        SessionManager.delete_session(existing_token)
-                        print(f"🔄 Sesión anterior eliminada para {email}")
-
-                    # Conectar a IQ Option
-                    print("⏳ Conectando a IQ Option...")
-                    iq_session = _connect(email, password)
-                    print("✅ Conexión establecida.")
-
-                    # Guardar credenciales para el bot 24/7
-                    database.guardar_credenciales_bot({'email': email, 'password': password})
-                    print("🔐 Credenciales guardadas para el bot 24/7.")
-                    
-                    # Obtener balances REALES
-                    real_balance, demo_balance, real_id, demo_id = obtener_balances_reales(iq_session)
-                    
-                    # Crear nueva sesión
-                    token = SessionManager.create_session(email, iq_session)
-                    print(f"🔑 Token de sesión generado: {token[:8]}...")
-
-                    # Respuesta exitosa con balances reales
-                    response_data = {
-                        "success": True,
-                        "session_token": token,
-                        "data": {
-                            "user": {
-                                "username": email.split("@")[0],
-                                "email": email,
-                                "userId": "user_123"
-                            },
-                            "real": {
-                                "balance": real_balance,
-                                "accountId": real_id or "real_123",
-                                "currency": "USD",
-                                "type": "REAL"
-                            },
-                            "practice": {
-                                "balance": demo_balance,
-                                "accountId": demo_id or "demo_123", 
-                                "currency": "USD",
-                                "type": "PRACTICE"
-                            }
-                        }
-                    }
+            if recurso.no_modificado(self.headers.get('If-None-Match'), self.headers.get('If-Modified-Since')):
+                self.send_response(304)
+                self.enviar_headers_cache(recurso)
+                self.end_headers()
+                return
 
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(response_data).encode('utf-8'))
-                    
-                    print(f"✅ LOGIN EXITOSO para {email}")
-                    print(f"💰 Balances - Real: ${real_balance}, Demo: ${demo_balance}\n")
-
-                except Exception as e:
-                    error_msg = str(e)
-                    print(f"❌ ERROR en login: {error_msg}")
-                    traceback.print_exc()
-                    
-                    self.send_response(500)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({
-                        'success': False, 
-                        'error': error_msg
-                    }).encode('utf-8'))
+            if recurso.contenido is not None:
+                codificacion = recurso.codificacion_para(self.headers.get('Accept-Encoding', ''))
+                cuerpo = recurso.variantes[codificacion] if codificacion else recurso.contenido
+                self.send_response(200)
+                self.send_header('Content-type', recurso.tipo)
+                self.send_header('Content-Length', str(len(cuerpo)))
+                if codificacion:
+                    self.send_header('Content-Encoding', codificacion)
+                self.enviar_headers_cache(recurso)
+                self.end_headers()
+                self.wfile.write(cuerpo)
+                return
+
+            # Archivo grande (video): desde disco con sendfile y soporte de Range
+            rango = recurso.rango(self.headers.get('Range'))
+            if rango == (-1, -1):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{recurso.tamano}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            inicio, fin = rango or (0, recurso.tamano - 1)
+            self.send_response(206 if rango else 200)
+            self.send_header('Content-type', recurso.tipo)
+            self.send_header('Content-Length', str(fin - inicio + 1))
+            if rango:
+                self.send_header('Content-Range', f'bytes {inicio}-{fin}/{recurso.tamano}')
+            self.enviar_headers_cache(recurso)
+            self.end_headers()
+            with open(recurso.ruta, 'rb') as archivo:
+                self.connection.sendfile(archivo, offset=inicio, count=fin - inicio + 1)
+
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def enviar_headers_cache(self, recurso):
+        self.send_header('ETag', recurso.etag)
+        self.send_header('Last-Modified', recurso.ultima_modificacion)
+        self.send_header('Accept-Ranges', 'bytes' if recurso.contenido is None else 'none')
+        if recurso.variantes:
+            self.send_header('Vary', 'Accept-Encoding')
+        # El HTML se revalida siempre (ETag); el resto puede cachearse una hora
+        if recurso.tipo.startswith('text/html'):
+            self.send_header('Cache-Control', 'no-cache')
+        else:
+            self.send_header('Cache-Control', 'public, max-age=3600')
+
+    def servir_eventos(self, token, email):
+        """Mantiene abierta la respuesta text/event-stream hasta que el cliente se desconecte"""
+        self.send_response(200)
+        self.send_header('Content-type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.end_headers()
+
+        suscriptor = bus_eventos.suscribir(email)
+        try:
+            # Estado actual apenas se conecta
+            self.wfile.write(formato_sse({'tipo': 'estado_bot', 'datos': estado_bot_servidor_actual(),
+                                          'timestamp': time.time()}))
+            self.wfile.flush()
+            while True:
+                evento = suscriptor.siguiente(timeout=INTERVALO_PING)
+                if evento is None:
+                    if not SessionManager.get_session(token):
+                        break
+                    self.wfile.write(b': ping\n\n')
+                else:
+                    self.wfile.write(formato_sse(evento))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            bus_eventos.cancelar(suscriptor)
+
+    def do_POST(self):
+        with self.medir_peticion():
+            try:
+                metodo = self.buscar_ruta(self.RUTAS_POST)
+                if metodo:
+                    metodo()
+                else:
+                    self.send_error(404, 'Endpoint not found')
+                
+            except BrokenPipeError:
+                print("⚠️ Cliente cerró la conexión abruptamente (BrokenPipeError)")
+            except Exception as e:
+                print(f"❌ ERROR general en do_POST: {e}")
+                traceback.print_exc()
             
-            elif self.path == '/logout':
                 try:
-                    session = get_authenticated_session(self)
-                    if session:
-                        SessionManager.delete_session_by_email(session['email'])
-                        print(f"✅ Sesión cerrada para {session['email']}")
-                    
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({
-                        'success': True,
-                        'message': 'Sesión cerrada correctamente'
-                    }).encode('utf-8'))
-                    
-                except Exception as e:
-                    error_msg = str(e)
-                    print(f"❌ ERROR en logout: {error_msg}")
-                    
                     self.send_response(500)
                     self.send_header('Content-type', 'application/json')
                     self.end_headers()
                     self.wfile.write(json.dumps({
                         'success': False,
-                        'error': error_msg
+                        'error': 'Error interno del servidor'
                     }).encode('utf-8'))
+                except BrokenPipeError:
+                    print("⚠️ Cliente cerró la conexión durante el manejo de error general")
+
+    def ruta_login(self):
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+            if content_length == 0:
+                raise Exception("Request body vacío")
             
-            elif self.path == '/force_logout':
-                try:
-                    content_length = int(self.headers.get('Content-Length', 0))
-                    if content_length > 0:
-                        post_data = self.rfile.read(content_length)
-                        data = json.loads(post_data.decode('utf-8'))
-                        email = data.get('email', '').strip()
-                        
-                        if email:
-                            SessionManager.delete_session_by_email(email)
-                            print(f"🔄 Sesión forzada cerrada para {email}")
-                    
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({
-                        'success': True,
-                        'message': 'Sesiones cerradas en todos los dispositivos'
-                    }).encode('utf-8'))
-                    
-                except Exception as e:
-                    error_msg = str(e)
-                    print(f"❌ ERROR en force_logout: {error_msg}")
-                    
-                    self.send_response(500)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({
-                        'success': False,
-                        'error': error_msg
-                    }).encode('utf-8'))
+            post_data = self.rfile.read(content_length)
+            credentials = json.loads(post_data.decode('utf-8'))
             
-            elif self.path == '/operar':
-                try:
-                    session = get_authenticated_session(self)
-                    if not session:
-                        self.send_response(401)
-                        self.send_header('Content-type', 'application/json')
-                        self.end_headers()
-                        self.wfile.write(json.dumps({
-                            'success': False,
-                            'error': 'Sesión no válida. Por favor, inicie sesión nuevamente.',
-                            'session_expired': True
-                        }).encode('utf-8'))
-                        return
-                    
-                    content_length = int(self.headers.get('Content-Length', 0))
-                    post_data = self.rfile.read(content_length) if content_length > 0 else b'{}'
-                    config = json.loads(post_data.decode('utf-8'))
-                    
-                    modo = config.get('modo', 'demo')
-                    monto = config.get('monto')
-                    ejecutar_auto = config.get('ejecutar_auto', False)
-                    forzar_operacion = config.get('forzar_operacion', False)
-                    
-                    print(f"\n{'='*70}")
-                    print(f"🎯 OPERACIÓN MANUAL SOLICITADA")
-                    print(f"{'='*70}")
-                    print(f"Usuario: {session['email']}")
-                    print(f"Modo: {modo.upper()}")
-                    print(f"Monto: {'AUTO' if monto is None else f'${monto}'}")
-                    print(f"Auto: {'SÍ' if ejecutar_auto else 'NO'}")
-                    print(f"Forzar: {'SÍ' if forzar_operacion else 'NO'}")
-                    print(f"{'='*70}\n")
-                    
-                    # EJECUTAR OPERACIÓN MANUAL
-                    resultado = ejecutar_operacion(
-                        session['iq'],
-                        modo=modo,
-                        monto=monto,
-                        ejecutar_auto=ejecutar_auto,
-                        forzar_operacion=forzar_operacion,
-                        config_riesgo={
-                            'riesgo_porcentaje': config.get('riesgo_porcentaje', 2.0),
-                            'max_perdidas_consecutivas': config.get('max_perdidas_consecutivas', 3),
-                            'stop_loss_diario': config.get('stop_loss_diario', 15),
-                            'monto_maximo': config.get('monto_maximo', 10)
-                        }
-                    )
-                    
-                    # Obtener balances actualizados después de la operación
-                    real_balance, demo_balance, real_id, demo_id = obtener_balances_reales(session['iq'])
-                    
-                    # Agregar balances actualizados al resultado
-                    resultado['balances_actualizados'] = {
-                        'real': real_balance,
-                        'demo': demo_balance
-                    }
-                    
-                    # Guardar operación en la base de datos
-                    database.agregar_operacion(resultado)
-                    
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    
-                    try:
-                        self.wfile.write(json.dumps(resultado).encode('utf-8'))
-                        print(f"✅ Operación MANUAL completada\n")
-                    except BrokenPipeError:
-                        print("⚠️ Cliente cerró la conexión antes de recibir la respuesta completa")
-                    
-                except Exception as e:
-                    error_msg = str(e)
-                    print(f"❌ ERROR en operación manual: {error_msg}")
-                    traceback.print_exc()
-                    
-                    try:
-                        self.send_response(500)
-                        self.send_header('Content-type', 'application/json')
-                        self.end_headers()
-                        self.wfile.write(json.dumps({
-                            'success': False,
-                            'error': error_msg
-                        }).encode('utf-8'))
-                    except BrokenPipeError:
-                        print("⚠️ Cliente cerró la conexión durante el manejo de error")
-            
-            # 🔥 BOT 24/7 - OPERACIÓN AUTOMÁTICA EN SERVIDOR
-            
-            elif self.path == '/iniciar_bot_servidor':
-                try:
-                    session = get_authenticated_session(self)
-                    if not session:
-                        raise Exception("No hay sesión activa")
-                    
-                    if database.esta_activo_bot_servidor():
-                        raise Exception("El bot servidor ya está activo")
-                    
-                    content_length = int(self.headers.get('Content-Length', 0))
-                    post_data = self.rfile.read(content_length) if content_length > 0 else b'{}'
-                    config = json.loads(post_data.decode('utf-8'))
-                    
-                    # Las credenciales ya se guardan en el login
-                    credenciales = database.obtener_credenciales_bot()
-                    if not credenciales or not credenciales.get('password'):
-                        raise Exception("No se encontraron credenciales guardadas. Por favor, inicie sesión de nuevo.")
-
-                    database.guardar_config_bot(config)
-                    
-                    # Reiniciar estadísticas en la base de datos
-                    nuevas_estadisticas = {
-                        'operaciones_ejecutadas': 0,
-                        'operaciones_exitosas': 0,
-                        'ganancia_total': 0.0,
-                        'ultima_operacion_timestamp': None,
-                        'inicio_timestamp': time.time(),
-                        'proxima_operacion_timestamp': None
+            email = credentials.get('email', '').strip()
+            password = credentials.get('password', '').strip()
+            
+            if not email or not password:
+                raise Exception("Email y password son requeridos")
+            
+            print(f"\n{'='*70}")
+            print(f"🔥 LOGIN REQUEST")
+            print(f"{'='*70}")
+            print(f"📧 Email: {email}")
+            print(f"{'='*70}\n")
+
+            # Verificar si ya hay sesión activa
+            existing_token = almacen_sesiones.token_de(email)
+            if existing_token:
+                SessionManager.delete_session(existing_token)
+                print(f"🔄 Sesión anterior eliminada para {email}")
+
+            # Conectar a IQ Option (reutiliza la conexión viva de la cuenta si la hay)
+            print("⏳ Conectando a IQ Option...")
+            iq_session = gestor_conexiones.adquirir(email, password)
+            print("✅ Conexión establecida.")
+
+            # Guardar credenciales para el bot 24/7
+            database.guardar_credenciales_bot({'email': email, 'password': password})
+            print("🔐 Credenciales guardadas para el bot 24/7.")
+            
+            # Obtener balances REALES
+            real_balance, demo_balance, real_id, demo_id = cache_balances.obtener(iq_session)
+            
+            # Crear nueva sesión
+            token = SessionManager.create_session(email, iq_session)
+            print(f"🔑 Token de sesión generado: {token[:8]}...")
+
+            # Respuesta exitosa con balances reales
+            response_data = {
+                "success": True,
+                "session_token": token,
+                "data": {
+                    "user": {
+                        "username": email.split("@")[0],
+                        "email": email,
+                        "userId": "user_123"
+                    },
+                    "real": {
+                        "balance": real_balance,
+                        "accountId": real_id or "real_123",
+                        "currency": "USD",
+                        "type": "REAL"
+                    },
+                    "practice": {
+                        "balance": demo_balance,
+                        "accountId": demo_id or "demo_123", 
+                        "currency": "USD",
+                        "type": "PRACTICE"
                     }
-                    database.actualizar_estadisticas_bot(nuevas_estadisticas)
-                    
-                    # Iniciar thread del bot
-                    bot_servidor_thread = threading.Thread(target=ejecutar_bot_servidor)
-                    bot_servidor_thread.daemon = True
-                    bot_servidor_thread.start()
-                    
-                    print(f"🚀 BOT 24/7 INICIADO para {session['email']}")
-                    print(f"📋 Configuración: {config}")
-                    print(f"🔐 Credenciales guardadas para reconexión automática")
-                    
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({
-                        'success': True,
-                        'message': 'Bot 24/7 iniciado en servidor - Funciona independientemente del cliente',
-                        'config': config
-                    }).encode('utf-8'))
-                    
-                except Exception as e:
-                    error_msg = str(e)
-                    print(f"❌ ERROR iniciando bot servidor: {error_msg}")
-                    
-                    self.send_response(500)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({
-                        'success': False,
-                        'error': error_msg
-                    }).encode('utf-8'))
+                }
+            }
+
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(response_data).encode('utf-8'))
             
-            elif self.path == '/detener_bot_servidor':
-                try:
-                    session = get_authenticated_session(self)
-                    if not session:
-                        raise Exception("No hay sesión activa")
-                    
-                    if not database.esta_activo_bot_servidor():
-                        raise Exception("El bot servidor no está activo")
-                    
-                    database.detener_bot_servidor()
-                    database.limpiar_credenciales_bot()  # Limpiar credenciales
-                    
-                    print(f"🛑 BOT 24/7 DETENIDO por {session['email']}")
-                    
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({
-                        'success': True,
-                        'message': 'Bot servidor detenido',
-                        'estadisticas_finales': database.obtener_estadisticas_bot()
-                    }).encode('utf-8'))
-                    
-                except Exception as e:
-                    error_msg = str(e)
-                    print(f"❌ ERROR deteniendo bot servidor: {error_msg}")
-                    
-                    self.send_response(500)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({
-                        'success': False,
-                        'error': error_msg
-                    }).encode('utf-8'))
+            print(f"✅ LOGIN EXITOSO para {email}")
+            print(f"💰 Balances - Real: ${real_balance}, Demo: ${demo_balance}\n")
 
-            elif self.path == '/reset_riesgo':
-                try:
-                    session = get_authenticated_session(self)
-                    if not session:
-                        raise Exception("No hay sesión activa")
-                    
-                    print(f"🔄 Riesgo reseteado para {session['email']}")
-                    
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({
-                        'success': True,
-                        'message': 'Estadísticas de riesgo reseteadas'
-                    }).encode('utf-8'))
-                    
-                except Exception as e:
-                    error_msg = str(e)
-                    print(f"❌ ERROR reseteando riesgo: {error_msg}")
-                    
-                    self.send_response(500)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({
-                        'success': False,
-                        'error': error_msg
-                    }).encode('utf-8'))
+        except Exception as e:
+            error_msg = str(e)
+            print(f"❌ ERROR en login: {error_msg}")
+            traceback.print_exc()
             
-            else:
-                self.send_error(404, 'Endpoint not found')
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': False, 
+                'error': error_msg
+            }).encode('utf-8'))
+
+    def ruta_logout(self):
+        try:
+            session = get_authenticated_session(self)
+            if session:
+                SessionManager.delete_session_by_email(session['email'])
+                print(f"✅ Sesión cerrada para {session['email']}")
+            
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': True,
+                'message': 'Sesión cerrada correctamente'
+            }).encode('utf-8'))
+            
+        except Exception as e:
+            error_msg = str(e)
+            print(f"❌ ERROR en logout: {error_msg}")
+            
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': False,
+                'error': error_msg
+            }).encode('utf-8'))
+
+    def ruta_force_logout(self):
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+            if content_length > 0:
+                post_data = self.rfile.read(content_length)
+                data = json.loads(post_data.decode('utf-8'))
+                email = data.get('email', '').strip()
                 
-        except BrokenPipeError:
-            print("⚠️ Cliente cerró la conexión abruptamente (BrokenPipeError)")
+                if email:
+                    SessionManager.delete_session_by_email(email)
+                    print(f"🔄 Sesión forzada cerrada para {email}")
+            
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': True,
+                'message': 'Sesiones cerradas en todos los dispositivos'
+            }).encode('utf-8'))
+            
+        except Exception as e:
+            error_msg = str(e)
+            print(f"❌ ERROR en force_logout: {error_msg}")
+            
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': False,
+                'error': error_msg
+            }).encode('utf-8'))
+
+    def ruta_operar(self):
+        try:
+            session = get_authenticated_session(self)
+            if not session:
+                self.send_response(401)
+                self.send_header('Content-type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({
+                    'success': False,
+                    'error': 'Sesión no válida. Por favor, inicie sesión nuevamente.',
+                    'session_expired': True
+                }).encode('utf-8'))
+                return
+            
+            content_length = int(self.headers.get('Content-Length', 0))
+            post_data = self.rfile.read(content_length) if content_length > 0 else b'{}'
+            config = json.loads(post_data.decode('utf-8'))
+            
+            modo = config.get('modo', 'demo')
+            monto = config.get('monto')
+            ejecutar_auto = config.get('ejecutar_auto', False)
+            forzar_operacion = config.get('forzar_operacion', False)
+            
+            log_http.info("Operación manual solicitada", extra={
+                'usuario': session['email'], 'modo': modo, 'monto': 'AUTO' if monto is None else monto,
+                'ejecutar_auto': ejecutar_auto, 'forzar': forzar_operacion})
+            
+            # EJECUTAR OPERACIÓN MANUAL en segundo plano
+            try:
+                trabajo_id = gestor_trabajos.enviar(trabajo_operacion_manual, session['iq'], config,
+                                                    propietario=session['email'])
+            except ColaTrabajosLlena as e:
+                self.send_response(503)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Retry-After', '5')
+                self.end_headers()
+                self.wfile.write(json.dumps({
+                    'success': False,
+                    'error': str(e)
+                }).encode('utf-8'))
+                return
+
+            self.send_response(202)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Location', f'/operar/{trabajo_id}')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': True,
+                'job_id': trabajo_id,
+                'estado': gestor_trabajos.obtener(trabajo_id)['estado'],
+                'status_url': f'/operar/{trabajo_id}',
+                'result_url': f'/operar/{trabajo_id}/resultado'
+            }).encode('utf-8'))
+            
         except Exception as e:
-            print(f"❌ ERROR general en do_POST: {e}")
+            error_msg = str(e)
+            print(f"❌ ERROR en operación manual: {error_msg}")
             traceback.print_exc()
             
             try:
@@ -890,19 +1049,240 @@ class MyHttpRequestHandler(http.server.BaseHTTPRequestHandler):
                 self.end_headers()
                 self.wfile.write(json.dumps({
                     'success': False,
-                    'error': 'Error interno del servidor'
+                    'error': error_msg
                 }).encode('utf-8'))
             except BrokenPipeError:
-                print("⚠️ Cliente cerró la conexión durante el manejo de error general")
+                print("⚠️ Cliente cerró la conexión durante el manejo de error")
 
+    # 🔥 BOT 24/7 - OPERACIÓN AUTOMÁTICA EN SERVIDOR
+    def ruta_iniciar_bot_servidor(self):
+        global bot_servidor_thread
+
+        try:
+            session = get_authenticated_session(self)
+            if not session:
+                raise Exception("No hay sesión activa")
+            
+            if database.esta_activo_bot_servidor():
+                raise Exception("El bot servidor ya está activo")
+            
+            content_length = int(self.headers.get('Content-Length', 0))
+            post_data = self.rfile.read(content_length) if content_length > 0 else b'{}'
+            config = json.loads(post_data.decode('utf-8'))
+            
+            # Las credenciales ya se guardan en el login
+            credenciales = database.obtener_credenciales_bot()
+            if not credenciales or not credenciales.get('password'):
+                raise Exception("No se encontraron credenciales guardadas. Por favor, inicie sesión de nuevo.")
+
+            database.guardar_config_bot(config)
+            
+            # Reiniciar estadísticas en la base de datos
+            nuevas_estadisticas = {
+                'operaciones_ejecutadas': 0,
+                'operaciones_exitosas': 0,
+                'ganancia_total': 0.0,
+                'ultima_operacion_timestamp': None,
+                'inicio_timestamp': time.time(),
+                'proxima_operacion_timestamp': None
+            }
+            database.actualizar_estadisticas_bot(nuevas_estadisticas)
+            
+            # Iniciar thread del bot
+            bot_servidor_thread = threading.Thread(target=ejecutar_bot_servidor)
+            bot_servidor_thread.daemon = True
+            bot_servidor_thread.start()
+            
+            print(f"🚀 BOT 24/7 INICIADO para {session['email']}")
+            print(f"📋 Configuración: {config}")
+            print(f"🔐 Credenciales guardadas para reconexión automática")
+            
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': True,
+                'message': 'Bot 24/7 iniciado en servidor - Funciona independientemente del cliente',
+                'config': config
+            }).encode('utf-8'))
+            
+        except Exception as e:
+            error_msg = str(e)
+            print(f"❌ ERROR iniciando bot servidor: {error_msg}")
+            
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': False,
+                'error': error_msg
+            }).encode('utf-8'))
+
+    def ruta_detener_bot_servidor(self):
+        try:
+            session = get_authenticated_session(self)
+            if not session:
+                raise Exception("No hay sesión activa")
+            
+            if not database.esta_activo_bot_servidor():
+                raise Exception("El bot servidor no está activo")
+            
+            database.detener_bot_servidor()
+            database.limpiar_credenciales_bot()  # Limpiar credenciales
+            
+            print(f"🛑 BOT 24/7 DETENIDO por {session['email']}")
+            
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': True,
+                'message': 'Bot servidor detenido',
+                'estadisticas_finales': database.obtener_estadisticas_bot()
+            }).encode('utf-8'))
+            
+        except Exception as e:
+            error_msg = str(e)
+            print(f"❌ ERROR deteniendo bot servidor: {error_msg}")
+            
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': False,
+                'error': error_msg
+            }).encode('utf-8'))
+
+    def ruta_escanear(self):
+        try:
+            session = get_authenticated_session(self)
+            if not session:
+                raise Exception("No hay sesión activa")
+            
+            content_length = int(self.headers.get('Content-Length', 0))
+            post_data = self.rfile.read(content_length) if content_length > 0 else b'{}'
+            config = json.loads(post_data.decode('utf-8'))
+            
+            activos = config.get('activos') or [ACTIVO]
+            resultados = escanear_activos(
+                session['iq'],
+                activos,
+                forzar=config.get('forzar_operacion', False)
+            )
+            
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': True,
+                'timestamp': datetime.now().isoformat(),
+                'senales': resultados
+            }).encode('utf-8'))
+            
+        except Exception as e:
+            error_msg = str(e)
+            print(f"❌ ERROR en escaneo: {error_msg}")
+            
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': False,
+                'error': error_msg
+            }).encode('utf-8'))
+
+    def ruta_reset_riesgo(self):
+        try:
+            session = get_authenticated_session(self)
+            if not session:
+                raise Exception("No hay sesión activa")
+            
+            print(f"🔄 Riesgo reseteado para {session['email']}")
+            
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': True,
+                'message': 'Estadísticas de riesgo reseteadas'
+            }).encode('utf-8'))
+            
+        except Exception as e:
+            error_msg = str(e)
+            print(f"❌ ERROR reseteando riesgo: {error_msg}")
+            
+            self.send_response(500)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                'success': False,
+                'error': error_msg
+            }).encode('utf-8'))
+
+
+async def servir_eventos_async(peticion, writer):
+    """/eventos en modo asyncio: la conexión queda en el event loop y no ocupa un worker"""
+    # No pasa por medir_peticion: se cuenta aquí con las mismas etiquetas que en modo threads
+    inicio = time.perf_counter()
+    codigo = [0]
+    try:
+        await _servir_eventos_async(peticion, writer, codigo)
+    finally:
+        duracion_http.observar(time.perf_counter() - inicio, peticion.metodo, '/eventos')
+        peticiones_http.inc(peticion.metodo, '/eventos', codigo[0])
+
+async def _servir_eventos_async(peticion, writer, codigo):
+    """Atiende la conexión de /eventos; deja en codigo[0] el código de respuesta enviado"""
+    token = parse_qs(urlparse(peticion.path).query).get('token', [''])[0]
+    loop = asyncio.get_running_loop()
+    # Fuera del event loop: con BACKEND_SESIONES=sqlite lee la base y puede reconectar a IQ Option
+    session = await loop.run_in_executor(None, SessionManager.get_session, token) if token else None
+    if not session:
+        codigo[0] = 401
+        writer.write(respuesta_simple(401, {'Content-type': 'application/json', 'Access-Control-Allow-Origin': '*',
+                                            'Connection': 'close'},
+                                      json.dumps({'success': False, 'error': 'No autorizado'}).encode('utf-8')))
+        await writer.drain()
+        return
+
+    hay_eventos = asyncio.Event()
+    suscriptor = bus_eventos.suscribir(session['email'])
+    suscriptor.al_entregar = lambda: loop.call_soon_threadsafe(hay_eventos.set)
+    try:
+        codigo[0] = 200
+        writer.write(cabeceras_respuesta(200, {'Content-type': 'text/event-stream', 'Cache-Control': 'no-cache',
+                                               'X-Accel-Buffering': 'no', 'Access-Control-Allow-Origin': '*',
+                                               'Connection': 'close'}))
+        # Estado actual apenas se conecta
+        estado = await loop.run_in_executor(None, estado_bot_servidor_actual)
+        writer.write(formato_sse({'tipo': 'estado_bot', 'datos': estado, 'timestamp': time.time()}))
+        await writer.drain()
+        while True:
+            try:
+                await asyncio.wait_for(hay_eventos.wait(), timeout=INTERVALO_PING)
+            except asyncio.TimeoutError:
+                if not await loop.run_in_executor(None, SessionManager.get_session, token):
+                    break
+                writer.write(b': ping\n\n')
+            hay_eventos.clear()
+            evento = suscriptor.siguiente(timeout=0)
+            while evento is not None:
+                writer.write(formato_sse(evento))
+                evento = suscriptor.siguiente(timeout=0)
+            await writer.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        suscriptor.al_entregar = None
+        bus_eventos.cancelar(suscriptor)
 
 class ThreadedHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
     daemon_threads = True
 
 def cleanup_sessions_periodically():
-    """Ejecutar limpieza de sesiones cada hora"""
+    """Ejecutar limpieza de sesiones cada minuto (solo revisa las que vencieron)"""
     while True:
-        time.sleep(3600)  # 1 hora
+        time.sleep(60)
         SessionManager.cleanup_expired_sessions()
 
 def run_server(port=PORT):
@@ -926,13 +1306,18 @@ def run_server(port=PORT):
     server_address = ('', port)
     
     try:
-        httpd = ThreadedHTTPServer(server_address, MyHttpRequestHandler)
+        if SERVIDOR_HTTP == 'asyncio':
+            httpd = ServidorAsync(server_address, MyHttpRequestHandler,
+                                  rutas_async={'/eventos': servir_eventos_async})
+        else:
+            httpd = ThreadedHTTPServer(server_address, MyHttpRequestHandler)
         
         print("\n" + "="*70)
         print(f"🚀 SERVIDOR HTTP INICIADO")
         print("="*70)
         print(f"🌐 URL: http://localhost:{port}")
         print(f"📂 Directorio: {CWD}")
+        print(f"🧵 Modo HTTP: {SERVIDOR_HTTP}")
         print(f"🔐 Sistema de sesiones activado")
         print(f"🤖 BOT 24/7 ACTIVADO - INDEPENDIENTE DEL CLIENTE")
         print(f"💰 Balances REALES activados")
@@ -959,8 +1344,8 @@ def run_server(port=PORT):
                 bot_servidor_thread.join(timeout=10)
         
         # Limpiar todas las sesiones
-        active_sessions.clear()
-        session_tokens.clear()
+        almacen_sesiones.cerrar_todas()
+        gestor_conexiones.cerrar_todas()
         httpd.server_close()
     except Exception as e:
         print(f"\n❌ ERROR INESPERADO: {e}\n")
@@ -0,0 +1,275 @@
+import asyncio
+import io
+import os
+import http.client
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+# Threads que ejecutan los handlers (llamadas bloqueantes al broker, SQLite, modelo)
+MAX_WORKERS_HTTP = int(os.environ.get("MAX_WORKERS_HTTP", 16))
+# Peticiones esperando un worker antes de responder 503
+MAX_PETICIONES_EN_ESPERA = int(os.environ.get("MAX_PETICIONES_EN_ESPERA", 64))
+# Línea de petición + cabeceras
+MAX_BYTES_CABECERAS = 16 * 1024
+# Cuerpo de un POST (login, configuración del bot, lista de activos)
+MAX_BYTES_CUERPO = int(os.environ.get("MAX_BYTES_CUERPO", 1 << 20))
+# Segundos que una conexión keep-alive puede quedar ociosa
+TIMEOUT_KEEP_ALIVE = 15
+# Segundos para recibir el cuerpo completo una vez llegaron las cabeceras
+TIMEOUT_CUERPO = 30
+
+SIN_CUERPO = (204, 304)
+
+
+class ErrorPeticion(Exception):
+    """Petición inválida; se responde `codigo` y se cierra la conexión."""
+
+    def __init__(self, codigo: int, mensaje: str):
+        super().__init__(mensaje)
+        self.codigo = codigo
+        self.mensaje = mensaje
+
+
+class Peticion:
+    __slots__ = ("metodo", "path", "version", "linea", "cabeceras", "cuerpo")
+
+    def __init__(self, metodo: str, path: str, version: str, linea: str,
+                 cabeceras: http.client.HTTPMessage, cuerpo: bytes):
+        self.metodo = metodo
+        self.path = path
+        self.version = version
+        self.linea = linea
+        self.cabeceras = cabeceras
+        self.cuerpo = cuerpo
+
+    @property
+    def ruta(self) -> str:
+        return urlparse(self.path).path
+
+    @property
+    def mantener_viva(self) -> bool:
+        conexion = self.cabeceras.get('Connection', '').lower()
+        if self.version == 'HTTP/1.1':
+            return conexion != 'close'
+        return conexion == 'keep-alive'
+
+
+class _ConexionDiferida:
+    """
+    Sustituto de `handler.connection`: el sendfile de archivos grandes se
+    anota y lo hace el event loop después de escribir las cabeceras.
+    """
+
+    def __init__(self):
+        self.envio: Optional[Tuple[str, int, int]] = None
+
+    def sendfile(self, archivo, offset: int = 0, count: Optional[int] = None):
+        if count is None:
+            count = os.fstat(archivo.fileno()).st_size - offset
+        self.envio = (archivo.name, offset, count)
+        return count
+
+
+def cabeceras_respuesta(codigo: int, cabeceras: Dict[str, str]) -> bytes:
+    """Línea de status y cabeceras serializadas (para respuestas en streaming)."""
+    lineas = [f"HTTP/1.1 {codigo} {http.client.responses.get(codigo, '')}"]
+    lineas += [f"{nombre}: {valor}" for nombre, valor in cabeceras.items()]
+    return ('\r\n'.join(lineas) + '\r\n\r\n').encode('latin-1')
+
+
+def respuesta_simple(codigo: int, cabeceras: Dict[str, str], cuerpo: bytes = b'') -> bytes:
+    """Respuesta completa (status, cabeceras y cuerpo) ya serializada."""
+    if codigo not in SIN_CUERPO and 'Content-Length' not in cabeceras:
+        cabeceras = dict(cabeceras, **{'Content-Length': str(len(cuerpo))})
+    return cabeceras_respuesta(codigo, cabeceras) + cuerpo
+
+
+class ServidorAsync:
+    """
+    Servidor HTTP/1.1 sobre asyncio para el mismo handler del modo con threads.
+
+    El event loop acepta conexiones, lee y valida cada petición (límites de
+    tamaño, keep-alive) y ejecuta el handler en un pool acotado de threads,
+    así una conexión ociosa no ocupa un thread. Las respuestas del handler se
+    escriben en memoria y el loop las envía; las rutas de `rutas_async`
+    (p. ej. el canal SSE) se atienden como corrutinas sin pasar por el pool.
+    Expone `serve_forever` y `server_close` como http.server.HTTPServer.
+    """
+
+    def __init__(self, server_address: Tuple[str, int], handler_class,
+                 rutas_async: Optional[Dict[str, Callable[[Peticion, asyncio.StreamWriter], Awaitable[None]]]] = None,
+                 max_workers: int = MAX_WORKERS_HTTP, max_en_espera: int = MAX_PETICIONES_EN_ESPERA):
+        self.server_address = server_address
+        self.handler_class = handler_class
+        self.rutas_async = rutas_async or {}
+        self.max_workers = max(1, max_workers)
+        self.max_en_espera = max_en_espera
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="http")
+        self._en_curso = 0
+        self._servidor: Optional[asyncio.AbstractServer] = None
+
+    def serve_forever(self):
+        """Bloquea atendiendo conexiones hasta Ctrl+C."""
+        asyncio.run(self._servir())
+
+    def server_close(self):
+        self._pool.shutdown(wait=False)
+
+    async def _servir(self):
+        host, port = self.server_address
+        self._servidor = await asyncio.start_server(self._atender, host=host or None, port=port,
+                                                    limit=MAX_BYTES_CABECERAS)
+        async with self._servidor:
+            await self._servidor.serve_forever()
+
+    async def _atender(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        cliente = writer.get_extra_info('peername') or ('', 0)
+        try:
+            while True:
+                try:
+                    peticion = await self._leer_peticion(reader)
+                except ErrorPeticion as e:
+                    writer.write(respuesta_simple(e.codigo, {'Content-Type': 'text/plain; charset=utf-8',
+                                                             'Connection': 'close'},
+                                                  e.mensaje.encode('utf-8')))
+                    await writer.drain()
+                    break
+                if peticion is None:
+                    break
+
+                manejador = self.rutas_async.get(peticion.ruta) if peticion.metodo == 'GET' else None
+                if manejador is not None:
+                    # Respuestas largas (streaming): la conexión termina con ellas
+                    await manejador(peticion, writer)
+                    break
+
+                if not await self._responder(peticion, cliente, writer):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            print(f"❌ Error en conexión {cliente}: {e}")
+            traceback.print_exc()
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _leer_peticion(self, reader: asyncio.StreamReader) -> Optional[Peticion]:
+        """Siguiente petición de la conexión, o None si el cliente la cerró o quedó ociosa."""
+        try:
+            bloque = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=TIMEOUT_KEEP_ALIVE)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+            return None
+        except (asyncio.LimitOverrunError, ValueError):
+            raise ErrorPeticion(431, "Request Header Fields Too Large")
+
+        linea, _, resto = bloque.partition(b'\r\n')
+        partes = linea.decode('latin-1').split()
+        if len(partes) != 3 or not partes[2].startswith('HTTP/'):
+            raise ErrorPeticion(400, "Bad Request")
+        metodo, path, version = partes
+        try:
+            cabeceras = http.client.parse_headers(io.BytesIO(resto))
+        except http.client.HTTPException:
+            raise ErrorPeticion(431, "Request Header Fields Too Large")
+
+        if 'chunked' in cabeceras.get('Transfer-Encoding', '').lower():
+            raise ErrorPeticion(411, "Length Required")
+        try:
+            largo = int(cabeceras.get('Content-Length', 0))
+        except ValueError:
+            raise ErrorPeticion(400, "Bad Content-Length")
+        if largo < 0:
+            raise ErrorPeticion(400, "Bad Content-Length")
+        if largo > MAX_BYTES_CUERPO:
+            raise ErrorPeticion(413, "Payload Too Large")
+
+        cuerpo = b''
+        if largo:
+            try:
+                cuerpo = await asyncio.wait_for(reader.readexactly(largo), timeout=TIMEOUT_CUERPO)
+            except asyncio.TimeoutError:
+                raise ErrorPeticion(408, "Request Timeout")
+        return Peticion(metodo, path, version, linea.decode('latin-1'), cabeceras, cuerpo)
+
+    async def _responder(self, peticion: Peticion, cliente, writer: asyncio.StreamWriter) -> bool:
+        """Ejecuta el handler en el pool y envía su respuesta; retorna si la conexión sigue viva."""
+        if self._en_curso >= self.max_workers + self.max_en_espera:
+            writer.write(respuesta_simple(503, {'Content-Type': 'application/json', 'Retry-After': '2',
+                                                'Access-Control-Allow-Origin': '*'},
+                                          b'{"success": false, "error": "Servidor ocupado, intente m\\u00e1s tarde"}'))
+            await writer.drain()
+            return peticion.mantener_viva
+
+        self._en_curso += 1
+        try:
+            loop = asyncio.get_running_loop()
+            crudo, envio, cerrar = await loop.run_in_executor(self._pool, self._ejecutar_handler,
+                                                              peticion, cliente)
+        finally:
+            self._en_curso -= 1
+
+        cerrar = cerrar or not peticion.mantener_viva
+        writer.write(self._completar_respuesta(crudo, envio, cerrar))
+        await writer.drain()
+        if envio is not None:
+            ruta, offset, cantidad = envio
+            with open(ruta, 'rb') as archivo:
+                await loop.sendfile(writer.transport, archivo, offset, cantidad)
+        return not cerrar
+
+    def _ejecutar_handler(self, peticion: Peticion, cliente) -> Tuple[bytes, Optional[Tuple[str, int, int]], bool]:
+        """Corre el handler del modo con threads sobre buffers en memoria."""
+        handler = self.handler_class.__new__(self.handler_class)
+        handler.server = self
+        handler.client_address = cliente
+        handler.connection = _ConexionDiferida()
+        handler.rfile = io.BytesIO(peticion.cuerpo)
+        handler.wfile = io.BytesIO()
+        handler.protocol_version = 'HTTP/1.1'
+        handler.raw_requestline = peticion.linea.encode('latin-1') + b'\r\n'
+        handler.requestline = peticion.linea
+        handler.command = peticion.metodo
+        handler.path = peticion.path
+        handler.request_version = peticion.version
+        handler.headers = peticion.cabeceras
+        handler.close_connection = not peticion.mantener_viva
+
+        metodo = getattr(handler, 'do_' + peticion.metodo, None)
+        try:
+            if metodo is None:
+                handler.send_error(501, f"Unsupported method ({peticion.metodo!r})")
+            else:
+                metodo()
+        except Exception as e:
+            print(f"❌ Error en {peticion.metodo} {peticion.path}: {e}")
+            traceback.print_exc()
+            if not handler.wfile.getvalue():
+                handler.send_error(500, 'Server Error')
+            else:
+                handler.close_connection = True
+        return handler.wfile.getvalue(), handler.connection.envio, handler.close_connection
+
+    @staticmethod
+    def _completar_respuesta(crudo: bytes, envio: Optional[Tuple[str, int, int]], cerrar: bool) -> bytes:
+        """Agrega Content-Length (los handlers JSON no lo envían) y el header Connection."""
+        cabecera, separador, cuerpo = crudo.partition(b'\r\n\r\n')
+        if not separador:
+            return respuesta_simple(500, {'Connection': 'close'})
+        lineas: List[bytes] = cabecera.split(b'\r\n')
+        nombres = {linea.split(b':', 1)[0].strip().lower() for linea in lineas[1:]}
+        try:
+            codigo = int(lineas[0].split()[1])
+        except (IndexError, ValueError):
+            codigo = 500
+
+        if b'content-length' not in nombres and codigo not in SIN_CUERPO and envio is None:
+            lineas.append(b'Content-Length: %d' % len(cuerpo))
+        if b'connection' not in nombres:
+            lineas.append(b'Connection: close' if cerrar else b'Connection: keep-alive')
+        return b'\r\n'.join(lineas) + b'\r\n\r\n' + cuerpo
@@ -0,0 +1,274 @@
+import os
+import time
+import uuid
+import heapq
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import database
+from conexion import gestor_conexiones
+
+# Segundos sin actividad antes de que una sesión expire
+SESSION_TIMEOUT = 24 * 3600
+# "memoria": sesiones del proceso | "sqlite": compartidas por los procesos que usan DB_FILE
+BACKEND_SESIONES = os.environ.get("BACKEND_SESIONES", "memoria")
+# Con un backend compartido la última actividad se escribe como mucho cada tantos segundos
+INTERVALO_ACTIVIDAD = 60
+
+
+class BackendSesionesMemoria:
+    """Registro de sesiones (token -> email y tiempos) dentro del proceso."""
+
+    nombre = "memoria"
+    compartido = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._registros: Dict[str, Dict[str, Any]] = {}
+
+    def guardar(self, token: str, email: str, creada: float, actividad: float):
+        with self._lock:
+            self._registros[token] = {'email': email, 'created_at': creada, 'last_activity': actividad}
+
+    def obtener(self, token: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            registro = self._registros.get(token)
+            return dict(registro) if registro else None
+
+    def tocar(self, token: str, actividad: float):
+        with self._lock:
+            if token in self._registros:
+                self._registros[token]['last_activity'] = actividad
+
+    def eliminar(self, token: str):
+        with self._lock:
+            self._registros.pop(token, None)
+
+    def eliminar_email(self, email: str) -> List[str]:
+        with self._lock:
+            tokens = [t for t, r in self._registros.items() if r['email'] == email]
+            for token in tokens:
+                del self._registros[token]
+            return tokens
+
+    def purgar(self, limite: float):
+        with self._lock:
+            for token in [t for t, r in self._registros.items() if r['last_activity'] < limite]:
+                del self._registros[token]
+
+
+class BackendSesionesSQLite:
+    """
+    Registro de sesiones en la tabla `sesiones` de DB_FILE.
+
+    Varios procesos del servidor que comparten la base ven los mismos
+    tokens; la conexión a IQ Option sigue siendo de cada proceso.
+    """
+
+    nombre = "sqlite"
+    compartido = True
+
+    def __init__(self):
+        conn = database._conexion()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sesiones (
+                    token TEXT PRIMARY KEY,
+                    email TEXT NOT NULL,
+                    creada REAL NOT NULL,
+                    actividad REAL NOT NULL
+                )''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_sesiones_email ON sesiones (email)')
+
+    def guardar(self, token: str, email: str, creada: float, actividad: float):
+        conn = database._conexion()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO sesiones (token, email, creada, actividad) VALUES (?, ?, ?, ?)',
+                         (token, email, creada, actividad))
+
+    def obtener(self, token: str) -> Optional[Dict[str, Any]]:
+        fila = database._conexion().execute(
+            'SELECT email, creada, actividad FROM sesiones WHERE token = ?', (token,)).fetchone()
+        if fila is None:
+            return None
+        return {'email': fila[0], 'created_at': fila[1], 'last_activity': fila[2]}
+
+    def tocar(self, token: str, actividad: float):
+        conn = database._conexion()
+        with conn:
+            conn.execute('UPDATE sesiones SET actividad = MAX(actividad, ?) WHERE token = ?', (actividad, token))
+
+    def eliminar(self, token: str):
+        conn = database._conexion()
+        with conn:
+            conn.execute('DELETE FROM sesiones WHERE token = ?', (token,))
+
+    def eliminar_email(self, email: str) -> List[str]:
+        conn = database._conexion()
+        with conn:
+            tokens = [f[0] for f in conn.execute('SELECT token FROM sesiones WHERE email = ?', (email,))]
+            conn.execute('DELETE FROM sesiones WHERE email = ?', (email,))
+        return tokens
+
+    def purgar(self, limite: float):
+        conn = database._conexion()
+        with conn:
+            conn.execute('DELETE FROM sesiones WHERE actividad < ?', (limite,))
+
+
+class AlmacenSesiones:
+    """
+    Sesiones HTTP del servidor, seguras entre threads.
+
+    Cada sesión local guarda su conexión de IQ Option (obtenida de
+    gestor_conexiones) y el registro persistente va al backend. Los
+    vencimientos se llevan en un heap ordenado por hora de expiración:
+    `expirar` solo mira las sesiones que ya deberían haber vencido, y una
+    sesión que tuvo actividad se vuelve a encolar con su nuevo vencimiento.
+    """
+
+    def __init__(self, backend=None, timeout: float = SESSION_TIMEOUT):
+        self.backend = backend or BackendSesionesMemoria()
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        self._sesiones: Dict[str, Dict[str, Any]] = {}
+        self._por_email: Dict[str, str] = {}
+        self._vencimientos: List[Tuple[float, str]] = []
+        self._escrita: Dict[str, float] = {}
+
+    def crear(self, email: str, iq) -> str:
+        token = str(uuid.uuid4())
+        ahora = time.time()
+        self.backend.guardar(token, email, ahora, ahora)
+        self._agregar(token, email, iq, ahora, ahora)
+        return token
+
+    def _agregar(self, token: str, email: str, iq, creada: float, actividad: float):
+        with self._lock:
+            self._sesiones[token] = {
+                'email': email,
+                'iq': iq,
+                'created_at': creada,
+                'last_activity': actividad,
+                'gestor_riesgo': None
+            }
+            self._por_email[email] = token
+            self._escrita[token] = actividad
+            heapq.heappush(self._vencimientos, (actividad + self.timeout, token))
+
+    def obtener(self, token: str) -> Optional[Dict[str, Any]]:
+        """Sesión vigente del token (actualiza su actividad), o None."""
+        ahora = time.time()
+        with self._lock:
+            session = self._sesiones.get(token)
+
+        if session is None:
+            return self._adoptar(token, ahora) if self.backend.compartido else None
+
+        if self.backend.compartido and self.backend.obtener(token) is None:
+            # Cerrada desde otro proceso (logout o force_logout)
+            self._quitar_local(token)
+            return None
+        if ahora - session['last_activity'] > self.timeout:
+            self.eliminar(token)
+            return None
+
+        session['last_activity'] = ahora
+        if self.backend.compartido and ahora - self._escrita.get(token, 0) >= INTERVALO_ACTIVIDAD:
+            self._escrita[token] = ahora
+            self.backend.tocar(token, ahora)
+        return session
+
+    def _adoptar(self, token: str, ahora: float) -> Optional[Dict[str, Any]]:
+        """Sesión creada por otro proceso: se atiende si este ya tiene conexión a esa cuenta."""
+        registro = self.backend.obtener(token)
+        if registro is None or ahora - registro['last_activity'] > self.timeout:
+            return None
+        iq = gestor_conexiones.adquirir_existente(registro['email'])
+        if iq is None:
+            return None
+        with self._lock:
+            if token in self._sesiones:
+                gestor_conexiones.liberar(iq)
+                return self._sesiones[token]
+            self._agregar(token, registro['email'], iq, registro['created_at'], ahora)
+            return self._sesiones[token]
+
+    def token_de(self, email: str) -> Optional[str]:
+        with self._lock:
+            return self._por_email.get(email)
+
+    def _quitar_local(self, token: str) -> bool:
+        with self._lock:
+            session = self._sesiones.pop(token, None)
+            self._escrita.pop(token, None)
+            if session is None:
+                return False
+            if self._por_email.get(session['email']) == token:
+                del self._por_email[session['email']]
+            # Las entradas de sesiones cerradas se descartan al vencer; si se acumulan, se rehace el heap
+            if len(self._vencimientos) > 2 * len(self._sesiones) + 64:
+                self._vencimientos = [(s['last_activity'] + self.timeout, t) for t, s in self._sesiones.items()]
+                heapq.heapify(self._vencimientos)
+        # La conexión se cierra cuando nadie más (otra sesión o el bot) la usa
+        gestor_conexiones.liberar(session['iq'])
+        return True
+
+    def eliminar(self, token: str):
+        self.backend.eliminar(token)
+        self._quitar_local(token)
+
+    def eliminar_email(self, email: str):
+        """Cierra las sesiones de la cuenta en todos los procesos."""
+        tokens = set(self.backend.eliminar_email(email))
+        token = self.token_de(email)
+        if token:
+            tokens.add(token)
+        for token in tokens:
+            self._quitar_local(token)
+
+    def expirar(self) -> int:
+        """Elimina las sesiones vencidas; O(log n) por sesión revisada."""
+        ahora = time.time()
+        vencidas = []
+        with self._lock:
+            while self._vencimientos and self._vencimientos[0][0] <= ahora:
+                _, token = heapq.heappop(self._vencimientos)
+                session = self._sesiones.get(token)
+                if session is None:
+                    continue
+                vence = session['last_activity'] + self.timeout
+                if vence > ahora:
+                    heapq.heappush(self._vencimientos, (vence, token))
+                else:
+                    vencidas.append(token)
+        for token in vencidas:
+            self.eliminar(token)
+        if self.backend.compartido:
+            # Sesiones de procesos que ya no están
+            self.backend.purgar(ahora - self.timeout - INTERVALO_ACTIVIDAD)
+        return len(vencidas)
+
+    def cerrar_todas(self):
+        with self._lock:
+            tokens = list(self._sesiones)
+        for token in tokens:
+            self._quitar_local(token)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'sesiones': len(self._sesiones),
+                'cuentas': len(self._por_email),
+                'vencimientos_en_heap': len(self._vencimientos),
+                'backend': self.backend.nombre
+            }
+
+
+def _crear_backend():
+    if BACKEND_SESIONES == 'sqlite':
+        return BackendSesionesSQLite()
+    return BackendSesionesMemoria()
+
+
+# Instancia única compartida por el proceso
+almacen_sesiones = AlmacenSesiones(_crear_backend())
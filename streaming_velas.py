@@ -0,0 +1,166 @@
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from almacen_velas import almacen_velas, CAMPOS_VELA
+from features_incrementales import registro_estados
+from bitacora import obtener_logger
+
+log = obtener_logger("streaming")
+
+# Velas que mantiene iqoptionapi en memoria por suscripción
+MAX_VELAS_STREAM = 150
+# Cada cuánto se revisa el buffer del websocket (solo lectura en memoria)
+INTERVALO_REVISION = 0.1
+
+
+class SuscripcionVelas:
+    """
+    Suscripción en vivo a las velas de un activo.
+
+    iqoptionapi actualiza `get_realtime_candles` desde el websocket; un thread
+    liviano revisa ese buffer en memoria y, cuando aparece una vela nueva,
+    da por cerrada la anterior: la guarda en el almacén de velas, la
+    incorpora al estado incremental de features y avisa a los callbacks y a
+    quien esté esperando en `esperar_cierre`.
+    """
+
+    def __init__(self, iq, activo: str, timeframe: int, max_velas: int = MAX_VELAS_STREAM):
+        self.iq = iq
+        self.activo = activo
+        self.timeframe = int(timeframe)
+        self.max_velas = max_velas
+        self.ultima_cerrada: Optional[Dict[str, Any]] = None
+        self.cierres = 0
+        self._callbacks: List[Callable[[Dict[str, Any]], None]] = []
+        self._condicion = threading.Condition()
+        self._detener = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._ts_en_curso = None
+
+    @property
+    def activa(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def iniciar(self):
+        if self.activa:
+            return
+        self.iq.start_candles_stream(self.activo, self.timeframe, self.max_velas)
+        self._detener.clear()
+        self._thread = threading.Thread(target=self._vigilar, daemon=True,
+                                        name=f"stream-{self.activo}-{self.timeframe}")
+        self._thread.start()
+        log.info("Streaming de velas iniciado: %s (%ss)", self.activo, self.timeframe)
+
+    def detener(self):
+        self._detener.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        try:
+            self.iq.stop_candles_stream(self.activo, self.timeframe)
+        except Exception as e:
+            log.warning("Error deteniendo streaming de %s: %s", self.activo, e)
+        with self._condicion:
+            self._condicion.notify_all()
+
+    def al_cerrar(self, callback: Callable[[Dict[str, Any]], None]):
+        """Registra un callback que recibe cada vela cerrada"""
+        self._callbacks.append(callback)
+
+    def _buffer(self) -> Dict[int, Dict[str, Any]]:
+        return self.iq.get_realtime_candles(self.activo, self.timeframe) or {}
+
+    def ultimas(self, cantidad: int) -> List[Dict[str, Any]]:
+        """Últimas `cantidad` velas del stream (la última es la vela en curso)."""
+        buffer = self._buffer()
+        claves = sorted(buffer)[-cantidad:]
+        return [{k: buffer[ts][k] for k in CAMPOS_VELA if k in buffer[ts]} for ts in claves]
+
+    def cubre(self, cantidad: int) -> bool:
+        """Indica si el stream tiene al menos `cantidad` velas en memoria"""
+        return self.activa and len(self._buffer()) >= cantidad
+
+    def esperar_cierre(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Bloquea hasta el próximo cierre de vela; retorna la vela o None si vence el timeout."""
+        with self._condicion:
+            cierres_previos = self.cierres
+            self._condicion.wait_for(lambda: self.cierres != cierres_previos or self._detener.is_set(),
+                                     timeout=timeout)
+            return self.ultima_cerrada if self.cierres != cierres_previos else None
+
+    def _vigilar(self):
+        while not self._detener.is_set():
+            try:
+                buffer = self._buffer()
+                if buffer:
+                    claves = sorted(buffer)
+                    ts_actual = claves[-1]
+                    if self._ts_en_curso is not None and ts_actual > self._ts_en_curso and len(claves) > 1:
+                        vela = {k: buffer[claves[-2]][k] for k in CAMPOS_VELA if k in buffer[claves[-2]]}
+                        self._registrar_cierre(vela)
+                    self._ts_en_curso = ts_actual
+            except Exception as e:
+                log.warning("Error en streaming de %s: %s", self.activo, e)
+            self._detener.wait(INTERVALO_REVISION)
+
+    def _registrar_cierre(self, vela: Dict[str, Any]):
+        ts = int(vela['from'])
+
+        # Almacén local y estado incremental (solo si continúa la serie)
+        almacen_velas.agregar_cerradas(self.activo, self.timeframe, [vela])
+        estado = registro_estados.obtener(self.activo, self.timeframe)
+        with estado.lock:
+            if estado.listo and estado.ultimo_ts == ts - self.timeframe:
+                estado.actualizar({'open': vela['open'], 'high': vela['max'],
+                                   'low': vela['min'], 'close': vela['close']}, ts=ts)
+
+        with self._condicion:
+            self.ultima_cerrada = vela
+            self.cierres += 1
+            self._condicion.notify_all()
+
+        for callback in list(self._callbacks):
+            try:
+                callback(vela)
+            except Exception as e:
+                log.warning("Error en callback de cierre de vela: %s", e)
+
+
+class GestorStreaming:
+    """Mantiene una única suscripción por (sesión, activo, timeframe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._suscripciones: Dict[Tuple[int, str, int], SuscripcionVelas] = {}
+
+    def suscribir(self, iq, activo: str, timeframe: int) -> SuscripcionVelas:
+        clave = (id(iq), activo, int(timeframe))
+        with self._lock:
+            suscripcion = self._suscripciones.get(clave)
+            if suscripcion is None or suscripcion.iq is not iq:
+                suscripcion = SuscripcionVelas(iq, activo, timeframe)
+                self._suscripciones[clave] = suscripcion
+        suscripcion.iniciar()
+        return suscripcion
+
+    def obtener_activa(self, iq, activo: str, timeframe: int) -> Optional[SuscripcionVelas]:
+        suscripcion = self._suscripciones.get((id(iq), activo, int(timeframe)))
+        if suscripcion is not None and suscripcion.iq is iq and suscripcion.activa:
+            return suscripcion
+        return None
+
+    def cancelar(self, iq, activo: str, timeframe: int):
+        with self._lock:
+            suscripcion = self._suscripciones.pop((id(iq), activo, int(timeframe)), None)
+        if suscripcion:
+            suscripcion.detener()
+
+    def cancelar_sesion(self, iq):
+        """Cancela todas las suscripciones de una sesión"""
+        with self._lock:
+            claves = [c for c, s in self._suscripciones.items() if s.iq is iq]
+            suscripciones = [self._suscripciones.pop(c) for c in claves]
+        for suscripcion in suscripciones:
+            suscripcion.detener()
+
+
+gestor_streaming = GestorStreaming()
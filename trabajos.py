@@ -0,0 +1,161 @@
+import os
+import sys
+import time
+import uuid
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# Workers que ejecutan análisis y compras (no esperan el cierre de la operación)
+MAX_WORKERS_TRABAJOS = int(os.environ.get("MAX_WORKERS_TRABAJOS", 4))
+# Trabajos en cola o ejecutándose antes de rechazar nuevos
+MAX_TRABAJOS_PENDIENTES = int(os.environ.get("MAX_TRABAJOS_PENDIENTES", 32))
+# Segundos que se conserva un trabajo terminado para consultar su resultado
+RETENCION_TRABAJOS = int(os.environ.get("RETENCION_TRABAJOS", 3600))
+
+EN_COLA = "en_cola"
+EJECUTANDO = "ejecutando"
+ESPERANDO_RESULTADO = "esperando_resultado"
+COMPLETADO = "completado"
+ERROR = "error"
+
+ESTADOS_ACTIVOS = (EN_COLA, EJECUTANDO)
+ESTADOS_FINALES = (COMPLETADO, ERROR)
+
+
+class ColaTrabajosLlena(Exception):
+    """Se alcanzó MAX_TRABAJOS_PENDIENTES."""
+
+
+class Trabajo:
+    __slots__ = ("id", "propietario", "estado", "creado", "actualizado", "resultado", "error")
+
+    def __init__(self, propietario: Optional[str]):
+        self.id = uuid.uuid4().hex
+        self.propietario = propietario
+        self.estado = EN_COLA
+        self.creado = time.time()
+        self.actualizado = self.creado
+        self.resultado: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+
+    def a_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.id,
+            'estado': self.estado,
+            'creado': self.creado,
+            'actualizado': self.actualizado,
+            'resultado': self.resultado,
+            'error': self.error
+        }
+
+
+class GestorTrabajos:
+    """
+    Trabajos en segundo plano con un pool acotado de workers.
+
+    `enviar` encola una función y retorna el id del trabajo de inmediato. Si
+    la función retorna un dict, el trabajo queda completado con ese
+    resultado; si llama a `esperar_resultado` queda en ESPERANDO_RESULTADO
+    sin ocupar un worker hasta que alguien llame a `completar` o `fallar`
+    (p. ej. el callback de liquidación de la operación).
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS_TRABAJOS,
+                 max_pendientes: int = MAX_TRABAJOS_PENDIENTES,
+                 retencion: int = RETENCION_TRABAJOS):
+        self.max_pendientes = max_pendientes
+        self.retencion = retencion
+        self._lock = threading.Lock()
+        self._trabajos: Dict[str, Trabajo] = {}
+        self._observadores = []
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="trabajos")
+
+    def enviar(self, funcion: Callable[..., Optional[Dict[str, Any]]], *args,
+               propietario: Optional[str] = None, **kwargs) -> str:
+        """Encola `funcion(trabajo_id, *args, **kwargs)` y retorna el id del trabajo."""
+        with self._lock:
+            self._purgar()
+            pendientes = sum(1 for t in self._trabajos.values() if t.estado in ESTADOS_ACTIVOS)
+            if pendientes >= self.max_pendientes:
+                raise ColaTrabajosLlena(f"Hay {pendientes} operaciones pendientes, intente más tarde")
+            trabajo = Trabajo(propietario)
+            self._trabajos[trabajo.id] = trabajo
+
+        self._pool.submit(self._ejecutar, trabajo, funcion, args, kwargs)
+        return trabajo.id
+
+    def enviar_tarea(self, funcion: Callable, *args, **kwargs):
+        """Ejecuta una tarea auxiliar de un trabajo en el mismo pool."""
+        return self._pool.submit(funcion, *args, **kwargs)
+
+    def _ejecutar(self, trabajo: Trabajo, funcion, args, kwargs):
+        self._cambiar(trabajo.id, EJECUTANDO)
+        try:
+            resultado = funcion(trabajo.id, *args, **kwargs)
+            if resultado is not None:
+                self.completar(trabajo.id, resultado)
+        except Exception as e:
+            print(f"❌ Error en trabajo {trabajo.id}: {e}", file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
+            self.fallar(trabajo.id, str(e))
+
+    def _cambiar(self, trabajo_id: str, estado: str, resultado: Optional[Dict[str, Any]] = None,
+                 error: Optional[str] = None):
+        with self._lock:
+            trabajo = self._trabajos.get(trabajo_id)
+            if trabajo is None or trabajo.estado in ESTADOS_FINALES:
+                return
+            trabajo.estado = estado
+            trabajo.actualizado = time.time()
+            if resultado is not None:
+                trabajo.resultado = resultado
+            if error is not None:
+                trabajo.error = error
+            vista, propietario = trabajo.a_dict(), trabajo.propietario
+
+        for observador in list(self._observadores):
+            try:
+                observador(vista, propietario)
+            except Exception as e:
+                print(f"⚠️ Error notificando trabajo {trabajo_id}: {e}", file=sys.stderr)
+
+    def al_cambiar(self, callback: Callable[[Dict[str, Any], Optional[str]], None]):
+        """Registra un callback que recibe (estado del trabajo, propietario) en cada cambio"""
+        self._observadores.append(callback)
+
+    def esperar_resultado(self, trabajo_id: str, parcial: Dict[str, Any]):
+        """Libera el worker; el trabajo se completa luego con `completar`."""
+        self._cambiar(trabajo_id, ESPERANDO_RESULTADO, resultado=parcial)
+
+    def completar(self, trabajo_id: str, resultado: Dict[str, Any]):
+        self._cambiar(trabajo_id, COMPLETADO, resultado=resultado)
+
+    def fallar(self, trabajo_id: str, error: str):
+        self._cambiar(trabajo_id, ERROR, error=error)
+
+    def obtener(self, trabajo_id: str, propietario: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Estado del trabajo, o None si no existe o pertenece a otro usuario."""
+        with self._lock:
+            trabajo = self._trabajos.get(trabajo_id)
+            if trabajo is None or (propietario is not None and trabajo.propietario != propietario):
+                return None
+            return trabajo.a_dict()
+
+    def _purgar(self):
+        limite = time.time() - self.retencion
+        for trabajo_id in [t.id for t in self._trabajos.values()
+                           if t.estado in ESTADOS_FINALES and t.actualizado < limite]:
+            del self._trabajos[trabajo_id]
+
+    def estadisticas(self) -> Dict[str, int]:
+        with self._lock:
+            conteo: Dict[str, int] = {}
+            for trabajo in self._trabajos.values():
+                conteo[trabajo.estado] = conteo.get(trabajo.estado, 0) + 1
+            return conteo
+
+
+# Instancia única compartida por el proceso
+gestor_trabajos = GestorTrabajos()